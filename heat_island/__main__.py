@@ -0,0 +1,10 @@
+"""
+Runs the `heat_island` command line interface: `python -m heat_island --help`
+"""
+
+import sys
+
+from heat_island.cli import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+building_index.py: spatial index of buildings for hexagon queries
+
+Selecting the buildings of a hexagon by testing every centroid of a city
+costs one predicate evaluation per building. This module builds a shapely
+STRtree over the building centroids once, so that each hexagon query only
+evaluates the exact predicate on the buildings whose centroid falls inside
+the bounding box of the hexagon.
+
+Classes:
+- `BuildingIndex`: STRtree-backed index of building centroids.
+
+Example Usage:
+>>> buildings = height_acquire(hexagon)
+>>> index = BuildingIndex(buildings)
+>>> stats = average_building_height_with_centroid(buildings, hexagon, index=index)
+"""
+
+import numpy as np
+import shapely
+
+from heat_island.building_store import building_arrays
+
+
+class BuildingIndex:
+    """
+    Reusable spatial index of the centroids of a set of buildings.
+
+    The index is built once over the centroids of the buildings (from the
+    precomputed centroid columns, the 'centroid' column or the geometries,
+    see `building_arrays`) and can then be queried with any number of
+    hexagons.
+
+    Parameters:
+    buildings (gpd.GeoDataFrame): Buildings with geometry and height
+        information.
+
+    Example:
+    >>> index = BuildingIndex(buildings)
+    >>> buildings_within_hex = index.select(hexagon)
+    """
+
+    def __init__(self, buildings):
+        centroid_x, centroid_y, _ = building_arrays(buildings)
+        self.buildings = buildings
+        self.centroids = shapely.points(centroid_x, centroid_y)
+        self.tree = shapely.STRtree(self.centroids)
+
+    def __len__(self):
+        return len(self.centroids)
+
+    def candidates(self, hexagon):
+        """
+        Return the positions of the buildings whose centroid is inside the
+        bounding box of a polygon.
+
+        Parameters:
+        hexagon (shapely.geometry.polygon.Polygon): Area of interest.
+
+        Returns:
+        np.ndarray: Sorted integer positions into the buildings.
+        """
+
+        return np.sort(self.tree.query(hexagon))
+
+    def query(self, hexagon):
+        """
+        Return the positions of the buildings whose centroid is within a
+        polygon.
+
+        The bounding boxes of the tree are used as a prefilter, and the
+        exact test is only run on the remaining candidates. It is the same
+        test as `buildings['centroid'].within(hexagon)`.
+
+        Parameters:
+        hexagon (shapely.geometry.polygon.Polygon): Area of interest.
+
+        Returns:
+        np.ndarray: Sorted integer positions into the buildings.
+        """
+
+        # 'contains' is evaluated as hexagon.contains(centroid), which is
+        # the same as centroid.within(hexagon)
+        return np.sort(self.tree.query(hexagon, predicate='contains'))
+
+    def select(self, hexagon):
+        """
+        Return the buildings whose centroid is within a polygon.
+
+        Parameters:
+        hexagon (shapely.geometry.polygon.Polygon): Area of interest.
+
+        Returns:
+        gpd.GeoDataFrame: Rows of the indexed buildings, in their original
+        order.
+        """
+
+        return self.buildings.iloc[self.query(hexagon)]
@@ -0,0 +1,357 @@
+"""
+building_memmap.py: memory-mapped building arrays for out-of-core cities
+
+The hexagon statistics only need four numbers per building: the centroid
+coordinates, the footprint area and the height. This module stores them as
+contiguous `.npy` arrays in a directory, sorted by the cell of a regular
+grid containing each centroid, next to an offset index giving the first
+building of every cell. The arrays are opened with `np.memmap`, and a
+bounding box query reads one contiguous slice per row of grid cells, so
+the memory used by the statistics depends on the size of a chunk of
+hexagons rather than on the size of the city.
+
+The arrays are written with a counting sort over batches of buildings, so
+a building store larger than memory can be converted without loading it.
+
+Classes:
+- `BuildingArrays`: Memory-mapped building arrays with a cell-offset index.
+
+Functions:
+- `write_building_arrays`: Writes buildings, from a building store or a
+    GeoDataFrame, to a directory of building arrays.
+- `hexagon_stats_arrays`: Calculates the `centroid_stat_*` table of many
+    hexagons against building arrays, one chunk of hexagons at a time.
+
+Example Usage:
+>>> write_building_arrays("data/seattle_building_footprints.parquet",
+...                       "data/seattle_building_arrays")
+>>> arrays = BuildingArrays("data/seattle_building_arrays")
+>>> stats = hexagon_stats_arrays(arrays, grid.geometry)
+"""
+
+import os
+import json
+import math
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+import pyarrow.parquet as pq
+import pyproj
+
+from heat_island.building_store import add_building_columns, has_building_columns
+from heat_island.geo_process import equal_area_areas
+from heat_island.height_acquire import hexagon_stats_from_points, hexagon_stats_from_groups
+
+
+# Arrays stored for each building, and their types
+ARRAY_DTYPES = {
+    'centroid_x': np.float64,
+    'centroid_y': np.float64,
+    'footprint_area': np.float64,
+    'footprint_area_m2': np.float64,
+    'height': np.float32,
+}
+# Default size of the cells of the offset index, in degrees
+DEFAULT_CELL_SIZE = 0.01
+# Default number of buildings read at a time while writing the arrays
+DEFAULT_BATCH_SIZE = 65536
+# Default number of hexagons processed at a time
+DEFAULT_CHUNK_SIZE = 2048
+# Name of the file describing the arrays
+META_FILE = 'meta.json'
+
+
+def _parquet_crs(path):
+    """
+    Return the CRS of the geometry of a GeoParquet file as a string.
+    """
+
+    metadata = pq.read_schema(path).metadata or {}
+    geo = json.loads(metadata.get(b'geo', b'{}'))
+    column = geo.get('columns', {}).get(geo.get('primary_column', 'geometry'), {})
+    # GeoParquet defaults to longitude/latitude when no CRS is given
+    crs = column.get('crs', 'OGC:CRS84')
+    return None if crs is None else pyproj.CRS.from_user_input(crs).to_string()
+
+
+def _batches(source, batch_size):
+    """
+    Yield the building arrays of a building store or a GeoDataFrame with
+    the `BUILDING_COLUMNS`, in batches of at most `batch_size` buildings.
+    """
+
+    if isinstance(source, gpd.GeoDataFrame):
+        for start in range(0, len(source), batch_size):
+            batch = source.iloc[start:start + batch_size]
+            yield {name: batch[name].to_numpy(dtype=dtype)
+                   for name, dtype in ARRAY_DTYPES.items()}
+    else:
+        parquet = pq.ParquetFile(source)
+        for batch in parquet.iter_batches(batch_size=batch_size, columns=list(ARRAY_DTYPES)):
+            yield {name: batch.column(name).to_numpy(zero_copy_only=False).astype(dtype)
+                   for name, dtype in ARRAY_DTYPES.items()}
+
+
+def write_building_arrays(source, path, cell_size=DEFAULT_CELL_SIZE,
+                          batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Write the arrays of buildings to a directory, sorted by grid cell.
+
+    The source is read three times in batches: once for the bounds of the
+    centroids, once to count the buildings of every grid cell, and once
+    to copy every building to its place in memory-mapped output arrays.
+    Only one batch and the counts of the cells are held in memory.
+
+    Parameters:
+    source (str or gpd.GeoDataFrame): Path of a `.parquet` building store
+        written by `write_building_store`, or buildings with geometry and
+        height information.
+    path (str): Output directory. It is created if needed.
+    cell_size (float, optional): Size of the cells of the offset index, in
+        the units of the CRS of the buildings.
+    batch_size (int, optional): Number of buildings read at a time.
+
+    Returns:
+    str: Path of the directory.
+
+    Raises:
+    ValueError: If `source` is a path but not a `.parquet` file.
+    ValueError: If `cell_size` or `batch_size` is not positive.
+    """
+
+    if not isinstance(source, gpd.GeoDataFrame) and not str(source).endswith('.parquet'):
+        raise ValueError("Incorrect file format: Expect '.parquet'")
+    if cell_size <= 0 or batch_size < 1:
+        raise ValueError("cell_size and batch_size must be positive.")
+    if isinstance(source, gpd.GeoDataFrame):
+        crs = None if source.crs is None else source.crs.to_string()
+        if not has_building_columns(source):
+            source = add_building_columns(source.copy())
+    else:
+        crs = _parquet_crs(source)
+
+    # Pass 1: bounds of the centroids, and origin of the grid
+    count = 0
+    minx = miny = math.inf
+    maxx = maxy = -math.inf
+    for batch in _batches(source, batch_size):
+        if len(batch['centroid_x']):
+            count += len(batch['centroid_x'])
+            minx = min(minx, batch['centroid_x'].min())
+            maxx = max(maxx, batch['centroid_x'].max())
+            miny = min(miny, batch['centroid_y'].min())
+            maxy = max(maxy, batch['centroid_y'].max())
+    if count:
+        origin_x = math.floor(minx / cell_size) * cell_size
+        origin_y = math.floor(miny / cell_size) * cell_size
+        n_columns = int((maxx - origin_x) // cell_size) + 1
+        n_rows = int((maxy - origin_y) // cell_size) + 1
+    else:
+        origin_x = origin_y = 0.0
+        n_columns = n_rows = 0
+    meta = {'count': count, 'cell_size': cell_size, 'origin_x': origin_x,
+            'origin_y': origin_y, 'n_columns': n_columns, 'n_rows': n_rows, 'crs': crs}
+
+    def cell_keys(batch):
+        return _cell_keys(batch['centroid_x'], batch['centroid_y'], meta)
+
+    # Pass 2: number of buildings of each cell, and offset of each cell
+    counts = np.zeros(n_columns * n_rows, dtype=np.int64)
+    for batch in _batches(source, batch_size):
+        counts += np.bincount(cell_keys(batch), minlength=len(counts))
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    # Pass 3: copy every building after the ones already placed in its cell
+    os.makedirs(path, exist_ok=True)
+    outputs = {name: np.lib.format.open_memmap(os.path.join(path, name + '.npy'), mode='w+',
+                                               dtype=dtype, shape=(count,))
+               for name, dtype in ARRAY_DTYPES.items()}
+    cursor = offsets[:-1].copy()
+    for batch in _batches(source, batch_size):
+        keys = cell_keys(batch)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        # Rank of each building among the buildings of its cell in the batch
+        first = np.searchsorted(sorted_keys, sorted_keys, side='left')
+        positions = cursor[sorted_keys] + np.arange(len(keys)) - first
+        for name, output in outputs.items():
+            output[positions] = batch[name][order]
+        cursor += np.bincount(keys, minlength=len(cursor))
+    for output in outputs.values():
+        output.flush()
+    del outputs
+
+    np.save(os.path.join(path, 'cell_offsets.npy'), offsets)
+    # The description is written last, once the arrays are complete
+    with open(os.path.join(path, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    return path
+
+
+def _cell_keys(x, y, meta):
+    """
+    Return the row-major key of the grid cell of each point.
+    """
+
+    columns = np.clip(((x - meta['origin_x']) // meta['cell_size']).astype(np.int64),
+                      0, meta['n_columns'] - 1)
+    rows = np.clip(((y - meta['origin_y']) // meta['cell_size']).astype(np.int64),
+                   0, meta['n_rows'] - 1)
+    return rows * meta['n_columns'] + columns
+
+
+class BuildingArrays:
+    """
+    Memory-mapped arrays of buildings written by `write_building_arrays`.
+
+    Each of `ARRAY_DTYPES` is available as an attribute, such as
+    `arrays.height`, backed by a read-only `np.memmap`. The buildings are
+    sorted by grid cell, in row-major order of the cells, and
+    `cell_offsets[k]` is the position of the first building of cell `k`.
+
+    Parameters:
+    path (str): Directory written by `write_building_arrays`.
+
+    Raises:
+    ValueError: If `path` does not contain building arrays.
+
+    Example:
+    >>> arrays = BuildingArrays("data/seattle_building_arrays")
+    >>> nearby = arrays.select(hexagon.bounds)
+    """
+
+    def __init__(self, path):
+        meta_path = os.path.join(path, META_FILE)
+        if not os.path.isfile(meta_path):
+            raise ValueError("Input path does not contain building arrays")
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.path = path
+        self.crs = self.meta['crs']
+        for name in ARRAY_DTYPES:
+            setattr(self, name, np.load(os.path.join(path, name + '.npy'), mmap_mode='r'))
+        self.cell_offsets = np.load(os.path.join(path, 'cell_offsets.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return self.meta['count']
+
+    def ranges(self, bbox):
+        """
+        Return the slices of the arrays covering the grid cells that
+        overlap a bounding box, one slice per row of cells.
+
+        Parameters:
+        bbox (tuple): Bounding box (minx, miny, maxx, maxy).
+
+        Returns:
+        list: (start, stop) positions of contiguous runs of buildings.
+        """
+
+        meta = self.meta
+        if not meta['count']:
+            return []
+        minx, miny, maxx, maxy = bbox
+        # Same cell arithmetic as `_cell_keys`
+        cell_size = meta['cell_size']
+        column_min = max(0, int((minx - meta['origin_x']) // cell_size))
+        column_max = min(meta['n_columns'] - 1, int((maxx - meta['origin_x']) // cell_size))
+        row_min = max(0, int((miny - meta['origin_y']) // cell_size))
+        row_max = min(meta['n_rows'] - 1, int((maxy - meta['origin_y']) // cell_size))
+        ranges = []
+        for row in range(row_min, row_max + 1):
+            first = row * meta['n_columns'] + column_min
+            last = row * meta['n_columns'] + column_max
+            if first <= last and self.cell_offsets[first] < self.cell_offsets[last + 1]:
+                ranges.append((int(self.cell_offsets[first]), int(self.cell_offsets[last + 1])))
+        return ranges
+
+    def select(self, bbox, columns=None):
+        """
+        Return the arrays of the buildings whose centroid is inside a
+        bounding box. Only the cells overlapping the box are read.
+
+        Parameters:
+        bbox (tuple): Bounding box (minx, miny, maxx, maxy).
+        columns (list, optional): Arrays to return. Defaults to all of
+            `ARRAY_DTYPES`.
+
+        Returns:
+        dict: In-memory NumPy arrays of the selected buildings.
+        """
+
+        if columns is None:
+            columns = list(ARRAY_DTYPES)
+        ranges = self.ranges(bbox)
+        selected = {name: np.concatenate([getattr(self, name)[start:stop]
+                                          for start, stop in ranges])
+                    if ranges else np.empty(0, dtype=ARRAY_DTYPES[name])
+                    for name in set(columns) | {'centroid_x', 'centroid_y'}}
+        minx, miny, maxx, maxy = bbox
+        inside = ((selected['centroid_x'] >= minx) & (selected['centroid_x'] <= maxx)
+                  & (selected['centroid_y'] >= miny) & (selected['centroid_y'] <= maxy))
+        return {name: selected[name][inside] for name in columns}
+
+
+def hexagon_stats_arrays(arrays, hexagons, chunk_size=DEFAULT_CHUNK_SIZE, projected=False):
+    """
+    Calculate statistical measures of building heights for many hexagons
+    against memory-mapped building arrays.
+
+    The result is the same table as `hexagon_stats_batch`. The hexagons
+    are sorted along a Hilbert curve and processed in chunks of
+    `chunk_size`; only the buildings in the bounding box of a chunk are
+    read, so the memory used does not grow with the size of the city.
+
+    Parameters:
+    arrays (BuildingArrays or str): Building arrays, or their directory.
+    hexagons (gpd.GeoSeries, gpd.GeoDataFrame or list): Hexagon polygons
+        representing the areas of interest, in the CRS of the buildings.
+    chunk_size (int, optional): Number of hexagons processed at a time.
+    projected (bool, optional): Compute the areas in square meters, as in
+        `hexagon_stats_batch`. Defaults to False.
+
+    Returns:
+    pd.DataFrame: One row per hexagon, in the order of `hexagons`, with
+    the `centroid_stat_*` columns.
+
+    Raises:
+    ValueError: If `chunk_size` is not positive.
+
+    Example:
+    >>> stats = hexagon_stats_arrays("data/seattle_building_arrays", grid.geometry)
+    """
+
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive.")
+    if not isinstance(arrays, BuildingArrays):
+        arrays = BuildingArrays(arrays)
+    if isinstance(hexagons, gpd.GeoDataFrame):
+        hexagons = hexagons.geometry
+    index = hexagons.index if isinstance(hexagons, pd.Series) else None
+    hexagons = gpd.GeoSeries(np.asarray(hexagons, dtype=object), crs=arrays.crs)
+    if projected:
+        hexagon_areas = equal_area_areas(hexagons.values, crs=arrays.crs or 4326)
+    else:
+        # Areas in the units of the CRS, as in the training data
+        hexagon_areas = shapely.area(np.asarray(hexagons.values))
+    area_column = 'footprint_area_m2' if projected else 'footprint_area'
+
+    columns = hexagon_stats_from_groups([], [], [], []).columns
+    values = np.full((len(hexagons), len(columns)), np.nan)
+    if not len(hexagons):
+        return pd.DataFrame(values, columns=columns, index=index)
+
+    # Process spatially coherent chunks of hexagons
+    centroids = gpd.GeoSeries(shapely.centroid(np.asarray(hexagons.values)))
+    order = np.argsort(centroids.hilbert_distance().to_numpy(), kind='stable')
+    geometries = hexagons.values
+    for i in range(0, len(order), chunk_size):
+        chunk = order[i:i + chunk_size]
+        chunk_hexagons = geometries[chunk]
+        buildings = arrays.select(tuple(chunk_hexagons.total_bounds),
+                                  columns=['centroid_x', 'centroid_y', 'height', area_column])
+        values[chunk] = hexagon_stats_from_points(
+            buildings['centroid_x'], buildings['centroid_y'], buildings['height'],
+            buildings[area_column], chunk_hexagons.to_numpy(), hexagon_areas[chunk]).to_numpy()
+    return pd.DataFrame(values, columns=columns, index=index)
@@ -0,0 +1,198 @@
+"""
+building_store.py: columnar GeoParquet store of city building footprints
+
+A city-wide GeoJSON of building footprints takes tens of seconds to parse,
+and every hexagon query only needs the few buildings around it. This
+module stores the buildings of a city as GeoParquet instead: the geometry
+is WKB-encoded, the height is float32, and the centroid coordinates and
+footprint area are precomputed columns. Rows are sorted along a Hilbert
+curve of the centroids before they are split into row groups, so each row
+group covers a compact area and a bounding box query only decodes the row
+groups whose centroid statistics overlap the box.
+
+Functions:
+- `add_building_columns`: Adds the centroid and area columns to buildings.
+- `has_building_columns`: Checks whether buildings have these columns.
+- `building_arrays`: Returns the centroid coordinates and areas of buildings
+    as NumPy arrays, from the columns when they are present.
+- `write_building_store`: Writes buildings to a spatially sorted GeoParquet file.
+- `read_building_store`: Reads buildings, optionally only those whose
+    centroid is inside a bounding box.
+
+Example Usage:
+>>> write_building_store(buildings, "data/seattle_building_footprints.parquet")
+>>> hexagon = create_hexagon(-122.34543, 47.65792)
+>>> nearby = read_building_store("data/seattle_building_footprints.parquet",
+...                              bbox=hexagon.bounds)
+"""
+
+import numpy as np
+import geopandas as gpd
+import shapely
+
+from heat_island.geo_process import equal_area_areas
+
+
+# Default number of buildings per row group of the store
+DEFAULT_ROW_GROUP_SIZE = 16384
+# Columns precomputed from the footprint of each building
+BUILDING_COLUMNS = ['centroid_x', 'centroid_y', 'footprint_area', 'footprint_area_m2']
+
+
+def add_building_columns(buildings):
+    """
+    Add the centroid coordinates and footprint area of each building.
+
+    'centroid_x', 'centroid_y' and 'footprint_area' are computed in the
+    CRS of the buildings, exactly as `get_centroid` and
+    `GeoDataFrame.area` compute them, so the statistics based on these
+    columns are identical to the ones the models were trained on.
+    'footprint_area_m2' is the area in square meters in a local
+    equal-area projection (see `equal_area_areas`).
+
+    Parameters:
+    buildings (gpd.GeoDataFrame): Buildings with geometry information.
+        Buildings without a CRS are assumed to be in EPSG:4326.
+
+    Returns:
+    gpd.GeoDataFrame: The same GeoDataFrame with the `BUILDING_COLUMNS`.
+    """
+
+    # Centroids and areas in the units of the CRS, as in the training data
+    geometry = np.asarray(buildings.geometry.values)
+    centroids = shapely.centroid(geometry)
+    buildings['centroid_x'] = shapely.get_x(centroids)
+    buildings['centroid_y'] = shapely.get_y(centroids)
+    buildings['footprint_area'] = shapely.area(geometry)
+    buildings['footprint_area_m2'] = equal_area_areas(geometry, crs=buildings.crs or 4326)
+    return buildings
+
+
+def has_building_columns(buildings):
+    """
+    Return whether buildings have all the precomputed `BUILDING_COLUMNS`.
+    """
+
+    return all(column in buildings.columns for column in BUILDING_COLUMNS)
+
+
+def building_arrays(buildings, projected=False):
+    """
+    Return the centroid coordinates and footprint areas of buildings.
+
+    The precomputed columns are used when they are present; otherwise the
+    values are computed from the 'centroid' column (or the geometries) and
+    the geometries, as `average_building_height_with_centroid` does.
+
+    Parameters:
+    buildings (gpd.GeoDataFrame): Buildings with geometry information.
+    projected (bool, optional): Return the footprint areas in square
+        meters ('footprint_area_m2') instead of in the units of the CRS of
+        the buildings. Defaults to False.
+
+    Returns:
+    tuple: NumPy arrays (centroid_x, centroid_y, footprint_area).
+    """
+
+    area_column = 'footprint_area_m2' if projected else 'footprint_area'
+    if has_building_columns(buildings):
+        return (buildings['centroid_x'].to_numpy(dtype=float),
+                buildings['centroid_y'].to_numpy(dtype=float),
+                buildings[area_column].to_numpy(dtype=float))
+    geometry = np.asarray(buildings.geometry.values)
+    if 'centroid' in buildings.columns:
+        centroids = np.asarray(gpd.GeoSeries(buildings['centroid']).values)
+    else:
+        centroids = shapely.centroid(geometry)
+    if projected:
+        areas = equal_area_areas(geometry, crs=buildings.crs or 4326)
+    else:
+        areas = shapely.area(geometry)
+    return shapely.get_x(centroids), shapely.get_y(centroids), areas
+
+
+def write_building_store(buildings, path, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """
+    Write buildings to a spatially sorted GeoParquet file.
+
+    Parameters:
+    buildings (gpd.GeoDataFrame): Buildings with geometry and height
+        information. Missing centroid and area columns are computed.
+    path (str): Path of the output `.parquet` file.
+    row_group_size (int, optional): Number of buildings per row group.
+        Smaller row groups make bounding box reads more selective.
+
+    Returns:
+    str: Path of the written file.
+
+    Raises:
+    ValueError: If `path` is not a `.parquet` file.
+    KeyError: If the buildings have no 'height' column.
+    """
+
+    if not str(path).endswith('.parquet'):
+        raise ValueError("Incorrect file format: Expect '.parquet'")
+    if 'height' not in buildings.columns:
+        raise KeyError("Buildings must have a 'height' column")
+    buildings = buildings.copy()
+    if not has_building_columns(buildings):
+        buildings = add_building_columns(buildings)
+    # A 'centroid' geometry column cannot be stored next to the geometry
+    buildings = buildings.drop(columns=['centroid'], errors='ignore')
+    buildings['height'] = buildings['height'].astype(np.float32)
+
+    # Sort the buildings along a Hilbert curve of their centroids, so that
+    # each row group covers a compact area
+    if len(buildings):
+        centroids = gpd.GeoSeries(gpd.points_from_xy(buildings['centroid_x'],
+                                                     buildings['centroid_y']))
+        order = np.argsort(centroids.hilbert_distance().to_numpy(), kind='stable')
+        buildings = buildings.iloc[order]
+
+    buildings.reset_index(drop=True).to_parquet(path, row_group_size=row_group_size)
+    return path
+
+
+def read_building_store(path, bbox=None, columns=None):
+    """
+    Read buildings from a building store.
+
+    With a bounding box, only the buildings whose centroid is inside the
+    box are returned, and the filter is pushed down to the Parquet reader
+    so that row groups entirely outside the box are not decoded. This is
+    the selection needed by the centroid-based hexagon statistics.
+
+    Parameters:
+    path (str): Path of a `.parquet` store written by
+        `write_building_store`. A GeoJSON file of buildings is also
+        accepted, and is read in full with its columns computed on the fly.
+    bbox (tuple, optional): Bounding box (minx, miny, maxx, maxy) in the
+        CRS of the store, such as `hexagon.bounds`.
+    columns (list, optional): Columns to read. Defaults to all columns.
+
+    Returns:
+    gpd.GeoDataFrame: Buildings with geometry, height, centroid and area
+    columns.
+    """
+
+    path = str(path)
+    if path.endswith('.parquet'):
+        filters = None
+        if bbox is not None:
+            minx, miny, maxx, maxy = bbox
+            filters = [('centroid_x', '>=', minx), ('centroid_x', '<=', maxx),
+                       ('centroid_y', '>=', miny), ('centroid_y', '<=', maxy)]
+        if columns is not None and 'geometry' not in columns:
+            columns = list(columns) + ['geometry']
+        return gpd.read_parquet(path, columns=columns, filters=filters)
+
+    # GeoJSON buildings: read the file and compute the columns on the fly
+    buildings = add_building_columns(gpd.read_file(path, bbox=bbox))
+    if bbox is not None:
+        minx, miny, maxx, maxy = bbox
+        buildings = buildings[buildings['centroid_x'].between(minx, maxx)
+                              & buildings['centroid_y'].between(miny, maxy)]
+    if columns is not None:
+        buildings = buildings[[c for c in buildings.columns
+                               if c in columns or c == 'geometry']]
+    return buildings
@@ -0,0 +1,261 @@
+"""
+cli.py: non-interactive command line interface of heat_island
+
+`heat_island_main.py` asks for a city and for points on a map. This module
+runs the same steps from the command line, without any prompt, so they can
+be scripted: each step of the workflow is a subcommand taking paths,
+coordinates or files of coordinates as arguments.
+
+Subcommands:
+- `ingest`: Stores the buildings within the boundary of a city, refreshing
+    only the tiles that changed (see `city_height_acquire`).
+- `build-training`: Builds the training dataset of a city from its weather
+    CSV (see `build_training_set`).
+- `train`: Trains and saves the model (see `model.train`).
+- `predict`: Predicts the temperature of points given with `--point` or in
+    a CSV or GeoJSON file of points (see `predict_points`).
+- `heatmap`: Predicts the temperature of a whole city (see `city_heatmap`
+    and `predict_raster`).
+
+Functions:
+- `build_parser`: Returns the argument parser of the subcommands.
+- `main`: Runs a subcommand.
+
+Example Usage:
+$ python -m heat_island ingest data/seattle_boundary.geojson \\
+      data/seattle_building_footprints.parquet
+$ python -m heat_island build-training data/seattle_weather.csv \\
+      data/seattle_building_footprints.parquet -o data/seattle_training.geojson
+$ python -m heat_island train data/seattle_training.geojson -o data/seattle_model.bin
+$ python -m heat_island predict data/seattle_model.bin \\
+      data/seattle_building_footprints.parquet --point 47.606 -122.333
+$ python -m heat_island heatmap data/seattle_boundary.geojson \\
+      data/seattle_building_footprints.parquet data/seattle_model.bin \\
+      -o seattle_heatmap.parquet --raster seattle_heatmap.tif
+"""
+
+import os
+import sys
+import argparse
+import pandas as pd
+
+from heat_island.height_acquire import city_height_acquire, DEFAULT_MAX_WORKERS
+from heat_island.building_memmap import write_building_arrays
+from heat_island.training_set import build_training_set
+from heat_island.model import train, SEARCH_METHODS
+from heat_island.pipeline import city_heatmap, predict_coordinates, predict_points
+from heat_island.pipeline import read_points, write_points
+from heat_island.pipeline import DEFAULT_RADIUS, PREDICTION_COLUMN
+from heat_island.raster_predict import predict_raster
+
+
+def _add_radius(parser):
+    """
+    Add the radius of the hexagons and the DEM of the terrain features
+    """
+
+    parser.add_argument("--radius", type=float, default=DEFAULT_RADIUS,
+                        help="radius of the hexagons, in meters (default: %(default)g)")
+    parser.add_argument("--terrain", metavar="DEM",
+                        help="DEM of the terrain features, such as data/trimmed_terrain.tif")
+
+
+def build_parser():
+    """
+    Returns the argument parser of the `heat_island` subcommands.
+
+    Returns:
+    argparse.ArgumentParser: The parser. The parsed arguments have a
+    `func` attribute, the function running the subcommand.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog="heat_island",
+        description="Predict urban heat island temperatures from building heights.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest = subparsers.add_parser(
+        "ingest", help="store the buildings within the boundary of a city")
+    ingest.add_argument("boundary", help="boundary of the city, such as a .geojson file")
+    ingest.add_argument("store", help="output .parquet building store")
+    ingest.add_argument("--arrays", metavar="DIR",
+                        help="also write the memory-mapped building arrays to DIR")
+    ingest.add_argument("--max-workers", type=int, default=None,
+                        help="number of tiles downloaded at the same time")
+    ingest.set_defaults(func=_ingest)
+
+    training = subparsers.add_parser(
+        "build-training", help="build the training dataset of a city")
+    training.add_argument("weather_csv", help="weather CSV of the city")
+    training.add_argument("store", help="building store or building arrays directory")
+    training.add_argument("-o", "--output", required=True,
+                          help="output .geojson or .parquet training dataset")
+    training.add_argument("--radii", type=float, nargs="+",
+                          help="radii of additional hexagons around each station")
+    _add_radius(training)
+    training.set_defaults(func=_build_training)
+
+    training_model = subparsers.add_parser("train", help="train and save the model")
+    training_model.add_argument("data",
+                                help=".geojson or .parquet training dataset written by "
+                                     "build-training")
+    training_model.add_argument("-o", "--output", default="model.bin",
+                                help="output .bin model file (default: %(default)s)")
+    training_model.add_argument("--search", choices=SEARCH_METHODS, default="grid",
+                                help="hyperparameter search method (default: %(default)s)")
+    training_model.add_argument("--n-jobs", type=int, default=-1,
+                                help="number of processes of each search (default: all CPUs)")
+    training_model.add_argument("--time-budget", type=float,
+                                help="time budget of the random search of each model, in seconds")
+    training_model.add_argument("--terrain", action="store_true",
+                                help="train on the terrain features too")
+    training_model.set_defaults(func=_train)
+
+    predict = subparsers.add_parser(
+        "predict", help="predict the temperature of points")
+    predict.add_argument("model", help=".bin model file")
+    predict.add_argument("store", help="building store or building arrays directory")
+    predict.add_argument("--point", type=float, nargs=2, action="append", default=[],
+                         metavar=("LAT", "LON"), help="coordinates of a point; repeatable")
+    predict.add_argument("--points", metavar="FILE",
+                         help="CSV file of points with latitude and longitude columns, "
+                              "or GeoJSON file of points")
+    predict.add_argument("-o", "--output",
+                         help="output .csv, .geojson or .json file of the predictions")
+    _add_radius(predict)
+    predict.set_defaults(func=_predict)
+
+    heatmap = subparsers.add_parser(
+        "heatmap", help="predict the temperature of a whole city")
+    heatmap.add_argument("boundary", help="boundary of the city, such as a .geojson file")
+    heatmap.add_argument("store", help="building store or building arrays directory")
+    heatmap.add_argument("model", help=".bin model file")
+    heatmap.add_argument("-o", "--output", help="output .geojson or .parquet file of the cells")
+    heatmap.add_argument("--raster", help="output .tif heat map")
+    heatmap.add_argument("--resolution", type=float,
+                         help="pixel size of the heat map, in degrees")
+    heatmap.add_argument("--step", type=int,
+                         help="predict every pixel of the DEM of --terrain, coarsened by "
+                              "STEP, into the --raster only (needs building arrays; not "
+                              "with --output or --resolution)")
+    heatmap.add_argument("--max-workers", type=int,
+                         help="number of worker processes")
+    _add_radius(heatmap)
+    heatmap.set_defaults(func=_heatmap)
+    return parser
+
+
+def _ingest(args):
+    """
+    Run the `ingest` subcommand
+    """
+
+    max_workers = DEFAULT_MAX_WORKERS if args.max_workers is None else args.max_workers
+    city_height_acquire(args.boundary, args.store, max_workers=max_workers)
+    if args.arrays is not None:
+        write_building_arrays(args.store, args.arrays)
+        print(f"Building arrays saved in: {args.arrays}")
+
+
+def _build_training(args):
+    """
+    Run the `build-training` subcommand
+    """
+
+    build_training_set(args.weather_csv, args.store, radius=args.radius,
+                       output_path=args.output, radii=args.radii,
+                       terrain_path=args.terrain)
+
+
+def _train(args):
+    """
+    Run the `train` subcommand
+    """
+
+    directory, fname = os.path.split(args.output)
+    train(args.data, save_path=directory + "/" if directory else "", fname=fname,
+          search=args.search, n_jobs=args.n_jobs, time_budget=args.time_budget,
+          terrain=args.terrain)
+
+
+def _predict(args):
+    """
+    Run the `predict` subcommand
+    """
+
+    if not args.point and args.points is None:
+        raise ValueError("No points to predict: use --point or --points.")
+    if not args.point:
+        # A file of points is predicted in chunks and streamed to the output
+        predictions = predict_points(args.points, args.store, args.model,
+                                     output_path=args.output, radius_meters=args.radius,
+                                     terrain_path=args.terrain)
+        if args.output is not None:
+            return
+    else:
+        predictions = pd.DataFrame(args.point, columns=['Lat', 'Lon'])
+        if args.points is not None:
+            predictions = pd.concat([predictions, read_points(args.points)],
+                                    ignore_index=True)
+        predicted = predict_coordinates(predictions['Lat'], predictions['Lon'], args.store,
+                                        args.model, radius_meters=args.radius,
+                                        terrain_path=args.terrain)
+        predictions[PREDICTION_COLUMN] = predicted[PREDICTION_COLUMN].to_numpy()
+        if args.output is not None:
+            write_points(predictions, args.output)
+            print(f"Predictions saved as: {args.output}")
+            return
+
+    for lat, lon, temperature in zip(predictions['Lat'], predictions['Lon'],
+                                     predictions[PREDICTION_COLUMN]):
+        print(f"({lat}, {lon}): Temperature prediction is {temperature}")
+
+
+def _heatmap(args):
+    """
+    Run the `heatmap` subcommand
+    """
+
+    if args.step is not None:
+        if args.raster is None or args.terrain is None:
+            raise ValueError("--step needs a --raster to write and the DEM of --terrain.")
+        # The raster of pixels has no cells to write, and its resolution
+        # is set by --step
+        if args.output is not None or args.resolution is not None:
+            raise ValueError("--step writes only the --raster: "
+                             "it cannot be used with --output or --resolution.")
+        predict_raster(args.boundary, args.store, args.model, args.terrain, args.raster,
+                       radius_meters=args.radius, step=args.step,
+                       max_workers=args.max_workers)
+        return
+
+    city_heatmap(args.boundary, args.store, args.model, radius_meters=args.radius,
+                 output_path=args.output, raster_path=args.raster,
+                 resolution=args.resolution, max_workers=args.max_workers,
+                 terrain_path=args.terrain)
+
+
+def main(argv=None):
+    """
+    Runs a `heat_island` subcommand.
+
+    Parameters:
+    argv (list, optional): Arguments of the command line, without the
+        program name. Defaults to `sys.argv[1:]`.
+
+    Returns:
+    int: The exit status, 0 on success. Invalid arguments and inputs exit
+    with the status 2 of `argparse`.
+
+    Example:
+    >>> main(["predict", "data/seattle_model.bin",
+    ...       "data/seattle_building_footprints.parquet", "--point", "47.606", "-122.333"])
+    """
+
+    parser = build_parser()
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    try:
+        args.func(args)
+    except (ValueError, KeyError, FileNotFoundError) as exc:
+        parser.error(f"{args.command}: {exc}")
+    return 0
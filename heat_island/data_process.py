@@ -4,6 +4,8 @@ data_process.py: data process functions for heat_island
 Functions:
     input_file_from_data_dir(input_file_name): find the targeted file 
         inside the 'data' directory and output input file path.
+    clean_weather_data(d_f): Drop the rows contains missing temprature 
+        data, the duplicates weather station and the 'Note' column.
     preprocess_csv(input_file_name): Drop the rows contains missing 
         temprature data and the duplicates weather station.
 
@@ -46,6 +48,34 @@ def input_file_from_data_dir(input_file_name):
     return input_file_path
 
 
+def clean_weather_data(d_f):
+    """
+    Cleans a dataframe of weather station data.
+
+    The steps are the ones of `preprocess_csv`: 
+    1. removing rows without temperature data, 
+    2. eliminating duplicate records based on 'Station ID', and 
+    3. dropping the 'Note' column, if there is one. 
+
+    Parameters:
+    d_f (pandas.DataFrame): Weather data with 'Station ID' and 
+    'Ave temp annual_F' columns.
+
+    Returns:
+    pandas.DataFrame: The cleaned data.
+    """
+
+    # Drop the rows where temprature is missing
+    d_f = d_f.dropna(subset=['Ave temp annual_F'])
+
+    # Drop duplicates based on the 'Station ID' column
+    # This will keep only the first occurrence of each unique ID
+    d_f = d_f.drop_duplicates(subset=['Station ID'])
+
+    # Drop the 'Note' column
+    return d_f.drop(columns=['Note'], errors='ignore')
+
+
 def preprocess_csv(input_file_name):
     """
     Processes a CSV file containing weather data to prepare it for 
@@ -85,15 +115,8 @@ def preprocess_csv(input_file_name):
     # Debug print statement - can be removed in production
     print(d_f) # print original dataframe
 
-    # Drop the rows where temprature is missing
-    d_f = d_f.dropna(subset=['Ave temp annual_F'])
-
-    # Drop duplicates based on the 'Station ID' column
-    # This will keep only the first occurrence of each unique ID
-    d_f = d_f.drop_duplicates(subset=['Station ID'])
-
-    # Drop the 'Note' column
-    d_f = d_f.drop(columns=['Note'])
+    # Drop the rows without temperature, the duplicated stations and 'Note'
+    d_f = clean_weather_data(d_f)
     # Debug print statement - can be removed in production
     print(d_f) # print the modified dataframe
 
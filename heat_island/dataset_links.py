@@ -0,0 +1,168 @@
+"""
+dataset_links.py: memoized and indexed lookup of the building footprint tiles
+
+The building footprints from https://github.com/microsoft/GlobalMLBuildingFootprints
+are listed in `dataset-links.csv`, with one row per quad key and location.
+This module downloads the table once per process, keeps a copy on local
+disk that is revalidated with the ETag / Last-Modified headers of the
+server, and indexes it by quad key so that resolving a tile url is a
+dictionary lookup.
+
+Functions:
+- `load_dataset_links`: Returns the index from quad key to tile urls.
+- `tile_url`: Returns the url of the single tile of a quad key.
+
+Example Usage:
+>>> links = load_dataset_links()
+>>> url = tile_url(21230030, links)
+"""
+
+
+import os
+import json
+import tempfile
+import urllib.error
+import urllib.request
+import pandas as pd
+
+from heat_island.tile_cache import default_cache_dir
+
+
+# Url of the table listing the tiles of the dataset
+DATASET_LINKS_URL = "https://minedbuildings.blob.core.windows.net/global-buildings/dataset-links.csv"
+
+# Index of the tables already loaded in this process, by url
+_LINKS = {}
+
+
+def _cache_paths(url, cache_dir):
+    """
+    Return the paths of the local copy of a links table and of its
+    validators (ETag and Last-Modified headers).
+    """
+
+    name = os.path.basename(url) or "dataset-links.csv"
+    path = os.path.join(cache_dir or default_cache_dir(), name)
+    return path, path + ".json"
+
+
+def _write_atomic(path, data):
+    """
+    Write bytes to `path` through a temporary file and a rename.
+    """
+
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix=".tmp-",
+                                     delete=False) as tmp:
+        tmp.write(data)
+    os.replace(tmp.name, path)
+
+
+def _revalidate(url, path, meta_path, timeout):
+    """
+    Refresh the local copy of a links table with a conditional request.
+
+    The stored ETag and Last-Modified values are sent as `If-None-Match`
+    and `If-Modified-Since`, so an unchanged table costs a single 304
+    response. If the server is unreachable, an existing local copy is used
+    as is.
+    """
+
+    headers = {}
+    if os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            data = response.read()
+            meta = {"etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified")}
+    except urllib.error.HTTPError as exc:
+        # 304: the local copy is still current
+        if exc.code == 304:
+            return
+        raise
+    except urllib.error.URLError:
+        # Offline: fall back to the local copy if there is one
+        if os.path.exists(path):
+            return
+        raise
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _write_atomic(path, data)
+    _write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+
+
+def load_dataset_links(url=DATASET_LINKS_URL, cache_dir=None, refresh=False,
+                       timeout=60):
+    """
+    Load the dataset links table as an index from quad key to tile urls.
+
+    The table is fetched at most once per process. Its local copy in
+    `cache_dir` is revalidated against the server with a conditional
+    request, so only a changed table is downloaded again.
+
+    Parameters:
+    url (str, optional): Url of the `dataset-links.csv` table.
+    cache_dir (str, optional): Directory of the local copy. Defaults to
+        `heat_island.tile_cache.default_cache_dir()`.
+    refresh (bool, optional): Revalidate the table even if it was already
+        loaded in this process. Defaults to False.
+    timeout (float, optional): Timeout of the request, in seconds.
+
+    Returns:
+    dict: Mapping of each quad key (int) to the list of its tile urls.
+
+    Example:
+    >>> links = load_dataset_links()
+    >>> links[21230030]
+    ['https://minedbuildings.blob.core.windows.net/global-buildings/...']
+    """
+
+    if not refresh and url in _LINKS:
+        return _LINKS[url]
+
+    path, meta_path = _cache_paths(url, cache_dir)
+    _revalidate(url, path, meta_path, timeout)
+
+    # Build the hash index from QuadKey to Url
+    df = pd.read_csv(path, usecols=["QuadKey", "Url"])
+    links = {}
+    for quad_key, tile in zip(df["QuadKey"], df["Url"]):
+        links.setdefault(int(quad_key), []).append(tile)
+
+    _LINKS[url] = links
+    return links
+
+
+def tile_url(quad_key, links=None):
+    """
+    Return the url of the tile of a quad key.
+
+    Parameters:
+    quad_key (int): Quad key of the tile at zoom level 9.
+    links (dict, optional): Index returned by `load_dataset_links`.
+        Defaults to the index of the default table.
+
+    Returns:
+    str: Url of the GeoJSONL file of the tile.
+
+    Raises:
+    ValueError: If multiple or no rows are found for the quad key.
+    """
+
+    if links is None:
+        links = load_dataset_links()
+    urls = links.get(int(quad_key), [])
+    # If multiple rows are found for a quad key, raise an error
+    if len(urls) > 1:
+        raise ValueError(f"Multiple rows found for QuadKey: {quad_key}")
+    # If no rows are found for a quad key, raise an error
+    if not urls:
+        raise ValueError(f"QuadKey not found in dataset: {quad_key}")
+    return urls[0]
@@ -4,8 +4,22 @@ geo_process.py: geographical data process functions for heat_island
 Functions:
 - create_hexagon: Generates a regular hexagon centered at a given latitude and longitude. 
 
+- `create_hexagons`: Generates many hexagons at once from arrays of coordinates. 
+
+- `read_boundary`: Returns a boundary file or GeoDataFrame as one geometry. 
+
+- `hexagon_grid`: Generates a hexagonal tessellation covering a boundary. 
+
+- `cell_centers`: Returns the centers of grid cells from their cell IDs. 
+
 - `hex_to_geojson`: Converts a hexagonal shape into a GeoJSON object using Folium. 
 
+- `equal_area_crs`: Returns a local equal-area projection centered at a point. 
+
+- `get_transformer`: Returns a cached coordinate transformer between two CRS. 
+
+- `equal_area_areas`: Computes the areas of many geometries in square meters. 
+
 Note:
 - Longitude should be entered before latitude.
 
@@ -14,8 +28,15 @@ Date: 2023/12/13
 """
 
 import math
+from functools import lru_cache
+import numpy as np
+import pyproj
+import shapely
 import shapely.geometry
 from shapely.geometry import Polygon
+import pandas as pd
+import geopandas as gpd
+from geopandas.array import GeometryArray
 import folium
 
 
@@ -75,6 +96,175 @@ def create_hexagon(longitude, latitude, radius_meters = 111111 * 0.001):
     return Polygon(hexagon_vertices)
 
 
+def create_hexagons(longitudes, latitudes, radius_meters = 111111 * 0.001):
+    """
+    Creates hexagons centered at arrays of longitudes and latitudes.
+
+    This is the vectorized version of `create_hexagon`: the vertices of 
+    all hexagons are computed at once with NumPy broadcasting and the 
+    polygons are constructed in bulk with `shapely.polygons`, which avoids 
+    a Python loop per hexagon. The vertices are the same as the ones of 
+    `create_hexagon`.
+
+    Parameters:
+    longitudes (array-like): The longitudes of the centers of the hexagons.
+    latitudes (array-like): The latitudes of the centers of the hexagons.
+    radius_meters (float): The desired radius of the hexagons, in meter.
+
+    Returns:
+    gpd.GeoSeries: The hexagons in EPSG:4326, with the index of 
+    `longitudes` if it is a pandas Series.
+
+    Raises:
+    ValueError: If `longitudes` and `latitudes` have different lengths.
+
+    Example:
+    >>> hexagons = create_hexagons(weather['Lon'], weather['Lat'], 160)
+    """
+
+    index = longitudes.index if isinstance(longitudes, pd.Series) else None
+    lon_rad = np.radians(np.asarray(longitudes, dtype=float).ravel())
+    lat_rad = np.radians(np.asarray(latitudes, dtype=float).ravel())
+    if lon_rad.shape != lat_rad.shape:
+        raise ValueError("longitudes and latitudes must have the same length.")
+
+    # Radius of the hexagons in radians, as in `create_hexagon`
+    r_rad = radius_meters / 6371000
+    angles = math.pi / 3 * np.arange(6)
+
+    # Vertices of every hexagon, with shape (number of hexagons, 6, 2)
+    x = np.degrees(lon_rad[:, None] + r_rad * np.cos(angles))
+    y = np.degrees(lat_rad[:, None] + r_rad * np.sin(angles))
+    hexagons = shapely.polygons(np.stack([x, y], axis=-1))
+
+    # Wrap the polygons directly, skipping the per-element validation of
+    # the GeoSeries constructor
+    return gpd.GeoSeries(GeometryArray(hexagons, crs=4326), index=index)
+
+
+# Offset added to the row of a grid cell to make it positive before it is 
+# packed with the column into a cell ID
+_ROW_OFFSET = 2**31
+
+
+def _grid_spacing(radius_meters):
+    """
+    Returns the column spacing, row spacing and circumradius, in degrees, 
+    of the lattice of hexagons built by `create_hexagon` with a radius.
+    """
+
+    radius = math.degrees(radius_meters / 6371000)
+    return 1.5 * radius, math.sqrt(3) * radius, radius
+
+
+def cell_centers(cell_ids, radius_meters = 111111 * 0.001):
+    """
+    Returns the centers of hexagonal grid cells from their cell IDs.
+
+    Parameters:
+    cell_ids (array-like): Cell IDs returned by `hexagon_grid`.
+    radius_meters (float): The radius of the hexagons of the grid, in meter.
+
+    Returns:
+    tuple: NumPy arrays (longitudes, latitudes) of the centers.
+    """
+
+    cell_ids = np.asarray(cell_ids, dtype=np.int64)
+    columns = cell_ids >> 32
+    rows = (cell_ids & 0xFFFFFFFF) - _ROW_OFFSET
+    dx, dy, _ = _grid_spacing(radius_meters)
+    # Odd columns are shifted up by half a row
+    return columns * dx, (rows + (columns & 1) / 2) * dy
+
+
+def read_boundary(boundary):
+    """
+    Returns a boundary as a single geometry in EPSG:4326.
+
+    Parameters:
+    boundary (str, shapely.geometry or gpd.GeoDataFrame): A path to a file 
+        readable by geopandas (such as `seattle_boundary.geojson`), a 
+        GeoDataFrame or GeoSeries whose geometries are merged, or a 
+        geometry in EPSG:4326, which is returned as is.
+
+    Returns:
+    shapely.geometry: The boundary in EPSG:4326.
+    """
+
+    if isinstance(boundary, str):
+        boundary = gpd.read_file(boundary)
+    if isinstance(boundary, (gpd.GeoDataFrame, gpd.GeoSeries)):
+        if boundary.crs is not None:
+            boundary = boundary.to_crs(4326)
+        boundary = shapely.union_all(boundary.geometry.values)
+    return boundary
+
+
+def hexagon_grid(boundary, radius_meters = 111111 * 0.001, clip = False):
+    """
+    Generates a gap-free hexagonal tessellation covering a boundary.
+
+    The hexagons are the ones of `create_hexagon`: their centers lie on a 
+    lattice anchored at longitude and latitude 0, with columns 1.5 radius 
+    apart and rows sqrt(3) radius apart, odd columns being shifted by half 
+    a row. Each cell is identified by its column and row packed into one 
+    64-bit integer, so the same cell has the same ID for any boundary with 
+    the same radius, and results can be cached and joined on it.
+
+    The lattice is generated with NumPy over the bounding box of the 
+    boundary, and the cells that do not intersect the boundary are 
+    dropped with a single vectorized test against the prepared boundary.
+
+    Parameters:
+    boundary (str, shapely.geometry or gpd.GeoDataFrame): The area to 
+        cover: a path to a file readable by geopandas (such as 
+        `seattle_boundary.geojson`), a GeoDataFrame or GeoSeries whose 
+        geometries are merged, or a geometry in EPSG:4326.
+    radius_meters (float): The radius of the hexagons, in meter.
+    clip (bool): Whether to clip the cells on the edge of the boundary to 
+        the boundary. Defaults to False, which keeps whole hexagons.
+
+    Returns:
+    gpd.GeoDataFrame: One row per cell in EPSG:4326, indexed by 
+    'cell_id', with the 'Lon' and 'Lat' of the center of the cell.
+
+    Raises:
+    ValueError: If `radius_meters` is not positive.
+
+    Example:
+    >>> grid = hexagon_grid("data/seattle_boundary.geojson", 160)
+    """
+
+    if radius_meters <= 0:
+        raise ValueError("radius_meters must be positive.")
+    boundary = read_boundary(boundary)
+
+    # Range of columns and rows of the lattice over the bounding box, with 
+    # one extra cell on each side
+    dx, dy, _ = _grid_spacing(radius_meters)
+    minx, miny, maxx, maxy = boundary.bounds
+    columns = np.arange(math.floor(minx / dx) - 1, math.ceil(maxx / dx) + 2)
+    rows = np.arange(math.floor(miny / dy) - 1, math.ceil(maxy / dy) + 2)
+    columns, rows = (a.ravel() for a in np.meshgrid(columns, rows))
+    cell_ids = (columns.astype(np.int64) << 32) | (rows + _ROW_OFFSET)
+
+    longitudes, latitudes = cell_centers(cell_ids, radius_meters)
+    hexagons = create_hexagons(longitudes, latitudes, radius_meters).values
+
+    # Keep the cells touching the boundary
+    shapely.prepare(boundary)
+    keep = shapely.intersects(boundary, hexagons)
+    hexagons = hexagons[keep]
+    if clip:
+        # Only the cells crossing the edge of the boundary need clipping
+        edge = ~shapely.contains_properly(boundary, hexagons)
+        hexagons[edge] = hexagons[edge].intersection(boundary)
+
+    return gpd.GeoDataFrame({'Lon': longitudes[keep], 'Lat': latitudes[keep]},
+                            geometry=hexagons,
+                            index=pd.Index(cell_ids[keep], name='cell_id'))
+
+
 def hex_to_geojson(hexagon):
     """
     Converts a hexagon shape into GeoJSON format using Folium.
@@ -97,3 +287,92 @@ def hex_to_geojson(hexagon):
         "type": "Feature",
         "geometry": shapely.geometry.mapping(hexagon)
     })
+
+
+def equal_area_crs(longitude, latitude):
+    """
+    Creates a local equal-area projection centered at a given point.
+
+    This function returns a Lambert Azimuthal Equal Area projection on 
+    the WGS84 ellipsoid whose center is the given longitude and latitude. 
+    Areas computed in this projection are in square meters and are 
+    accurate over a whole city, unlike areas computed in EPSG:4326 
+    degrees, which depend on the latitude.
+
+    Parameters:
+    longitude (float): The longitude of the center of the projection.
+    latitude (float): The latitude of the center of the projection.
+
+    Returns:
+    pyproj.CRS: The equal-area projection, in meters.
+
+    Note:
+    - longitude should be entered before latitude.
+    """
+
+    return pyproj.CRS.from_proj4(
+        f"+proj=laea +lat_0={latitude} +lon_0={longitude} "
+        "+x_0=0 +y_0=0 +datum=WGS84 +units=m +no_defs")
+
+
+@lru_cache(maxsize=32)
+def get_transformer(crs_from, crs_to):
+    """
+    Returns a cached transformer between two coordinate reference systems.
+
+    Creating a `pyproj.Transformer` is much slower than using one, so 
+    transformers are created once per pair of CRS and reused.
+
+    Parameters:
+    crs_from (any): Source CRS, in any form accepted by `pyproj.CRS`.
+    crs_to (any): Target CRS, in any form accepted by `pyproj.CRS`.
+
+    Returns:
+    pyproj.Transformer: Transformer taking (x, y) = (longitude, latitude) 
+    ordered coordinates.
+    """
+
+    return pyproj.Transformer.from_crs(crs_from, crs_to, always_xy=True)
+
+
+def equal_area_areas(geometries, crs=4326):
+    """
+    Computes the areas of many geometries in square meters.
+
+    All geometries are reprojected in a single vectorized call into an 
+    equal-area projection (see `equal_area_crs`) centered on the nearest 
+    whole degree of their center. The transformer is cached, so repeated 
+    calls over the same city cost no setup.
+
+    Parameters:
+    geometries (array-like): Shapely geometries, such as a GeoSeries or a 
+    list of hexagons.
+    crs (any, optional): CRS of the geometries. Defaults to EPSG:4326.
+
+    Returns:
+    np.ndarray: The area of each geometry, in square meters.
+    """
+
+    geometries = np.asarray(geometries, dtype=object)
+    if geometries.size == 0:
+        return np.empty(0)
+    if pyproj.CRS.from_user_input(crs) != pyproj.CRS.from_epsg(4326):
+        geometries = _transform(geometries, get_transformer(crs, "EPSG:4326"))
+    # The projection is equal-area everywhere, so rounding its center only 
+    # lets the transformer be reused, without changing the areas
+    minx, miny, maxx, maxy = shapely.total_bounds(geometries)
+    target = equal_area_crs(round((minx + maxx) / 2), round((miny + maxy) / 2))
+    transformer = get_transformer("EPSG:4326", target.to_wkt())
+    return shapely.area(_transform(geometries, transformer))
+
+
+def _transform(geometries, transformer):
+    """
+    Reprojects an array of geometries with a transformer, passing all their 
+    coordinates to PROJ at once.
+    """
+
+    def project(coords):
+        return np.column_stack(transformer.transform(coords[:, 0], coords[:, 1]))
+
+    return shapely.transform(geometries, project)
@@ -12,8 +12,18 @@ Key Functions:
 - `get_centroid`: Computes and adds the centroid of geometries in a GeoDataFrame.
 - Statistical helper functions (`weighted_median`, `weighted_percentile`, `weighted_std`): 
     Provide statistical analysis tools for weighted data.
+- `weighted_summary`: Calculates the weighted mean, standard deviation and 
+    percentiles of a dataset from a single sort.
 - `average_building_height_with_centroid`: Calculates various statistical 
     measures for building heights within a specified hexagon area.
+- `hexagon_stats_batch`: Calculates the same measures for many hexagons at 
+    once with a single spatial join and grouped NumPy operations.
+- `hexagon_stats_from_points`: Calculates them from plain arrays of building 
+    centroids, heights and areas.
+- `hexagon_stats_multi_radius`: Calculates them for hexagons of several radii 
+    around the same centers from a single spatial query.
+- `city_height_acquire`: Stores the buildings within the boundary of a city 
+    in a building store, refreshing only the tiles that changed.
 
 Example Usage:
 To use this module, first create a hexagonal area of interest using `create_hexagon` 
@@ -26,20 +36,23 @@ Date: 2023/12/13
 
 
 import os
-import tempfile
 import numpy as np
 import pandas as pd
 import geopandas as gpd
+import shapely
 import shapely.geometry
 import mercantile
-from tqdm import tqdm
-import fiona
 
 from heat_island.data_process import input_file_from_data_dir
+from heat_island.geo_process import equal_area_areas, create_hexagons, read_boundary
+from heat_island.tile_download import download_tiles, DEFAULT_MAX_WORKERS
+from heat_island.building_store import add_building_columns
+from heat_island.building_store import has_building_columns, building_arrays
+from heat_island.incremental_ingest import update_building_store
 
 
 
-def height_acquire(hexagon):
+def height_acquire(hexagon, cache=None, max_workers=DEFAULT_MAX_WORKERS):
     """
     Acquires building height data from a specified hexagonal area.
 
@@ -54,10 +67,16 @@ def height_acquire(hexagon):
     Parameters:
         hexagon (shapely.geometry.polygon.Polygon): 
         A hexagon polygon representing the area of interest (AOI).
+        cache (heat_island.tile_cache.TileCache, optional): 
+        Local cache of the downloaded tiles. Defaults to the cache 
+        returned by `get_default_cache()`.
+        max_workers (int, optional): 
+        Maximum number of tiles downloaded at the same time.
 
     Returns:
         gpd.GeoDataFrame: A GeoDataFrame containing the heights of 
-        buildings within the specified hexagon area.
+        buildings within the specified hexagon area, with their centroid 
+        and area columns (see `add_building_columns`).
 
     Raises:
         ValueError: If the input is not a valid shapely polygon or if 
@@ -70,6 +89,8 @@ def height_acquire(hexagon):
     Note:
     - This function is designed for use with hexagonal polygons specifically.
     - The hexagon should be a valid shapely polygon.
+    - Tiles are read from the local tile cache, so repeated queries in 
+    the same tile do not download it again.
     """
 
     if type(hexagon) != shapely.geometry.polygon.Polygon:
@@ -93,45 +114,12 @@ def height_acquire(hexagon):
     print(f"The input area spans {len(quad_keys)} tiles: {quad_keys}")
 
 
-    # Read the dataset links CSV file
-    df = pd.read_csv(
-        "https://minedbuildings.blob.core.windows.net/global-buildings/dataset-links.csv"
-    )
-
-    # Create an empty GeoDataFrame
-    combined_gdf = gpd.GeoDataFrame()
-    # Debug print statement - can be removed in production
-    # print(combined_gdf)
-
-    # Iterate over each quad key
-    for quad_key in tqdm(quad_keys):
-        # Find rows in the dataset that match the current quad key
-        rows = df[df["QuadKey"] == quad_key]
-
-        # If exactly one row is found for the quad key
-        if rows.shape[0] == 1:
-            # Get the URL of the GeoJSON file
-            url = rows.iloc[0]["Url"]
-            # Read the GeoJSON file from the URL
-            df2 = pd.read_json(url, lines=True)
-            # Convert geometry data to Shapely shapes
-            df2["geometry"] = df2["geometry"].apply(shapely.geometry.shape)
-
-            # Create a GeoDataFrame from the data
-            gdf = gpd.GeoDataFrame(df2, crs=4326)
-            gdf['height'] = gdf['properties'].apply(lambda x: x.get('height'))
-            gdf = gdf.drop(columns=['properties'])
-
-            combined_gdf = pd.concat([combined_gdf, gdf], ignore_index=True)
-            # Debug print statement - can be removed in production
-            # print(combined_gdf)
-
-        # If multiple rows are found for a quad key, raise an error
-        elif rows.shape[0] > 1:
-            raise ValueError(f"Multiple rows found for QuadKey: {quad_key}")
-        # If no rows are found for a quad key, raise an error
-        else:
-            raise ValueError(f"QuadKey not found in dataset: {quad_key}")
+    # Fetch and parse the tiles concurrently, then concatenate them once
+    # Buildings outside of the expanded AOI are skipped while parsing
+    combined_gdf = download_tiles(quad_keys, cache=cache, max_workers=max_workers,
+                                  bbox=(minx, miny, maxx, maxy))
+    # Compute the centroid and area of each building once, at ingest
+    combined_gdf = add_building_columns(combined_gdf)
 
     return combined_gdf
 
@@ -308,7 +296,74 @@ def weighted_std(data, weights):
     return np.sqrt(variance)
 
 
-def average_building_height_with_centroid(buildings, hexagon):
+def weighted_summary(data, weights, percentiles=(0, 25, 50, 75, 100)):
+    """
+    Calculate the weighted mean, standard deviation and several weighted 
+    percentiles of a dataset in a single pass.
+
+    This function combines `weighted_percentile`, `weighted_std` and 
+    `np.average`. The data is sorted once (by data, then weight, as 
+    `sorted(zip(data, weights))` does, so the results are identical on 
+    ties), the weights are accumulated once, and all percentiles are 
+    interpolated with a single vectorized `np.interp` call.
+
+    Parameters:
+    data (array-like): An array, list, or similar structure containing 
+    the data points. The data should be numeric.
+    weights (array-like): An array, list, or similar structure containing 
+    the weights corresponding to each data point. These should be non-negative 
+    numbers and of the same length as the data array.
+    percentiles (tuple, optional): The percentiles to calculate, each 
+    between 0 and 100. Defaults to (0, 25, 50, 75, 100).
+
+    Returns:
+    dict: A dictionary containing the following key-value pairs:
+        - 'weight': Sum of the weights.
+        - 'weighted_sum': Sum of the products of data and weights.
+        - 'mean': Weighted average of the data.
+        - 'std': Weighted standard deviation of the data.
+        - 'percentiles': np.ndarray of the requested weighted percentiles.
+
+    Raises:
+    ValueError: If `data` and `weights` have different lengths.
+    ValueError: If any weight is negative.
+    ValueError: If any percentile is not between 0 and 100.
+
+    Example:
+    >>> data = [1, 2, 3, 4, 5]
+    >>> weights = [1, 2, 3, 4, 5]
+    >>> weighted_summary(data, weights, percentiles=(50,))['percentiles']
+    array([3.375])
+    """
+
+    data = np.asarray(data, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    percentiles = np.asarray(percentiles, dtype=float)
+    if len(data) != len(weights):
+        raise ValueError("Data and weights must have the same length.")
+    if np.any(weights < 0):
+        raise ValueError("Weights must be non-negative.")
+    if np.any((percentiles < 0) | (percentiles > 100)):
+        raise ValueError("Percentile must be between 0 and 100.")
+
+    order = np.lexsort((weights, data))
+    data_sorted = data[order]
+    cum_weights = np.cumsum(weights[order])
+    total_weight = cum_weights[-1]
+    weighted_sum = np.dot(data, weights)
+    mean = weighted_sum / total_weight
+    variance = np.dot((data - mean)**2, weights) / total_weight
+    return {
+        'weight': total_weight,
+        'weighted_sum': weighted_sum,
+        'mean': mean,
+        'std': np.sqrt(variance),
+        'percentiles': np.interp(total_weight * percentiles / 100.0,
+                                 cum_weights, data_sorted)
+    }
+
+
+def average_building_height_with_centroid(buildings, hexagon, index=None, projected=False):
     """
     Calculate statistical measures of building heights within a hexagon 
     based on their centroids.
@@ -325,6 +380,14 @@ def average_building_height_with_centroid(buildings, hexagon):
         with geometry and height information.
     hexagon (shapely.geometry.polygon.Polygon): A hexagon polygon 
         representing the area of interest.
+    index (heat_island.building_index.BuildingIndex, optional): A spatial 
+        index built over `buildings`. When given, only the buildings in 
+        the bounding box of the hexagon are tested, instead of all of them.
+    projected (bool, optional): Compute the building and hexagon areas in 
+        square meters in an equal-area projection, instead of in the units 
+        of the CRS of `buildings` (square degrees for EPSG:4326). The 
+        selection of the buildings is the same. Defaults to False, which 
+        matches the features the saved models were trained on.
 
     Returns:
     dict: A dictionary containing the following key-value pairs:
@@ -350,12 +413,24 @@ def average_building_height_with_centroid(buildings, hexagon):
     >>> stats = average_building_height_with_centroid(buildings_gdf, hexagon)
 
     Note:
-    - The function assumes that the 'buildings' GeoDataFrame contains a 'centroid' 
-        column with centroid geometries of buildings.
+    - The function assumes that the 'buildings' GeoDataFrame contains either 
+        the centroid and area columns added by `add_building_columns` at 
+        ingest (see `heat_island.building_store`), or a 'centroid' column 
+        with centroid geometries of buildings.
+    - When querying many hexagons against the same buildings, build a 
+        `BuildingIndex` once and pass it as `index`.
     """
 
     # Select buildings whose centroid is within or intersects the hexagon
-    buildings_within_hex = buildings[buildings['centroid'].within(hexagon)]
+    if index is not None:
+        buildings_within_hex = index.select(hexagon)
+    elif has_building_columns(buildings):
+        # Point-in-polygon test on the precomputed centroid coordinates
+        centroid_x, centroid_y, _ = building_arrays(buildings)
+        buildings_within_hex = buildings[shapely.contains_xy(hexagon, centroid_x,
+                                                             centroid_y)]
+    else:
+        buildings_within_hex = buildings[buildings['centroid'].within(hexagon)]
     # Debug print statement - can be removed in production
     # print(buildings_within_hex)
 
@@ -374,35 +449,30 @@ def average_building_height_with_centroid(buildings, hexagon):
             'centroid_stat_75%': np.NaN,
             'centroid_stat_max': np.NaN
         }
-    # Calculate the product of the area and height for each building
-    buildings_within_hex['area_height'] = buildings_within_hex.area * buildings_within_hex['height']
-    # Debug print statement - can be removed in productio
-    # print(buildings_within_hex)
+    # Calculate every statistic from a single sort of the heights, weighted
+    # by the area of each building
+    _, _, areas = building_arrays(buildings_within_hex, projected=projected)
+    summary = weighted_summary(buildings_within_hex['height'].to_numpy(dtype=float),
+                               areas)
 
 
     # Method 1: related to hexagon area
-    # Sum the products and divide by the area of the hexagon to get the average height
-    total_height_area = buildings_within_hex['area_height'].sum()
-    hexagon_area = hexagon.area
+    # Sum the products of area and height and divide by the area of the
+    # hexagon to get the average height
+    total_height_area = summary['weighted_sum']
+    if projected:
+        hexagon_area = equal_area_areas([hexagon], crs=buildings.crs or 4326)[0]
+    else:
+        hexagon_area = hexagon.area
     # Debug print statement - can be removed in productio
     # print(hexagon_area)
     average_height_area = total_height_area / hexagon_area if hexagon_area != 0 else 0
 
     # Method 2: not related to hexagon area
-    weighted_avg = np.average(buildings_within_hex['height'], weights=buildings_within_hex.area)
-
-    # median = weighted_median(buildings_within_hex['height'], buildings_within_hex.area)
-    percentile_0 = weighted_percentile(buildings_within_hex['height'],
-                                       buildings_within_hex.area, 0)
-    percentile_25 = weighted_percentile(buildings_within_hex['height'],
-                                        buildings_within_hex.area, 25)
-    percentile_50 = weighted_percentile(buildings_within_hex['height'],
-                                        buildings_within_hex.area, 50)
-    percentile_75 = weighted_percentile(buildings_within_hex['height'],
-                                        buildings_within_hex.area, 75)
-    percentile_100 = weighted_percentile(buildings_within_hex['height'],
-                                         buildings_within_hex.area, 100)
-    std_dev = weighted_std(buildings_within_hex['height'], buildings_within_hex.area)
+    weighted_avg = summary['mean']
+    std_dev = summary['std']
+    percentile_0, percentile_25, percentile_50, percentile_75, percentile_100 = \
+        summary['percentiles']
 
     return {
         'centroid_stat_total_height_area': total_height_area,
@@ -419,33 +489,356 @@ def average_building_height_with_centroid(buildings, hexagon):
 
 
 
-def seattle_height_acquire():
+def grouped_weighted_summary(groups, data, weights, n_groups,
+                             percentiles=(0, 25, 50, 75, 100)):
+    """
+    Calculate weighted statistics of many groups of data points at once.
+
+    This function is the grouped counterpart of `weighted_percentile` and 
+    `weighted_std`. All data points are sorted once by (group, data, 
+    weight), the weights are accumulated with a single cumulative sum, and 
+    every requested percentile of every group is then found with one 
+    binary search, using the same linear interpolation as `np.interp`.
+
+    Parameters:
+    groups (array-like): Integer group of each data point, between 0 and 
+        `n_groups` - 1.
+    data (array-like): Numeric data points.
+    weights (array-like): Non-negative weight of each data point.
+    n_groups (int): Number of groups.
+    percentiles (tuple, optional): Percentiles to calculate, between 0 
+        and 100. Defaults to (0, 25, 50, 75, 100).
+
+    Returns:
+    dict: A dictionary with the following arrays of length `n_groups`, 
+    which are NaN for groups without data points:
+        - 'count': Number of data points.
+        - 'weight': Sum of the weights.
+        - 'weighted_sum': Sum of the products of data and weights.
+        - 'mean': Weighted average.
+        - 'std': Weighted standard deviation.
+        - 'percentiles': Array of shape (n_groups, len(percentiles)).
+
+    Raises:
+    ValueError: If `groups`, `data` and `weights` have different lengths.
+    ValueError: If any weight is negative.
+    """
+
+    groups = np.asarray(groups, dtype=np.int64)
+    data = np.asarray(data, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    if not len(groups) == len(data) == len(weights):
+        raise ValueError("Groups, data and weights must have the same length.")
+    if np.any(weights < 0):
+        raise ValueError("Weights must be non-negative.")
+
+    # Sums per group
+    count = np.bincount(groups, minlength=n_groups)
+    weight = np.bincount(groups, weights=weights, minlength=n_groups)
+    weighted_sum = np.bincount(groups, weights=weights * data, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = weighted_sum / weight
+        variance = np.bincount(groups, weights=weights * (data - mean[groups])**2,
+                               minlength=n_groups) / weight
+
+    # Sort once by group, then data, then weight (as `sorted(zip(...))`)
+    order = np.lexsort((weights, data, groups))
+    data_sorted = data[order]
+    weights_sorted = weights[order]
+    cum_weights = np.cumsum(weights_sorted)
+    ends = np.cumsum(count)
+    starts = ends - count
+
+    result = np.full((n_groups, len(percentiles)), np.nan)
+    occupied = np.flatnonzero(count)
+    if occupied.size:
+        start = starts[occupied][:, None]
+        last = ends[occupied][:, None] - 1
+        # Cumulative weight before the first point of each group
+        offset = cum_weights[start] - weights_sorted[start]
+        cutoff = offset + weight[occupied][:, None] * np.asarray(percentiles) / 100.0
+        # Last point whose cumulative weight is <= cutoff, as in np.interp
+        j = np.searchsorted(cum_weights, cutoff, side='right') - 1
+        lower = np.clip(j, start, last)
+        upper = np.minimum(lower + 1, last)
+        span = cum_weights[upper] - cum_weights[lower]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.where(span > 0, (cutoff - cum_weights[lower]) / span, 0.0)
+        values = data_sorted[lower] + fraction * (data_sorted[upper] - data_sorted[lower])
+        # Below the first point or above the last point: clamp
+        values = np.where(j < start, data_sorted[start], values)
+        values = np.where(j >= last, data_sorted[last], values)
+        result[occupied] = values
+
+    empty = count == 0
+    weighted_sum = np.where(empty, np.nan, weighted_sum)
+    return {
+        'count': count,
+        'weight': np.where(empty, np.nan, weight),
+        'weighted_sum': weighted_sum,
+        'mean': mean,
+        'std': np.sqrt(variance),
+        'percentiles': result
+    }
+
+
+def hexagon_stats_from_groups(groups, heights, areas, hexagon_areas, index=None):
+    """
+    Build the `centroid_stat_*` table of many hexagons from the assignment 
+    of buildings to hexagons.
+
+    Parameters:
+    groups (array-like): Position of the hexagon of each (building, 
+        hexagon) pair.
+    heights (array-like): Height of the building of each pair.
+    areas (array-like): Footprint area of the building of each pair.
+    hexagon_areas (array-like): Area of each hexagon, in the same units 
+        as `areas`.
+    index (pd.Index, optional): Index of the returned DataFrame.
+
+    Returns:
+    pd.DataFrame: One row per hexagon with the same `centroid_stat_*` 
+    columns as `average_building_height_with_centroid`. Hexagons without 
+    buildings have NaN in every column.
+    """
+
+    hexagon_areas = np.asarray(hexagon_areas, dtype=float)
+    summary = grouped_weighted_summary(groups, heights, areas, len(hexagon_areas))
+    total_height_area = summary['weighted_sum']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average_height_area = np.where(hexagon_areas != 0,
+                                       total_height_area / hexagon_areas, 0)
+    average_height_area = np.where(np.isnan(total_height_area), np.nan,
+                                   average_height_area)
+    percentiles = summary['percentiles']
+    return pd.DataFrame({
+        'centroid_stat_total_height_area': total_height_area,
+        'centroid_stat_avg_height_area': average_height_area,
+        'centroid_stat_mean': summary['mean'],
+        'centroid_stat_std_dev': summary['std'],
+        'centroid_stat_min': percentiles[:, 0],
+        'centroid_stat_25%': percentiles[:, 1],
+        'centroid_stat_50%': percentiles[:, 2],
+        'centroid_stat_75%': percentiles[:, 3],
+        'centroid_stat_max': percentiles[:, 4]
+    }, index=index)
+
+
+def hexagon_stats_from_points(centroid_x, centroid_y, heights, areas, hexagons,
+                              hexagon_areas, index=None):
+    """
+    Calculate the `centroid_stat_*` table of many hexagons from plain 
+    arrays of building centroids, heights and areas.
+
+    Each building is assigned to the hexagons containing its centroid 
+    with one query of an STRtree over the hexagons, so the buildings do 
+    not need to be in a GeoDataFrame.
+
+    Parameters:
+    centroid_x (array-like): X coordinate of the centroid of each building.
+    centroid_y (array-like): Y coordinate of the centroid of each building.
+    heights (array-like): Height of each building.
+    areas (array-like): Footprint area of each building.
+    hexagons (array-like): Hexagon polygons, in the CRS of the centroids.
+    hexagon_areas (array-like): Area of each hexagon, in the same units 
+        as `areas`.
+    index (pd.Index, optional): Index of the returned DataFrame.
+
+    Returns:
+    pd.DataFrame: One row per hexagon, as returned by 
+    `hexagon_stats_from_groups`.
+    """
+
+    points = shapely.points(np.asarray(centroid_x, dtype=float),
+                            np.asarray(centroid_y, dtype=float))
+    tree = shapely.STRtree(np.asarray(hexagons, dtype=object))
+    building_pos, groups = tree.query(points, predicate='within')
+    heights = np.asarray(heights, dtype=float)[building_pos]
+    areas = np.asarray(areas, dtype=float)[building_pos]
+    return hexagon_stats_from_groups(groups, heights, areas, hexagon_areas, index=index)
+
+
+def hexagon_stats_batch(buildings, hexagons, projected=False):
+    """
+    Calculate statistical measures of building heights for many hexagons 
+    in one pass.
+
+    This is the batch version of `average_building_height_with_centroid`. 
+    Each building is assigned to the hexagons that contain its centroid 
+    with a single spatial join, and the statistics of all hexagons are 
+    then computed with grouped NumPy operations instead of one call per 
+    hexagon. Overlapping hexagons are supported: a building counts in 
+    every hexagon that contains its centroid.
+
+    Parameters:
+    buildings (gpd.GeoDataFrame): A GeoDataFrame containing building data 
+        with geometry and height information. The precomputed centroid 
+        and area columns, or else the 'centroid' column, are used if 
+        present.
+    hexagons (gpd.GeoSeries, gpd.GeoDataFrame or list): Hexagon polygons 
+        representing the areas of interest, in the CRS of `buildings`.
+    projected (bool, optional): Compute the building and hexagon areas in 
+        square meters, as in `average_building_height_with_centroid`. All 
+        hexagons are reprojected at once. Defaults to False.
+
+    Returns:
+    pd.DataFrame: One row per hexagon, with the index of `hexagons` if it 
+    has one, and the `centroid_stat_*` columns returned by 
+    `average_building_height_with_centroid`.
+
+    Example:
+    >>> hexagons = create_hexagons(lons, lats)
+    >>> stats = hexagon_stats_batch(buildings_gdf, hexagons)
+    """
+
+    if isinstance(hexagons, gpd.GeoDataFrame):
+        hexagons = hexagons.geometry
+    index = hexagons.index if isinstance(hexagons, pd.Series) else None
+    cells = gpd.GeoDataFrame(geometry=np.asarray(hexagons, dtype=object),
+                             crs=buildings.crs)
+
+    centroid_x, centroid_y, footprint_area = building_arrays(buildings, projected=projected)
+    points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(centroid_x, centroid_y),
+                              crs=buildings.crs)
+
+    # Assign each building to the hexagons that contain its centroid
+    joined = gpd.sjoin(points, cells, how='inner', predicate='within')
+    building_pos = joined.index.to_numpy()
+    groups = joined['index_right'].to_numpy()
+
+    heights = buildings['height'].to_numpy(dtype=float)[building_pos]
+    areas = footprint_area[building_pos]
+    if projected:
+        hexagon_areas = equal_area_areas(cells.geometry.values, crs=buildings.crs or 4326)
+    else:
+        # Areas in the units of the CRS, as in the training data
+        hexagon_areas = shapely.area(np.asarray(cells.geometry.values))
+    return hexagon_stats_from_groups(groups, heights, areas, hexagon_areas, index=index)
+
+
+def multi_radius_column(column, radius):
+    """
+    Returns the name of a statistic column for hexagons of a given radius, 
+    such as 'centroid_stat_mean_160m'.
+    """
+
+    return f"{column}_{radius:g}m"
+
+
+def multi_radius_keys(radii):
+    """
+    Returns the names of the `centroid_stat_*` columns returned by 
+    `hexagon_stats_multi_radius` for a list of radii.
+    """
+
+    columns = hexagon_stats_from_groups([], [], [], []).columns
+    return [multi_radius_column(column, radius) for radius in radii for column in columns]
+
+
+def hexagon_stats_multi_radius(buildings, longitudes, latitudes, radii, projected=False):
+    """
+    Calculate statistical measures of building heights in hexagons of 
+    several radii around the same centers, from one spatial query.
+
+    Hexagons of `create_hexagon` around the same center are nested, so 
+    the buildings of a smaller hexagon are a subset of the buildings of 
+    the largest one. The buildings of the largest hexagons are found with 
+    a single query of an STRtree over the building centroids, and the 
+    candidate pairs are then only filtered for every smaller radius.
+
+    Parameters:
+    buildings (gpd.GeoDataFrame): A GeoDataFrame containing building data 
+        with geometry and height information, as in `hexagon_stats_batch`.
+    longitudes (array-like): The longitudes of the centers.
+    latitudes (array-like): The latitudes of the centers.
+    radii (list): Radii of the hexagons, in meters.
+    projected (bool, optional): Compute the areas in square meters, as in 
+        `hexagon_stats_batch`. Defaults to False.
+
+    Returns:
+    pd.DataFrame: One row per center, with the index of `longitudes` if it 
+    is a pandas Series, and the `centroid_stat_*` columns of every radius 
+    in the order of `radii`, named by `multi_radius_column`.
+
+    Raises:
+    ValueError: If `radii` is empty or a radius is not positive.
+
+    Example:
+    >>> stats = hexagon_stats_multi_radius(buildings_gdf, weather['Lon'],
+    ...                                    weather['Lat'], [80, 160, 320])
+    """
+
+    radii = list(radii)
+    if not radii or min(radii) <= 0:
+        raise ValueError("radii must be a non-empty list of positive radii.")
+    index = longitudes.index if isinstance(longitudes, pd.Series) else None
+    hexagons = {radius: create_hexagons(longitudes, latitudes, radius).values
+                for radius in radii}
+
+    centroid_x, centroid_y, footprint_area = building_arrays(buildings, projected=projected)
+    heights = buildings['height'].to_numpy(dtype=float)
+
+    # Candidate pairs of the largest hexagons, from one query
+    largest = max(radii)
+    tree = shapely.STRtree(shapely.points(centroid_x, centroid_y))
+    hexagon_pos, building_pos = tree.query(hexagons[largest], predicate='contains')
+
+    frames = []
+    for radius in radii:
+        if radius == largest:
+            keep = slice(None)
+        else:
+            # Keep the candidates inside the smaller hexagon of their center
+            keep = shapely.contains_xy(hexagons[radius][hexagon_pos],
+                                       centroid_x[building_pos], centroid_y[building_pos])
+        if projected:
+            hexagon_areas = equal_area_areas(hexagons[radius])
+        else:
+            hexagon_areas = shapely.area(np.asarray(hexagons[radius]))
+        stats = hexagon_stats_from_groups(hexagon_pos[keep], heights[building_pos[keep]],
+                                          footprint_area[building_pos[keep]], hexagon_areas,
+                                          index=index)
+        frames.append(stats.rename(columns=lambda column, r=radius:
+                                   multi_radius_column(column, r)))
+    return pd.concat(frames, axis=1)
+
+
+def seattle_height_acquire(cache=None, max_workers=DEFAULT_MAX_WORKERS):
     """
     Acquires building height information for Seattle city limits and 
-    stores it in a GeoJSON file.
+    stores it in a GeoParquet building store.
 
     This function reads the Seattle city limits from a provided GeoJSON
     file and expands its area slightly to ensure complete coverage. It 
     then generates quad keys for tiles within this area at a specified 
     zoom level, using these keys to retrieve building footprint data 
     from an online dataset. The function filters and processes the data,
-    extracting height information and storing it in a GeoJSON file for 
-    further use.
+    extracting height information and storing it in a spatially sorted 
+    GeoParquet file (see `heat_island.building_store`) for further use.
 
     Steps:
     1. Read Seattle city limits from a GeoJSON file.
     2. Generate quad keys for tiles within the area bounds.
-    3. Fetch building data for each quad key from an online dataset.
+    3. Check the tiles of the quad keys against the manifest of the store,
+    and fetch the tiles that changed concurrently from an online dataset.
     4. Extract and process height information from the building data.
-    5. Store the processed data in a GeoJSON file.
+    5. Replace the buildings of the changed tiles in the GeoParquet file.
+
+    Parameters:
+        cache (heat_island.tile_cache.TileCache, optional): 
+        Local cache of the downloaded tiles. Defaults to the cache 
+        returned by `get_default_cache()`.
+        max_workers (int, optional): 
+        Maximum number of tiles downloaded at the same time.
 
     Raises:
         ValueError: If multiple or no rows are found for a quad key in 
         the dataset.
 
     Output:
-        A GeoJSON file containing polygons representing building 
-        footprints with associated height data.
+        A GeoParquet file containing polygons representing building 
+        footprints with associated height, centroid, area and quad key 
+        data, and its manifest of tiles.
     """
 
     # # Example polygon
@@ -468,23 +861,54 @@ def seattle_height_acquire():
     aoi_geom = seattle.geometry[0]
     # Change the type to shapely.geometry.polygon.Polygon
     aoi_shape = shapely.geometry.shape(aoi_geom)
+    # Define the output file name for the building footprints
+    output_fn = os.path.join("data","seattle_building_footprints.parquet")
+
+    city_height_acquire(aoi_shape, output_fn, cache=cache, max_workers=max_workers)
+
+
+def city_height_acquire(boundary, output_path, cache=None, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Acquires building height information within the boundary of a city 
+    and stores it in a GeoParquet building store.
+
+    The quad keys of the tiles covering the slightly expanded boundary 
+    are generated at zoom level 9, and the building store is refreshed 
+    with the tiles that changed since the last run (see 
+    `heat_island.incremental_ingest`).
+
+    Parameters:
+        boundary (str, shapely.geometry or gpd.GeoDataFrame): 
+        Boundary of the city (see `read_boundary`).
+        output_path (str): 
+        Path of the `.parquet` building store.
+        cache (heat_island.tile_cache.TileCache, optional): 
+        Local cache of the downloaded tiles. Defaults to the cache 
+        returned by `get_default_cache()`.
+        max_workers (int, optional): 
+        Maximum number of tiles downloaded at the same time.
+
+    Returns:
+        list: Quad keys of the tiles that were downloaded again.
+
+    Raises:
+        ValueError: If multiple or no rows are found for a quad key in 
+        the dataset.
+
+    Example:
+    >>> city_height_acquire("data/portland_boundary.geojson",
+    ...                     "data/portland_building_footprints.parquet")
+    """
+
+    aoi_shape = read_boundary(boundary)
     # Get the bounds of the area of interest (AOI)
     minx, miny, maxx, maxy = aoi_shape.bounds
-    # For Seattle city limit:
-    # minx = -122.40985799299995
-    # miny = 47.64445376000003
-    # maxx = -122.24563167199994
-    # maxy = 47.73416571200005
     # Slightly increase the area of interest to ensure coverage
     minx = minx - 0.001 # minimum longitude
     miny = miny - 0.001 # minimum latitude
     maxx = maxx + 0.001 # maximum longitude
     maxy = maxy + 0.001 # maximum latitude
 
-    # Define the output file name for the building footprints
-    output_fn = os.path.join("data","seattle_building_footprints.geojson")
-
-
     # Initialize an empty set to store quad keys
     quad_keys = set()
     # Generate quad keys for tiles within the bounds at zoom level 9
@@ -495,122 +919,8 @@ def seattle_height_acquire():
     print(f"The input area spans {len(quad_keys)} tiles: {quad_keys}")
 
 
-    # Read the dataset links CSV file
-    df = pd.read_csv(
-        "https://minedbuildings.blob.core.windows.net/global-buildings/dataset-links.csv"
-    )
-
-
-    # Initialize index and a list to combine rows from different files
-    idx = 0
-    combined_rows = []
-
-    # Create a temporary directory to store downloaded files
-    with tempfile.TemporaryDirectory() as tmpdir:
-        # List to store temporary file names
-        tmp_fns = []
-        # Iterate over each quad key
-        for quad_key in tqdm(quad_keys):
-            # Find rows in the dataset that match the current quad key
-            rows = df[df["QuadKey"] == quad_key]
-            # Debug print statement - can be removed in production
-            # print(rows)
-
-            # If exactly one row is found for the quad key
-            if rows.shape[0] == 1:
-                # Get the URL of the GeoJSON file
-                url = rows.iloc[0]["Url"]
-                # Read the GeoJSON file from the URL
-                df2 = pd.read_json(url, lines=True)
-                # Convert geometry data to Shapely shapes
-                df2["geometry"] = df2["geometry"].apply(shapely.geometry.shape)
-                # Debug print statement - can be removed in production
-                # print(df2)
-
-                # Create a GeoDataFrame from the data
-                gdf = gpd.GeoDataFrame(df2, crs=4326)
-                gdf['height'] = gdf['properties'].apply(lambda x: x.get('height'))
-                gdf = gdf.drop(columns=['properties'])
-                # Debug print statement - can be removed in production
-                # print(gdf)
-
-                # Define the file name for the temporary file
-                fn = os.path.join(tmpdir, f"{quad_key}.geojson")
-                tmp_fns.append(fn)
-
-                # Write the GeoDataFrame to a GeoJSON file if it doesn't exist
-                if not os.path.exists(fn):
-                    gdf.to_file(fn, driver="GeoJSON")
-            # If multiple rows are found for a quad key, raise an error
-            elif rows.shape[0] > 1:
-                raise ValueError(f"Multiple rows found for QuadKey: {quad_key}")
-            # If no rows are found for a quad key, raise an error
-            else:
-                raise ValueError(f"QuadKey not found in dataset: {quad_key}")
-
-
-        # Merge each temporary GeoJSON files into a single file
-        for fn in tmp_fns:
-            with fiona.open(fn, "r") as f:
-                # Read each row in the file
-                for row in tqdm(f):
-                    row = dict(row)
-                    shape = shapely.geometry.shape(row["geometry"])
-
-                    # Check if the shape is within the area of interest
-                    if aoi_shape.contains(shape):
-                        properties = row["properties"]
-                        # Remove the 'id' key if it exists
-                        if "id" in row:
-                            del row["id"]
-
-                        # Extract the height value from properties,
-                        # assuming it's already a direct value and not a dict
-                        # This assumes that 'height' is directly stored in properties
-                        height = properties.get('height')
-
-                        # Create a new properties dictionary with only 'id' and 'height'
-                        new_properties = {"id": idx, "height": height}
-                        idx += 1
-
-                        # Update the row with the new properties
-                        row["properties"] = new_properties
-
-                        # Add the row to the combined rows list
-                        combined_rows.append(row)
-
-
-    # Define the schema for the output file
-    schema = {
-        "geometry": "Polygon",
-        "properties": {
-            "id": "int",
-            "height": "float"
-        }
-    }
-
-    # Write the combined rows to the output file with updated schema
-    with fiona.open(output_fn, "w", driver="GeoJSON", crs="EPSG:4326", schema=schema) as f:
-        for row in combined_rows:
-            # Make sure each row's attributes conform to the schema, including 'height'
-            properties = row['properties']
-            new_properties = {
-                'id': properties['id'],
-                # Get the 'height' value directly from the original properties dictionary
-                'height': properties.get('height')
-            }
-
-            # Check if 'height' value is missing）
-            if new_properties['height'] is None or new_properties['height'] == -1:
-                # Skip that polygon without height
-                continue
-
-            # Construct a new row dictionary to match the schema
-            new_row = {
-                'type': 'Feature',
-                'geometry': shapely.geometry.mapping(shapely.geometry.shape(row['geometry'])),
-                'properties': new_properties
-            }
-
-            # Write the new rows to the output file
-            f.write(new_row)
+    # Fetch and parse only the tiles that changed since the last run, and
+    # replace their buildings in the building store (see
+    # `heat_island.incremental_ingest`)
+    return update_building_store(output_path, quad_keys, aoi=aoi_shape, cache=cache,
+                                 max_workers=max_workers)
@@ -0,0 +1,292 @@
+"""
+incremental_ingest.py: incremental refresh of a city building store
+
+`seattle_height_acquire` used to rebuild the building store of a city from
+every tile of the dataset. This module keeps a manifest next to the store
+with the url and the validators (ETag, Last-Modified and size) of each tile
+it was built from, and stores the quad key of the tile of every building in
+a 'quadkey' column. On a rerun, each tile is checked with a HEAD request,
+only the tiles whose url or validators changed are downloaded and parsed,
+and the store is rewritten with the rows of these tiles replaced. The rows
+of unchanged tiles are copied with their precomputed columns, so a nightly
+refresh costs little more than the tiles that changed upstream.
+
+Functions:
+- `manifest_path`: Returns the path of the manifest of a building store.
+- `load_manifest`: Reads the manifest of a building store.
+- `tile_validators`: Returns the url, ETag, Last-Modified and size of a tile.
+- `changed_tiles`: Lists the tiles that changed since the manifest.
+- `update_building_store`: Refreshes the rows of the changed tiles of a
+    building store.
+
+Example Usage:
+>>> update_building_store("data/seattle_building_footprints.parquet",
+...                       [21230021, 21230030], aoi=seattle_boundary)
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import urllib.request
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from heat_island.dataset_links import load_dataset_links, tile_url
+from heat_island.tile_cache import get_default_cache
+from heat_island.tile_download import download_tiles, DEFAULT_MAX_WORKERS, DEFAULT_TIMEOUT
+from heat_island.building_store import write_building_store, read_building_store
+from heat_island.building_store import add_building_columns
+
+
+# Column of the building store with the quad key of the tile of each building
+QUADKEY_COLUMN = 'quadkey'
+# Suffix of the manifest file next to a building store
+MANIFEST_SUFFIX = '.manifest.json'
+
+
+def manifest_path(store_path):
+    """
+    Return the path of the manifest of a building store, such as
+    'seattle_building_footprints.parquet.manifest.json'.
+    """
+
+    return str(store_path) + MANIFEST_SUFFIX
+
+
+def load_manifest(store_path):
+    """
+    Read the manifest of a building store.
+
+    Parameters:
+    store_path (str): Path of the building store.
+
+    Returns:
+    dict: With an 'aoi' key (hash of the area of interest, or None) and a
+    'tiles' key mapping each quad key (int) to the validators returned by
+    `tile_validators`. Both are empty if the store has no manifest.
+    """
+
+    try:
+        with open(manifest_path(store_path), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {'aoi': None, 'tiles': {}}
+    tiles = {int(quad_key): meta for quad_key, meta in manifest.get('tiles', {}).items()}
+    return {'aoi': manifest.get('aoi'), 'tiles': tiles}
+
+
+def _save_manifest(store_path, manifest):
+    """
+    Write the manifest of a building store through a temporary file and a
+    rename.
+    """
+
+    path = manifest_path(store_path)
+    data = {'aoi': manifest['aoi'],
+            'tiles': {str(quad_key): meta for quad_key, meta in sorted(manifest['tiles'].items())}}
+    with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(os.path.abspath(path)),
+                                     prefix=".tmp-", suffix=".json", delete=False,
+                                     encoding="utf-8") as tmp:
+        json.dump(data, tmp, indent=1)
+    os.replace(tmp.name, path)
+
+
+def _aoi_hash(aoi):
+    """
+    Return a hash of the area of interest, or None without one.
+    """
+
+    if aoi is None:
+        return None
+    return hashlib.sha256(shapely.to_wkb(shapely.normalize(aoi))).hexdigest()[:16]
+
+
+def tile_validators(url, timeout=DEFAULT_TIMEOUT):
+    """
+    Return the validators of a tile from a HEAD request, without
+    downloading it.
+
+    Parameters:
+    url (str): Url of the tile.
+    timeout (float, optional): Timeout of the request, in seconds.
+
+    Returns:
+    dict: The 'url', 'etag', 'last_modified' and 'size' (in bytes) of the
+    tile. Headers missing from the response are None.
+
+    Raises:
+    OSError: If the request fails.
+    """
+
+    request = urllib.request.Request(url, method="HEAD")
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        size = response.headers.get("Content-Length")
+        return {'url': url,
+                'etag': response.headers.get("ETag"),
+                'last_modified': response.headers.get("Last-Modified"),
+                'size': int(size) if size is not None else None}
+
+
+def changed_tiles(quad_keys, manifest, links=None, timeout=DEFAULT_TIMEOUT):
+    """
+    List the tiles that changed since a manifest.
+
+    A tile changed if it is not in the manifest, if its url changed (a
+    new release of the dataset), or if its ETag, Last-Modified or size
+    changed. A known tile whose HEAD request fails is kept as unchanged,
+    so an unreachable server does not drop buildings from the store.
+
+    Parameters:
+    quad_keys (list): Quad keys of the tiles at zoom level 9.
+    manifest (dict): Manifest returned by `load_manifest`.
+    links (dict, optional): Index returned by `load_dataset_links`.
+    timeout (float, optional): Timeout of each request, in seconds.
+
+    Returns:
+    tuple: The list of changed quad keys, and a dict of the current
+    validators of every quad key.
+
+    Raises:
+    ValueError: If multiple or no rows are found for a quad key.
+    OSError: If the HEAD request of a new tile fails.
+    """
+
+    if links is None:
+        links = load_dataset_links()
+    changed = []
+    validators = {}
+    for quad_key in quad_keys:
+        quad_key = int(quad_key)
+        url = tile_url(quad_key, links)
+        previous = manifest['tiles'].get(quad_key)
+        try:
+            current = tile_validators(url, timeout=timeout)
+        except OSError:
+            if previous is None or previous['url'] != url:
+                raise
+            # Offline: keep the rows of the known tile
+            validators[quad_key] = previous
+            continue
+        validators[quad_key] = current
+        if current != previous:
+            changed.append(quad_key)
+    return changed, validators
+
+
+def _filter_buildings(buildings, aoi):
+    """
+    Keep the buildings within the area of interest that have a height.
+    """
+
+    if aoi is not None:
+        buildings = buildings[buildings.geometry.within(aoi)]
+    return buildings[buildings['height'].notna() & (buildings['height'] != -1)]
+
+
+def update_building_store(path, quad_keys, aoi=None, links=None, cache=None,
+                          max_workers=DEFAULT_MAX_WORKERS, timeout=DEFAULT_TIMEOUT):
+    """
+    Refresh a building store from the tiles of several quad keys, only
+    downloading the tiles that changed upstream.
+
+    The tiles are compared with the manifest of the store (see
+    `changed_tiles`). The changed tiles are fetched and parsed, bypassing
+    the stale tile cache entries of tiles that changed under the same url,
+    and their buildings replace the rows of the same quad keys in the
+    store. Rows of tiles no longer in `quad_keys` are removed. The store
+    is written to a temporary file and renamed into place before the
+    manifest is updated, so an interrupted refresh is redone on the next
+    run. If no tile changed, the store is not rewritten.
+
+    Parameters:
+    path (str): Path of the `.parquet` building store, which may not
+        exist yet.
+    quad_keys (list): Quad keys of the tiles at zoom level 9.
+    aoi (shapely.geometry, optional): Area of interest in EPSG:4326. Only
+        the buildings within it are stored. A different area than in the
+        manifest refreshes every tile. Defaults to the whole tiles.
+    links (dict, optional): Index returned by `load_dataset_links`.
+    cache (heat_island.tile_cache.TileCache, optional): Tile cache.
+    max_workers (int, optional): Maximum number of tiles downloaded at the
+        same time.
+    timeout (float, optional): Timeout of the network operations of one
+        tile, in seconds.
+
+    Returns:
+    list: Quad keys of the tiles that were downloaded again.
+
+    Raises:
+    ValueError: If `path` is not a `.parquet` file, or if multiple or no
+        rows are found for a quad key.
+
+    Example:
+    >>> update_building_store("data/seattle_building_footprints.parquet",
+    ...                       quad_keys, aoi=aoi_shape)
+    [21230030]
+    """
+
+    if not str(path).endswith('.parquet'):
+        raise ValueError("Incorrect file format: Expect '.parquet'")
+    if links is None:
+        links = load_dataset_links()
+    if cache is None:
+        cache = get_default_cache()
+
+    manifest = load_manifest(path)
+    aoi_hash = _aoi_hash(aoi)
+    existing = None
+    if os.path.exists(path) and manifest['aoi'] == aoi_hash:
+        existing = read_building_store(path)
+        if QUADKEY_COLUMN not in existing.columns:
+            existing = None
+    if existing is None:
+        # Without rows to keep, every tile must be fetched
+        manifest = {'aoi': aoi_hash, 'tiles': {}}
+
+    changed, validators = changed_tiles(quad_keys, manifest, links, timeout)
+    removed = set(manifest['tiles']) - set(validators)
+    print(f"{len(changed)} of {len(validators)} tiles changed, {len(removed)} removed")
+    if not changed and not removed and existing is not None:
+        return changed
+
+    # A tile that changed under the same url is stale in the tile cache
+    for quad_key in changed:
+        previous = manifest['tiles'].get(quad_key)
+        if previous is not None and previous['url'] == validators[quad_key]['url']:
+            cache.discard(quad_key, previous['url'])
+
+    bbox = aoi.bounds if aoi is not None else None
+    fetched = download_tiles(changed, links=links, cache=cache, max_workers=max_workers,
+                             timeout=timeout, bbox=bbox, quad_key_column=QUADKEY_COLUMN)
+    fetched = _filter_buildings(fetched, aoi)
+    fetched = gpd.GeoDataFrame({
+        'height': fetched['height'].astype(float).to_numpy(),
+        QUADKEY_COLUMN: fetched[QUADKEY_COLUMN].to_numpy(dtype=np.int64)
+    }, geometry=fetched.geometry.to_numpy(), crs=4326)
+    # Compute the columns of the new rows; kept rows already have them
+    fetched = add_building_columns(fetched)
+
+    # Replace the rows of the changed and removed tiles
+    frames = [fetched]
+    if existing is not None:
+        stale = np.isin(existing[QUADKEY_COLUMN].to_numpy(), list(set(changed) | removed))
+        frames.insert(0, existing[~stale].drop(columns=['id'], errors='ignore'))
+    frames = [frame for frame in frames if len(frame)] or [fetched]
+    buildings = gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), crs=4326)
+    buildings.insert(0, 'id', np.arange(len(buildings)))
+
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(path)),
+                                     prefix=".tmp-", suffix=".parquet", delete=False) as tmp:
+        pass
+    try:
+        write_building_store(buildings, tmp.name)
+        os.replace(tmp.name, path)
+    except BaseException:
+        if os.path.exists(tmp.name):
+            os.remove(tmp.name)
+        raise
+    _save_manifest(path, {'aoi': aoi_hash, 'tiles': validators})
+    return changed
@@ -10,11 +10,21 @@ model evaluation using Root Mean Square Error (RMSE).
 The module utilizes libraries such as geopandas, sklearn, and joblib
 for handling geospatial data, machine learning processes,
 and model serialization respectively.
+Saved models can be kept loaded in a `ModelRegistry`,
+which predicts many points at once with `predict_many`.
 """
 import os.path
+import time
 import joblib
+import numpy as np
+import pandas as pd
 import geopandas as gpd
+from sklearn.base import clone
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401 pylint: disable=unused-import
 from sklearn.model_selection import train_test_split, GridSearchCV
+from sklearn.model_selection import HalvingGridSearchCV, RandomizedSearchCV
+from sklearn.model_selection import KFold, ParameterGrid, ParameterSampler
+from sklearn.model_selection import cross_val_score
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.neighbors import KNeighborsRegressor
 from sklearn.linear_model import LinearRegression
@@ -22,12 +32,17 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import mean_squared_error
 
 
-def get_keys():
+def get_keys(terrain: bool = False):
     """
     Returns a predefined list of feature keys used in the dataset for model
     training. These keys include statistical measures
     related to centroids and geographical coordinates.
 
+    Args:
+        terrain (bool, optional): also include the elevation statistics
+        of `terrain_features.terrain_stats`, before the coordinates.
+        Defaults to False.
+
     Returns:
         list: list of default keys for features
     """
@@ -38,24 +53,52 @@ def get_keys():
                 centroid+'min', centroid+'25%', centroid+'50%',
                 centroid+'75%', centroid+'max', 'Lat', 'Lon'
                 ]
+    if terrain:
+        features[-2:-2] = ['terrain_mean', 'terrain_min', 'terrain_max',
+                           'terrain_std', 'terrain_slope']
     return features
 
 
-def find_best_estimator(x_train, y_train, scaler):
+SEARCH_METHODS = ('grid', 'halving', 'random')
+
+
+def find_best_estimator(x_train, y_train, scaler, search: str = 'grid',
+                        n_jobs: int = -1, cv: int = 5, n_iter: int = 10,
+                        time_budget: float = None):
     """
     Conducts hyperparameter tuning for KNN, Linear Regression,
-    and Random Forest Regressor models using GridSearchCV.
+    and Random Forest Regressor models.
     It evaluates various configurations to determine the optimal settings
     for each model type based on the training data.
+    The searches of the three models run one after the other,
+    each fitting its candidates on `n_jobs` processes,
+    share one cross-validation splitter,
+    and the fit time of each model is printed.
 
     Args:
         x_train (df): training data input
         y_train (df): true value of training dataset
         scaler (scaler): standard scaler for transforming
+        search (str, optional): 'grid' for GridSearchCV,
+        'halving' for HalvingGridSearchCV (successive halving),
+        or 'random' for a randomized search. Defaults to 'grid'.
+        n_jobs (int, optional): number of processes fitting the candidates
+        of each search, -1 for one per core. Defaults to -1.
+        cv (int, optional): number of folds. Defaults to 5.
+        n_iter (int, optional): number of sampled settings
+        of the randomized search, at most the number of settings
+        of each model. Defaults to 10.
+        time_budget (float, optional): seconds after which the randomized
+        search of a model stops sampling new settings. Defaults to None.
+
+    Raises:
+        ValueError: If `search` is not one of SEARCH_METHODS
 
     Returns:
         dict: best KNN, LR, RFR model
     """
+    if search not in SEARCH_METHODS:
+        raise ValueError(f"search must be one of {SEARCH_METHODS}")
     models = {
         'KNN': KNeighborsRegressor(weights='distance'),
         'LinearRegression': LinearRegression(),
@@ -70,15 +113,73 @@ def find_best_estimator(x_train, y_train, scaler):
             'max_depth': [2, 5, 10, 20]
         }
     }
+    # The same folds are used for every model
+    splitter = KFold(n_splits=cv)
+    x_std = scaler.transform(x_train)
+    # The searches run one at a time, so the `n_jobs` processes of a
+    # search are not shared with the others
     best_estimators = {}
-    for model_name, model_inst in models.items():
-        grid_search = GridSearchCV(model_inst, param_grid[model_name],
-                                   cv=5, scoring='neg_mean_squared_error')
-        grid_search.fit(scaler.transform(x_train), y_train)
-        best_estimators[model_name] = grid_search.best_estimator_
+    for model_name, estimator in models.items():
+        estimator, elapsed = _search(estimator, param_grid[model_name], x_std,
+                                     y_train, splitter, search, n_iter,
+                                     time_budget, n_jobs)
+        best_params = {key: estimator.get_params()[key]
+                       for key in param_grid[model_name]}
+        print(f"{model_name} fitted in {elapsed:.2f} s, best: {best_params}")
+        best_estimators[model_name] = estimator
     return best_estimators
 
 
+def _search(estimator, grid, x_std, y_train, splitter, search, n_iter,
+            time_budget, n_jobs):
+    """
+    Runs the hyperparameter search of one model and
+    returns its best estimator and the time it took.
+    """
+    start = time.perf_counter()
+    scoring = 'neg_mean_squared_error'
+    # Sample each setting at most once
+    n_iter = min(n_iter, len(ParameterGrid(grid)))
+    if search == 'random' and time_budget is not None:
+        best = _budgeted_search(estimator, grid, x_std, y_train, splitter,
+                                n_iter, time_budget, n_jobs)
+    else:
+        if search == 'grid':
+            searcher = GridSearchCV(estimator, grid, cv=splitter, scoring=scoring,
+                                    n_jobs=n_jobs)
+        elif search == 'halving':
+            searcher = HalvingGridSearchCV(estimator, grid, cv=splitter,
+                                           scoring=scoring, n_jobs=n_jobs,
+                                           random_state=0)
+        else:
+            searcher = RandomizedSearchCV(estimator, grid, n_iter=n_iter,
+                                          cv=splitter, scoring=scoring,
+                                          n_jobs=n_jobs, random_state=0)
+        searcher.fit(x_std, y_train)
+        best = searcher.best_estimator_
+    return best, time.perf_counter() - start
+
+
+def _budgeted_search(estimator, grid, x_std, y_train, splitter, n_iter,
+                     time_budget, n_jobs):
+    """
+    Randomized search that stops sampling settings once `time_budget`
+    seconds are spent. At least one setting is always evaluated.
+    """
+    start = time.perf_counter()
+    sampler = ParameterSampler(grid, n_iter=n_iter, random_state=0)
+    best_score, best_params = -np.inf, {}
+    for params in sampler:
+        score = cross_val_score(clone(estimator).set_params(**params), x_std,
+                                y_train, cv=splitter, n_jobs=n_jobs,
+                                scoring='neg_mean_squared_error').mean()
+        if score > best_score:
+            best_score, best_params = score, params
+        if time.perf_counter() - start > time_budget:
+            break
+    return clone(estimator).set_params(**best_params).fit(x_std, y_train)
+
+
 def get_scores(x_test, y_test, best_estimators, scaler):
     """
     Calculates and compares the Root Mean Square Error (RMSE)
@@ -104,7 +205,9 @@ def get_scores(x_test, y_test, best_estimators, scaler):
 
 def train(data_path: str, features: list = None,
           target: str = 'Ave temp annual_F',
-          save_path: str = '', fname: str = 'model.bin'):
+          save_path: str = '', fname: str = 'model.bin',
+          search: str = 'grid', n_jobs: int = -1, time_budget: float = None,
+          terrain: bool = False):
     """
      Integrates the complete workflow for training a model,
      including data preparation,feature selection, model optimization,
@@ -120,18 +223,28 @@ def train(data_path: str, features: list = None,
         Defaults to 'Ave temp annual_F'.
         save_path (str, optional): save directory. Defaults to ''.
         fname (str, optional): name of the save file. Defaults to 'model.bin'.
+        search (str, optional): hyperparameter search method,
+        see `find_best_estimator`. Defaults to 'grid'.
+        n_jobs (int, optional): number of processes of each
+        hyperparameter search. Defaults to -1.
+        time_budget (float, optional): time budget of the randomized
+        search of each model, in seconds. Defaults to None.
+        terrain (bool, optional): train on the default keys with the
+        terrain statistics, see `get_keys`. Only used if `features`
+        is None. Defaults to False.
     """
     if fname[-4:] != '.bin':
         raise ValueError("Save file must be `.bin` format")
     if features is None:
-        features = get_keys()
+        features = get_keys(terrain=terrain)
     x, y = clean_data(data_path, features, target)
     x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=0.2,
                                                         random_state=0)
     scale = StandardScaler()
     scale.fit(x_train)
 
-    best_estimators = find_best_estimator(x_train, y_train, scale)
+    best_estimators = find_best_estimator(x_train, y_train, scale, search=search,
+                                          n_jobs=n_jobs, time_budget=time_budget)
     model_scores = get_scores(x_test, y_test, best_estimators, scale)
 
     print(f"Model Scores: {model_scores}")
@@ -163,28 +276,34 @@ def predict(model, scale, raw_x):
 
 def clean_data(data_path: str, features: list, target: str):
     """
-    Reads and preprocesses data from a GeoJSON file,
+    Reads and preprocesses data from a GeoJSON or GeoParquet file,
     ensuring that the dataset only contains specified features and
     targets without any missing values.
     It prepares the data for further processing and
     analysis in machine learning workflows.
 
     Args:
-        data_path (str): path to data file (.geojson)
+        data_path (str): path to data file (.geojson, or .parquet
+        GeoParquet as written by `build_training_set`)
         features (list): list of features
         target (str): key for output
         idx (str): Weather station identifier
 
     Raises:
+        ValueError: file is neither .geojson nor .parquet
         KeyError: Unexpect .geojson file structure
 
     Returns:
         dataframe: cleaned feature dataframe
         dataframe: cleaned output dataframe
     """
-    if data_path[data_path.rfind('.')+1:] != 'geojson':
-        raise ValueError("Incorrect file format: Expect '.geojson'")
-    gdf = gpd.read_file(data_path)
+    extension = data_path[data_path.rfind('.')+1:]
+    if extension == 'geojson':
+        gdf = gpd.read_file(data_path)
+    elif extension == 'parquet':
+        gdf = gpd.read_parquet(data_path)
+    else:
+        raise ValueError("Incorrect file format: Expect '.geojson' or '.parquet'")
     all_col = features+[target]
     if not all(col in gdf.columns for col in all_col):
         raise KeyError("Incorrect dataset format")
@@ -194,7 +313,7 @@ def clean_data(data_path: str, features: list, target: str):
     return gdf[features], gdf[target]
 
 
-def load_model(path: str):
+def load_model(path: str, mmap_mode: str = None):
     """
     Facilitates the loading of a previously saved machine learning model
     and its corresponding scaler from a specified file path.
@@ -203,6 +322,9 @@ def load_model(path: str):
 
     Args:
         path (str): path to saved model file
+        mmap_mode (str, optional): memory-map the arrays of the model
+        (e.g. 'r') instead of reading them, see `joblib.load`.
+        Defaults to None.
 
     Raises:
         ValueError: If there is no file according to `path`
@@ -219,7 +341,7 @@ def load_model(path: str):
         raise ValueError("Input path does not exist")
     if path[-4:] != '.bin':
         raise ValueError("Incorrect file type")
-    tmp = joblib.load(path)
+    tmp = joblib.load(path, mmap_mode=mmap_mode)
     if 'model' not in tmp.keys() or 'scaler' not in tmp.keys():
         raise ValueError("Unexpected file structure")
     return tmp['model'], tmp['scaler']
@@ -270,3 +392,108 @@ def save_model(model, scaler, direc: str, fname: str):
     joblib.dump(output, direc+fname)
     print(f"Save file at {direc+fname}")
     return direc+fname
+
+
+class ModelRegistry:
+    """
+    Keeps saved models and their scalers loaded, so that each model file
+    is read once and then reused for every prediction.
+    A model is loaded again only if its file is modified.
+
+    Args:
+        mmap_mode (str, optional): passed to `load_model`; 'r' memory-maps
+        the arrays of large models such as RandomForests.
+        Defaults to None.
+    """
+
+    def __init__(self, mmap_mode: str = None):
+        self.mmap_mode = mmap_mode
+        self._models = {}
+
+    def __len__(self):
+        return len(self._models)
+
+    def get(self, path: str):
+        """
+        Returns the model and scaler saved at `path`,
+        loading them on first use.
+
+        Args:
+            path (str): path to saved model file
+
+        Returns:
+            regressor: regressor model
+            scaler: scale for prediction
+        """
+        key = os.path.abspath(str(path))
+        mtime = os.path.getmtime(key) if os.path.isfile(key) else None
+        entry = self._models.get(key)
+        if entry is None or entry[0] != mtime:
+            model, scaler = load_model(key, mmap_mode=self.mmap_mode)
+            entry = (mtime, model, scaler, feature_names(scaler))
+            self._models[key] = entry
+        return entry[1], entry[2]
+
+    def predict_many(self, path: str, features_df):
+        """
+        Predicts the target of every row of `features_df`
+        with the model saved at `path`, in a single call of the model.
+        The columns are checked against the features the model
+        was trained on (`get_keys()` for models without feature names)
+        and put in that order.
+
+        Args:
+            path (str): path to saved model file
+            features_df (dataframe): one row of features per point
+
+        Raises:
+            KeyError: If a feature of the model is missing
+
+        Returns:
+            numpy array: predicted value of every row
+        """
+        model, scaler = self.get(path)
+        keys = self._models[os.path.abspath(str(path))][3]
+        missing = [key for key in keys if key not in features_df.columns]
+        if missing:
+            raise KeyError(f"Missing features: {missing}")
+        # Stack the columns in the order of the model
+        x = np.column_stack([features_df[key].to_numpy(dtype=float)
+                             for key in keys])
+        if hasattr(scaler, 'feature_names_in_'):
+            # Scalers fitted on a dataframe expect the same column names
+            x = pd.DataFrame(x, columns=keys)
+        return model.predict(scaler.transform(x))
+
+    def clear(self):
+        """
+        Forgets every loaded model.
+        """
+        self._models.clear()
+
+
+def feature_names(scaler):
+    """
+    Returns the features a scaler was fitted on,
+    or the default keys if it was fitted without names.
+    """
+    names = getattr(scaler, 'feature_names_in_', None)
+    if names is None:
+        return get_keys()
+    return list(names)
+
+
+_DEFAULT_REGISTRY = None
+
+
+def get_registry():
+    """
+    Returns the registry shared by the whole process.
+
+    Returns:
+        ModelRegistry: registry of loaded models
+    """
+    global _DEFAULT_REGISTRY  # pylint: disable=global-statement
+    if _DEFAULT_REGISTRY is None:
+        _DEFAULT_REGISTRY = ModelRegistry()
+    return _DEFAULT_REGISTRY
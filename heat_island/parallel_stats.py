@@ -0,0 +1,169 @@
+"""
+parallel_stats.py: process-pool hexagon statistics over shared building arrays
+
+The weighted percentiles of the cells of a whole metropolitan area are CPU
+bound. This module splits the cells into spatially coherent chunks and
+computes the statistics of the chunks on a pool of worker processes. The
+centroid coordinates, footprint areas and heights of the buildings are
+copied once into a `multiprocessing.shared_memory` block that every worker
+maps, so the buildings are never pickled: a task only carries the WKB of
+the hexagons of its chunk.
+
+Functions:
+- `hexagon_stats_parallel`: Calculates the same table as
+    `hexagon_stats_batch`, on a pool of worker processes.
+
+Example Usage:
+>>> grid = hexagon_grid("data/seattle_boundary.geojson", 160)
+>>> stats = hexagon_stats_parallel(buildings, grid.geometry, max_workers=8)
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from heat_island.building_store import building_arrays
+from heat_island.geo_process import equal_area_areas
+from heat_island.height_acquire import hexagon_stats_from_groups, hexagon_stats_from_points
+
+
+# Default number of hexagons per task
+DEFAULT_CHUNK_SIZE = 2048
+
+# Building arrays of a worker process, attached by `_init_worker`
+_BUILDINGS = {}
+
+
+def _init_worker(name, n_buildings):
+    """
+    Attach a worker process to the shared building arrays, stored as the
+    rows (x, y, area, height) of a (4, n_buildings) float64 array sorted
+    by x.
+    """
+
+    # The worker shares the resource tracker of the parent process, which
+    # unlinks the block once every chunk is done
+    shm = shared_memory.SharedMemory(name=name)
+    _BUILDINGS['shm'] = shm
+    _BUILDINGS['arrays'] = np.ndarray((4, n_buildings), dtype=np.float64, buffer=shm.buf)
+
+
+def _chunk_stats(arrays, hexagons, hexagon_areas):
+    """
+    Calculate the statistics of a chunk of hexagons from the building
+    arrays. Only the buildings in the x range of the chunk are searched.
+    """
+
+    x, y, areas, heights = arrays
+    minx, _, maxx, _ = shapely.total_bounds(hexagons)
+    start = np.searchsorted(x, minx, side='left')
+    stop = np.searchsorted(x, maxx, side='right')
+
+    return hexagon_stats_from_points(x[start:stop], y[start:stop], heights[start:stop],
+                                     areas[start:stop], hexagons, hexagon_areas).to_numpy()
+
+
+def _worker_chunk_stats(hexagons_wkb, hexagon_areas):
+    """
+    Task of a worker process: statistics of one chunk of hexagons.
+    """
+
+    return _chunk_stats(_BUILDINGS['arrays'], shapely.from_wkb(hexagons_wkb),
+                        hexagon_areas)
+
+
+def hexagon_stats_parallel(buildings, hexagons, max_workers=None,
+                           chunk_size=DEFAULT_CHUNK_SIZE, projected=False):
+    """
+    Calculate statistical measures of building heights for many hexagons
+    on a pool of worker processes.
+
+    The result is the same table as `hexagon_stats_batch`. The hexagons
+    are sorted along a Hilbert curve and split into chunks of
+    `chunk_size` hexagons, so that each chunk covers a compact area and
+    only needs the buildings around it. The buildings are sorted by
+    longitude in a shared memory block, and each task finds the buildings
+    of its chunk with a binary search.
+
+    Parameters:
+    buildings (gpd.GeoDataFrame): A GeoDataFrame containing building data
+        with geometry and height information, as in `hexagon_stats_batch`.
+    hexagons (gpd.GeoSeries, gpd.GeoDataFrame or list): Hexagon polygons
+        representing the areas of interest, in the CRS of `buildings`.
+    max_workers (int, optional): Number of worker processes. Defaults to
+        the number of CPUs. With 1, the chunks are processed in the
+        calling process.
+    chunk_size (int, optional): Number of hexagons per task.
+    projected (bool, optional): Compute the areas in square meters, as in
+        `hexagon_stats_batch`. Defaults to False.
+
+    Returns:
+    pd.DataFrame: One row per hexagon, in the order of `hexagons`, with
+    the `centroid_stat_*` columns.
+
+    Raises:
+    ValueError: If `max_workers` or `chunk_size` is not positive.
+
+    Example:
+    >>> stats = hexagon_stats_parallel(buildings_gdf, hexagons, max_workers=4)
+    """
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_workers < 1 or chunk_size < 1:
+        raise ValueError("max_workers and chunk_size must be positive.")
+    if isinstance(hexagons, gpd.GeoDataFrame):
+        hexagons = hexagons.geometry
+    index = hexagons.index if isinstance(hexagons, pd.Series) else None
+    hexagons = gpd.GeoSeries(np.asarray(hexagons, dtype=object), crs=buildings.crs)
+    if projected:
+        hexagon_areas = equal_area_areas(hexagons.values, crs=buildings.crs or 4326)
+    else:
+        # Areas in the units of the CRS, as in the training data
+        hexagon_areas = shapely.area(np.asarray(hexagons.values))
+
+    # Split the hexagons into spatially coherent chunks
+    order = np.empty(0, dtype=np.int64)
+    if len(hexagons):
+        centroids = gpd.GeoSeries(shapely.centroid(np.asarray(hexagons.values)))
+        order = np.argsort(centroids.hilbert_distance().to_numpy(), kind='stable')
+    chunks = [order[i:i + chunk_size] for i in range(0, len(order), chunk_size)]
+
+    # Building arrays sorted by x
+    centroid_x, centroid_y, footprint_area = building_arrays(buildings, projected=projected)
+    by_x = np.argsort(centroid_x, kind='stable')
+    n_buildings = len(by_x)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, 4 * n_buildings * 8))
+    try:
+        arrays = np.ndarray((4, n_buildings), dtype=np.float64, buffer=shm.buf)
+        arrays[0] = centroid_x[by_x]
+        arrays[1] = centroid_y[by_x]
+        arrays[2] = footprint_area[by_x]
+        arrays[3] = buildings['height'].to_numpy(dtype=float)[by_x]
+
+        geometries = hexagons.values
+        if max_workers == 1:
+            results = [_chunk_stats(arrays, geometries[chunk].to_numpy(),
+                                    hexagon_areas[chunk]) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                     initargs=(shm.name, n_buildings)) as executor:
+                results = list(executor.map(
+                    _worker_chunk_stats,
+                    [shapely.to_wkb(geometries[chunk].to_numpy()) for chunk in chunks],
+                    [hexagon_areas[chunk] for chunk in chunks]))
+        del arrays
+    finally:
+        shm.close()
+        shm.unlink()
+
+    # Put the rows of the chunks back in the order of the hexagons
+    columns = hexagon_stats_from_groups([], [], [], []).columns
+    values = np.full((len(hexagons), len(columns)), np.nan)
+    for chunk, result in zip(chunks, results):
+        values[chunk] = result
+    return pd.DataFrame(values, columns=columns, index=index)
@@ -0,0 +1,524 @@
+"""
+pipeline.py: full-city batch prediction of temperatures
+
+`heat_island_main.py` predicts the temperature of one hexagon per click.
+This module predicts a whole heat map at once: the boundary of a city is
+covered with a hexagonal grid, the building statistics of every cell are
+computed with one spatial join over the buildings of the building store,
+and the model is applied once to the feature matrix of all cells.
+
+Functions:
+- `cell_features`: Computes the model features of every cell of a grid.
+- `predict_cells`: Predicts the temperature of the cells with features.
+- `write_cells`: Writes predicted cells to a GeoJSON or GeoParquet file.
+- `write_raster`: Rasterizes predicted cells into a GeoTIFF.
+- `city_heatmap`: Runs the whole pipeline for a city.
+- `predict_coordinates`: Predicts the temperature of the hexagons centered 
+    on a list of coordinates.
+- `read_points`: Reads the coordinates of a CSV or GeoJSON file of points.
+- `write_points`: Writes points and their predictions to a CSV or GeoJSON 
+    file.
+- `predict_points`: Predicts the temperature of every point of a file and 
+    streams the results to a CSV or GeoJSON file.
+
+Example Usage:
+>>> cells = city_heatmap("data/seattle_boundary.geojson",
+...                      "data/seattle_building_footprints.parquet",
+...                      "data/seattle_model.bin",
+...                      output_path="seattle_heatmap.parquet",
+...                      raster_path="seattle_heatmap.tif")
+"""
+
+import os
+import json
+import math
+import tempfile
+from contextlib import contextmanager, nullcontext
+import numpy as np
+import pandas as pd
+import rasterio
+import rasterio.features
+from rasterio.transform import from_origin
+import geopandas as gpd
+
+from heat_island.geo_process import hexagon_grid, create_hexagons
+from heat_island.building_store import read_building_store
+from heat_island.height_acquire import hexagon_stats_batch
+from heat_island.parallel_stats import hexagon_stats_parallel
+from heat_island.building_memmap import BuildingArrays, hexagon_stats_arrays
+from heat_island.terrain_features import terrain_stats
+from heat_island.model import feature_names, get_registry, predict
+
+
+# Default radius of the cells, in meters, as used for the training data
+DEFAULT_RADIUS = 160
+# Name of the column of predicted temperatures
+PREDICTION_COLUMN = 'predicted_temp_F'
+# Default number of points of a file predicted at once by `predict_points`
+DEFAULT_POINTS_CHUNK_SIZE = 100000
+# Accepted names of the coordinate columns of a CSV file of points, in
+# lower case
+LATITUDE_NAMES = ('lat', 'latitude')
+LONGITUDE_NAMES = ('lon', 'lng', 'long', 'longitude')
+# Suffixes of the GeoJSON files of points, and of all files of points,
+# read by `read_points` and written by `write_points`
+GEOJSON_FORMATS = ('.geojson', '.json')
+POINT_FORMATS = ('.csv',) + GEOJSON_FORMATS
+POINT_FORMAT_ERROR = "Incorrect file format: Expect '.csv', '.geojson' or '.json'"
+
+
+def _open_buildings(building_store, bbox):
+    """
+    Open the building arrays of a directory, or read the buildings of a
+    building store within a bounding box.
+    """
+
+    if os.path.isdir(building_store):
+        return BuildingArrays(building_store)
+    return read_building_store(building_store, bbox=tuple(bbox))
+
+
+def cell_features(grid, buildings, max_workers=None, terrain_path=None):
+    """
+    Compute the model features of every cell of a grid.
+
+    Parameters:
+    grid (gpd.GeoDataFrame): Cells returned by `hexagon_grid`.
+    buildings (gpd.GeoDataFrame or BuildingArrays): Buildings around the
+        cells, with height information, or memory-mapped building arrays.
+    max_workers (int, optional): Number of worker processes computing the
+        statistics (see `hexagon_stats_parallel`). Defaults to computing
+        them in the calling process.
+    terrain_path (str, optional): Path of a DEM, such as the trimmed
+        terrain of `terrain_acquire`, to add the elevation statistics of
+        the cells (see `terrain_stats`).
+
+    Returns:
+    gpd.GeoDataFrame: The grid with the `centroid_stat_*` columns, and the
+    `terrain_*` columns with a DEM. Cells without buildings have NaN
+    statistics.
+    """
+
+    if isinstance(buildings, BuildingArrays):
+        stats = hexagon_stats_arrays(buildings, grid.geometry)
+    elif max_workers is None:
+        stats = hexagon_stats_batch(buildings, grid.geometry)
+    else:
+        stats = hexagon_stats_parallel(buildings, grid.geometry, max_workers=max_workers)
+    if terrain_path is not None:
+        stats = stats.join(terrain_stats(grid.geometry, terrain_path))
+    return grid.join(stats)
+
+
+def predict_cells(cells, model, scale, features=None):
+    """
+    Predict the temperature of the cells whose features are complete.
+
+    The model is applied once to the feature matrix of all the cells.
+    Cells with missing features, such as cells without buildings, were
+    never seen in training and are left as NaN.
+
+    Parameters:
+    cells (gpd.GeoDataFrame): Cells with the features of the model.
+    model (regressor): Trained model returned by `load_model`.
+    scale (StandardScaler): Scaler of the model.
+    features (list, optional): Features of the model. Defaults to the
+        features the scaler was fitted on (see `feature_names`).
+
+    Returns:
+    gpd.GeoDataFrame: The cells with a `PREDICTION_COLUMN` column.
+    """
+
+    if features is None:
+        features = feature_names(scale)
+    complete = cells[features].notna().all(axis=1).to_numpy()
+    cells[PREDICTION_COLUMN] = np.nan
+    if complete.any():
+        cells.loc[complete, PREDICTION_COLUMN] = predict(
+            model, scale, cells.loc[complete, features])
+    return cells
+
+
+def write_cells(cells, path):
+    """
+    Write cells to a GeoJSON or GeoParquet file, keeping their 'cell_id'.
+
+    Parameters:
+    cells (gpd.GeoDataFrame): Cells indexed by 'cell_id'.
+    path (str): Path of a `.geojson` or `.parquet` file.
+
+    Returns:
+    str: Path of the written file.
+
+    Raises:
+    ValueError: If `path` is neither a `.geojson` nor a `.parquet` file.
+    """
+
+    path = str(path)
+    if path.endswith('.parquet'):
+        cells.reset_index().to_parquet(path)
+    elif path.endswith('.geojson'):
+        cells.reset_index().to_file(path, driver='GeoJSON')
+    else:
+        raise ValueError("Incorrect file format: Expect '.geojson' or '.parquet'")
+    return path
+
+
+def write_raster(cells, path, resolution=None, column=PREDICTION_COLUMN):
+    """
+    Rasterize the predictions of cells into a single-band GeoTIFF.
+
+    Parameters:
+    cells (gpd.GeoDataFrame): Cells in EPSG:4326 with a `column` column.
+    path (str): Path of the output `.tif` file.
+    resolution (float, optional): Size of a pixel, in degrees. Defaults to
+        a quarter of the width of a cell.
+    column (str, optional): Column to rasterize.
+
+    Returns:
+    str: Path of the written file.
+    """
+
+    minx, miny, maxx, maxy = cells.total_bounds
+    if resolution is None:
+        resolution = (cells.geometry.iloc[0].bounds[2]
+                      - cells.geometry.iloc[0].bounds[0]) / 4
+    width = max(1, math.ceil((maxx - minx) / resolution))
+    height = max(1, math.ceil((maxy - miny) / resolution))
+    transform = from_origin(minx, maxy, resolution, resolution)
+
+    # Burn the value of each predicted cell; pixels outside are nodata
+    predicted = cells[cells[column].notna()]
+    shapes = zip(predicted.geometry, predicted[column])
+    band = rasterio.features.rasterize(shapes, out_shape=(height, width),
+                                       transform=transform, fill=np.nan,
+                                       dtype='float32')
+
+    with rasterio.open(path, 'w', driver='GTiff', height=height, width=width,
+                       count=1, dtype='float32', crs=cells.crs,
+                       transform=transform, nodata=np.nan) as dst:
+        dst.write(band, 1)
+    return path
+
+
+def city_heatmap(boundary, building_store, model_path, radius_meters=DEFAULT_RADIUS,
+                 output_path=None, raster_path=None, resolution=None, max_workers=None,
+                 terrain_path=None):
+    """
+    Predict the temperature of every cell of a hexagonal grid over a city.
+
+    The boundary is tessellated with `hexagon_grid`, the buildings of the
+    whole grid are read from the building store in a single pass, the
+    statistics of all cells are computed with one spatial join, and the
+    model is applied once to all cells.
+
+    Parameters:
+    boundary (str or shapely.geometry): Boundary of the city, such as
+        "data/seattle_boundary.geojson".
+    building_store (str): Path of the building store of the city (see
+        `heat_island.building_store`), or of a directory of building
+        arrays (see `heat_island.building_memmap`), which keeps the memory
+        used independent of the size of the city.
+    model_path (str): Path of a model saved by `train`.
+    radius_meters (float, optional): Radius of the cells, in meters.
+        Defaults to the radius of the training data.
+    output_path (str, optional): `.geojson` or `.parquet` file to write
+        the cells to.
+    raster_path (str, optional): `.tif` file to write the heat map to.
+    resolution (float, optional): Pixel size of the raster, in degrees.
+    max_workers (int, optional): Number of worker processes computing the
+        statistics of the cells. Defaults to a single process.
+    terrain_path (str, optional): Path of a DEM, needed by models trained
+        with the terrain statistics (`train(..., terrain=True)`).
+
+    Returns:
+    gpd.GeoDataFrame: One row per cell, indexed by 'cell_id', with the
+    features and the `PREDICTION_COLUMN` of each cell.
+    """
+
+    model, scale = get_registry().get(model_path)
+    grid = hexagon_grid(boundary, radius_meters)
+    buildings = _open_buildings(building_store, grid.total_bounds)
+    cells = predict_cells(cell_features(grid, buildings, max_workers, terrain_path),
+                          model, scale)
+    print(f"Predicted {cells[PREDICTION_COLUMN].notna().sum()} of {len(cells)} cells")
+
+    if output_path is not None:
+        write_cells(cells, output_path)
+    if raster_path is not None:
+        write_raster(cells, raster_path, resolution=resolution)
+    return cells
+
+
+def predict_coordinates(latitudes, longitudes, building_store, model_path,
+                        radius_meters=DEFAULT_RADIUS, terrain_path=None):
+    """
+    Predict the temperature of the hexagons centered on many coordinates.
+
+    This is the batch version of the prediction of one clicked point in
+    `heat_island_main.py`: the hexagons of all points are created at once,
+    their statistics are computed with one spatial join, and the model is
+    applied once to all points.
+
+    Parameters:
+    latitudes (array-like): Latitudes of the points.
+    longitudes (array-like): Longitudes of the points.
+    building_store (str): Path of the building store of the city, or of a
+        directory of building arrays (see `city_heatmap`).
+    model_path (str): Path of a model saved by `train`.
+    radius_meters (float, optional): Radius of the hexagons, in meters.
+        Defaults to the radius of the training data.
+    terrain_path (str, optional): Path of a DEM, needed by models trained
+        with the terrain statistics.
+
+    Returns:
+    gpd.GeoDataFrame: One row per point, in the order of the points, with
+    the 'Lat' and 'Lon' of the point, the features of its hexagon and the
+    `PREDICTION_COLUMN`. Points without buildings around them are NaN.
+
+    Raises:
+    ValueError: If the numbers of latitudes and longitudes differ.
+
+    Example:
+    >>> predict_coordinates([47.606], [-122.333],
+    ...                     "data/seattle_building_footprints.parquet",
+    ...                     "data/seattle_model.bin")
+    """
+
+    latitudes = np.asarray(latitudes, dtype=float).ravel()
+    longitudes = np.asarray(longitudes, dtype=float).ravel()
+    if latitudes.shape != longitudes.shape:
+        raise ValueError("latitudes and longitudes must have the same length.")
+    model, scale = get_registry().get(model_path)
+    hexagons = create_hexagons(longitudes, latitudes, radius_meters)
+    points = gpd.GeoDataFrame({'Lat': latitudes, 'Lon': longitudes},
+                              geometry=hexagons.values, crs=4326)
+    buildings = _open_buildings(building_store, points.total_bounds)
+    return predict_cells(cell_features(points, buildings, terrain_path=terrain_path),
+                         model, scale)
+
+
+def _coordinate_columns(points, path):
+    """
+    Rename the latitude and longitude columns of a CSV file of points to
+    'Lat' and 'Lon'.
+    """
+
+    renames = {}
+    for target, names in (('Lat', LATITUDE_NAMES), ('Lon', LONGITUDE_NAMES)):
+        matches = [column for column in points.columns
+                   if str(column).strip().lower() in names]
+        if len(matches) != 1:
+            raise KeyError(f"Expect one {target} column in {path}, "
+                           f"named one of {names}, found {matches}")
+        renames[matches[0]] = target
+    return points.rename(columns=renames)
+
+
+def _point_chunks(path, chunk_size=None):
+    """
+    Yield the points of a CSV or GeoJSON file in chunks of `chunk_size`
+    points, as DataFrames with 'Lat' and 'Lon' columns. CSV files are
+    read one chunk at a time.
+    """
+
+    path = str(path)
+    if path.endswith('.csv'):
+        if chunk_size is None:
+            yield _coordinate_columns(pd.read_csv(path), path)
+            return
+        with pd.read_csv(path, chunksize=chunk_size) as reader:
+            for chunk in reader:
+                yield _coordinate_columns(chunk, path)
+    elif path.endswith(GEOJSON_FORMATS):
+        points = gpd.read_file(path)
+        if points.crs is not None:
+            points = points.to_crs(4326)
+        # Features without a geometry are points without coordinates
+        if not (points.geometry.isna() | (points.geom_type == 'Point')).all():
+            raise ValueError(f"Expect only Point geometries in {path}")
+        points = pd.DataFrame(points.drop(columns=points.geometry.name)).assign(
+            Lat=points.geometry.y.to_numpy(), Lon=points.geometry.x.to_numpy())
+        chunk_size = chunk_size or max(len(points), 1)
+        for start in range(0, len(points), chunk_size):
+            yield points.iloc[start:start + chunk_size]
+    else:
+        raise ValueError(POINT_FORMAT_ERROR)
+
+
+def read_points(path):
+    """
+    Read the coordinates of a CSV or GeoJSON file of points.
+
+    Parameters:
+    path (str): A `.csv` file with one latitude and one longitude column,
+        named 'Lat' and 'Lon' as in the weather CSV, or 'latitude' and
+        'longitude' in any case, or a `.geojson` or `.json` file of
+        points.
+
+    Returns:
+    pd.DataFrame: The columns of the file, with the coordinates of the
+    points in EPSG:4326 in the 'Lat' and 'Lon' columns.
+
+    Raises:
+    ValueError: If `path` is not a `.csv`, `.geojson` or `.json` file,
+        or if a GeoJSON file has geometries other than points.
+    KeyError: If a CSV file does not have exactly one latitude and one
+        longitude column.
+    """
+
+    return pd.concat(list(_point_chunks(path)), ignore_index=True)
+
+
+def _json_value(value):
+    """
+    Convert the numpy scalars of a property to Python numbers, so integers
+    are written as JSON numbers
+    """
+
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+@contextmanager
+def _point_writer(path):
+    """
+    Stream chunks of points to a CSV or GeoJSON file. Yields a function
+    appending points with 'Lat' and 'Lon' columns. The file is written to
+    a temporary file, renamed to `path` when the block exits without error
+    and removed otherwise.
+    """
+
+    path = str(path)
+    if not path.endswith(POINT_FORMATS):
+        raise ValueError(POINT_FORMAT_ERROR)
+    geojson = path.endswith(GEOJSON_FORMATS)
+    count = 0
+
+    def write(points):
+        nonlocal count
+        if geojson:
+            # Missing values are written as null, which is valid JSON
+            properties = points.astype(object).where(points.notna(), None)
+            for lat, lon, record in zip(points['Lat'].tolist(), points['Lon'].tolist(),
+                                        properties.to_dict('records')):
+                geometry = None
+                if not (math.isnan(lat) or math.isnan(lon)):
+                    geometry = {'type': 'Point', 'coordinates': [lon, lat]}
+                feature = {'type': 'Feature', 'properties': record, 'geometry': geometry}
+                tmp.write(("" if count == 0 else ",\n")
+                          + json.dumps(feature, default=_json_value))
+                count += 1
+        else:
+            points.to_csv(tmp, header=count == 0, index=False)
+            count += len(points)
+
+    with tempfile.NamedTemporaryFile(
+            'w', dir=os.path.dirname(os.path.abspath(path)), prefix=".tmp-",
+            suffix=os.path.splitext(path)[1], delete=False, newline='') as tmp:
+        try:
+            if geojson:
+                tmp.write('{"type": "FeatureCollection", "features": [\n')
+            yield write
+            if geojson:
+                tmp.write('\n]}\n')
+        except BaseException:
+            tmp.close()
+            os.remove(tmp.name)
+            raise
+    os.replace(tmp.name, path)
+
+
+def write_points(points, path):
+    """
+    Write points and their predictions to a CSV or GeoJSON file.
+
+    Parameters:
+    points (pd.DataFrame): Points with 'Lat' and 'Lon' columns, such as
+        the result of `predict_points`.
+    path (str): Path of a `.csv` file, or of a `.geojson` or `.json` file
+        with one Point feature per point whose properties are the columns. Points
+        without coordinates have a null geometry.
+
+    Returns:
+    str: Path of the written file.
+
+    Raises:
+    ValueError: If `path` is not a `.csv`, `.geojson` or `.json` file.
+    """
+
+    with _point_writer(path) as write:
+        write(points)
+    return str(path)
+
+
+def predict_points(path, building_store, model_path, output_path=None,
+                   radius_meters=DEFAULT_RADIUS, terrain_path=None,
+                   chunk_size=DEFAULT_POINTS_CHUNK_SIZE):
+    """
+    Predict the temperature of every point of a CSV or GeoJSON file.
+
+    The points are read in chunks of `chunk_size` points. The hexagons of
+    all points of a chunk are created at once, their statistics are
+    computed with one spatial join, and the model is applied once to the
+    chunk (see `predict_coordinates`), so a file of thousands of sites is
+    predicted in a single pass. The results of every chunk are appended to
+    the output file as soon as they are predicted.
+
+    Parameters:
+    path (str): `.csv`, `.geojson` or `.json` file of points (see
+        `read_points`).
+    building_store (str): Path of the building store of the city, or of a
+        directory of building arrays (see `city_heatmap`).
+    model_path (str): Path of a model saved by `train`.
+    output_path (str, optional): `.csv`, `.geojson` or `.json` file to
+        stream the results to. Defaults to returning them.
+    radius_meters (float, optional): Radius of the hexagons, in meters.
+        Defaults to the radius of the training data.
+    terrain_path (str, optional): Path of a DEM, needed by models trained
+        with the terrain statistics.
+    chunk_size (int, optional): Number of points predicted at once.
+
+    Returns:
+    pd.DataFrame or str: The columns of the input file, the 'Lat' and
+    'Lon' of every point and the `PREDICTION_COLUMN`, or the path of the
+    output file if `output_path` is given. Points without coordinates or
+    without buildings around them are NaN.
+
+    Raises:
+    ValueError: If a file is neither a CSV nor a GeoJSON file, or if
+        `chunk_size` is not positive.
+    KeyError: If a CSV file does not have a latitude and a longitude
+        column.
+
+    Example:
+    >>> predict_points("schools.csv", "data/seattle_building_footprints.parquet",
+    ...                "data/seattle_model.bin", output_path="schools_temperature.geojson")
+    """
+
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive.")
+    results = []
+    output = nullcontext() if output_path is None else _point_writer(output_path)
+    with output as write:
+        for points in _point_chunks(path, chunk_size):
+            points = points.reset_index(drop=True)
+            points[PREDICTION_COLUMN] = np.nan
+            valid = (points['Lat'].notna() & points['Lon'].notna()).to_numpy()
+            if valid.any():
+                predicted = predict_coordinates(points.loc[valid, 'Lat'],
+                                                points.loc[valid, 'Lon'], building_store,
+                                                model_path, radius_meters, terrain_path)
+                points.loc[valid, PREDICTION_COLUMN] = predicted[PREDICTION_COLUMN].to_numpy()
+            if write is None:
+                results.append(points)
+            else:
+                write(points)
+
+    if output_path is not None:
+        print(f"Predictions saved as: {output_path}")
+        return output_path
+    if not results:
+        return pd.DataFrame(columns=['Lat', 'Lon', PREDICTION_COLUMN])
+    return pd.concat(results, ignore_index=True)
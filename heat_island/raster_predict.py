@@ -0,0 +1,493 @@
+"""
+raster_predict.py: block-parallel GeoTIFF of predicted temperatures
+
+`city_heatmap` predicts one temperature per hexagonal cell. This module
+predicts a temperature for every pixel of a raster aligned to the DEM grid
+of `terrain_acquire`: each pixel gets the features of the hexagon centered
+on it, as a station does in the training data. The raster is split into
+blocks of `block_size` pixels, and the features and the prediction of each
+block are computed on a pool of worker processes.
+
+The hexagons of neighboring pixels overlap about a hundred times, so they
+are never built one by one. On a geographic DEM, the hexagons of all
+pixels are translations of one hexagon on a regular lattice: the terrain
+statistics are a focal (moving-window) reduction of the DEM over the
+pixels of that hexagon, and the buildings are assigned to the pixels
+whose hexagon contains them by arithmetic on the lattice. On a projected
+DEM, the hexagons are built and the terrain statistics are computed with
+`terrain_stats`, on layers of pixels far enough apart on the lattice not
+to overlap. Workers map the building
+arrays of `heat_island.building_memmap` and keep the model loaded in their
+registry, so a task only carries the window of its block. Blocks are
+written to a tiled, compressed GeoTIFF with windowed writes as they
+complete, and overviews are added at the end, so the whole grid is never
+held in memory.
+
+Functions:
+- `raster_grid`: Returns the grid of pixels of the DEM covering a boundary,
+    optionally coarsened by an integer factor.
+- `block_windows`: Splits a raster into windows of whole blocks.
+- `hexagon_offsets`: Returns the pixels of a DEM inside the hexagon of a
+    pixel of the grid, as offsets.
+- `predict_raster`: Writes the GeoTIFF of predicted temperatures of a city.
+
+Example Usage:
+>>> predict_raster("data/seattle_boundary.geojson", "data/seattle_building_arrays",
+...                "data/seattle_model.bin", "data/trimmed_terrain.tif",
+...                "seattle_temperature.tif", step=3, max_workers=8)
+"""
+
+import os
+import math
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+import rasterio
+import rasterio.windows
+from rasterio.enums import Resampling
+from rasterio.errors import WindowError
+from rasterio.warp import transform_bounds
+from affine import Affine
+import shapely
+
+from heat_island.geo_process import read_boundary, create_hexagons, get_transformer
+from heat_island.building_memmap import BuildingArrays, hexagon_stats_arrays
+from heat_island.height_acquire import hexagon_stats_from_groups
+from heat_island.terrain_acquire import bounds_window
+from heat_island.terrain_features import terrain_stats, TERRAIN_COLUMNS, _slope
+from heat_island.model import feature_names, get_registry
+
+
+# Default size of the blocks of the raster, in pixels
+DEFAULT_BLOCK_SIZE = 256
+# Default radius of the hexagon of each pixel, in meters
+DEFAULT_RADIUS = 160
+# Decimation factors of the overviews
+OVERVIEW_FACTORS = (2, 4, 8, 16, 32)
+# Radius of the Earth used by `create_hexagon`, in meters
+EARTH_RADIUS = 6371000
+
+# State of a worker process, set by `_init_worker`
+_WORKER = {}
+
+
+def raster_grid(dem_path, boundary, step=1):
+    """
+    Return the grid of pixels of a DEM covering a boundary.
+
+    The grid is the window of the DEM around the bounding box of the
+    boundary, so its pixels are aligned to the pixels of the DEM. With a
+    `step`, each pixel of the grid covers `step` x `step` pixels of the
+    DEM.
+
+    Parameters:
+    dem_path (str): Path of the DEM, such as the trimmed terrain of
+        `terrain_acquire`.
+    boundary (str, shapely.geometry or gpd.GeoDataFrame): The area to
+        cover (see `read_boundary`).
+    step (int, optional): Number of DEM pixels per grid pixel along each
+        axis, such as 3 for about 30 m with a 1/3 arc-second DEM.
+
+    Returns:
+    tuple: The CRS, the affine transform, the width and the height of the
+    grid.
+
+    Raises:
+    ValueError: If `step` is not a positive integer, or if the boundary
+        is outside the DEM.
+    """
+
+    if int(step) != step or step < 1:
+        raise ValueError("step must be a positive integer.")
+    boundary = read_boundary(boundary)
+    with rasterio.open(dem_path) as src:
+        bounds = transform_bounds("EPSG:4326", src.crs, *boundary.bounds)
+        try:
+            window = bounds_window(bounds, src.transform, src.width, src.height)
+        except WindowError as exc:
+            raise ValueError("The boundary is outside the DEM.") from exc
+        transform = src.window_transform(window) * Affine.scale(step)
+        width = math.ceil(window.width / step)
+        height = math.ceil(window.height / step)
+        return src.crs, transform, width, height
+
+
+def block_windows(width, height, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Split a raster of `width` x `height` pixels into windows of
+    `block_size` x `block_size` pixels, aligned to the tiles of a GeoTIFF
+    with this block size. The windows of the last row and column are
+    smaller.
+    """
+
+    return [rasterio.windows.Window(col, row, min(block_size, width - col),
+                                    min(block_size, height - row))
+            for row in range(0, height, block_size)
+            for col in range(0, width, block_size)]
+
+
+def _hexagon_radius(radius_meters):
+    """
+    Radius, in degrees, of the hexagons of `create_hexagons`
+    """
+
+    return math.degrees(radius_meters / EARTH_RADIUS)
+
+
+def _inside_hexagon(dx, dy, radius):
+    """
+    Whether points at (dx, dy) from the center of a hexagon of
+    `create_hexagons` with a radius of `radius` degrees are inside it. The
+    hexagon has vertices at (radius, 0) and (-radius, 0), and horizontal
+    edges at dy = +/- radius * sqrt(3) / 2.
+    """
+
+    dx, dy = np.abs(dx), np.abs(dy)
+    return (dy < radius * math.sqrt(3) / 2) & (math.sqrt(3) * dx + dy < math.sqrt(3) * radius)
+
+
+def hexagon_offsets(radius_meters, dem_transform, step=1):
+    """
+    Return the pixels of a geographic DEM whose center is inside the
+    hexagon of a pixel of the grid of `raster_grid`.
+
+    With a `step`, the center of a grid pixel is the center of a block of
+    `step` x `step` DEM pixels, so it is the center of a DEM pixel for an
+    odd step and a corner of four DEM pixels for an even step. In both
+    cases the hexagons of all grid pixels contain the same DEM pixels
+    relative to their center, which are returned as offsets from the DEM
+    pixel at `(step // 2, step // 2)` of the block.
+
+    Parameters:
+    radius_meters (float): Radius of the hexagons, in meters.
+    dem_transform (affine.Affine): Transform of the DEM, in degrees.
+    step (int, optional): Number of DEM pixels per grid pixel.
+
+    Returns:
+    tuple: The row and column offsets, as integer arrays.
+    """
+
+    radius = _hexagon_radius(radius_meters)
+    # Offset of the center of the grid pixel from the corner of the DEM
+    # pixel at (step // 2, step // 2)
+    fraction = (step % 2) / 2
+    rows_max = math.ceil(radius / abs(dem_transform.e)) + 1
+    cols_max = math.ceil(radius / abs(dem_transform.a)) + 1
+    rows, cols = np.meshgrid(np.arange(-rows_max, rows_max + 1),
+                             np.arange(-cols_max, cols_max + 1), indexing='ij')
+    inside = _inside_hexagon((cols + 0.5 - fraction) * dem_transform.a,
+                             (rows + 0.5 - fraction) * dem_transform.e, radius)
+    return rows[inside], cols[inside]
+
+
+def _focal_terrain(window, inside):
+    """
+    Terrain statistics of the hexagons of the pixels of a block of a grid
+    over a geographic DEM, as a focal reduction of the DEM over the
+    offsets of `hexagon_offsets`. Only the window of the DEM under the
+    block and its halo is read.
+    """
+
+    step, (offset_rows, offset_cols) = _WORKER['step'], _WORKER['offsets']
+    values = np.full((window.height, window.width, len(TERRAIN_COLUMNS)), np.nan)
+    with rasterio.open(_WORKER['dem_path']) as src:
+        # DEM pixel at (step // 2, step // 2) of the first grid pixel
+        col0, row0 = ~src.transform * (_WORKER['transform'] * (window.col_off,
+                                                               window.row_off))
+        row0 = round(row0) + step // 2
+        col0 = round(col0) + step // 2
+        # Extent of the DEM pixels used by the block, with one more pixel
+        # for the slope
+        first_row = row0 + offset_rows.min() - 1
+        first_col = col0 + offset_cols.min() - 1
+        height = (window.height - 1) * step + offset_rows.max() - offset_rows.min() + 3
+        width = (window.width - 1) * step + offset_cols.max() - offset_cols.min() + 3
+        region = rasterio.windows.Window(first_col, first_row, width, height)
+        try:
+            read = region.intersection(rasterio.windows.Window(0, 0, src.width, src.height))
+        except WindowError:
+            return values
+        elevation = np.full((height, width), np.nan)
+        slope = np.full((height, width), np.nan)
+        rows = slice(read.row_off - first_row, read.row_off - first_row + read.height)
+        cols = slice(read.col_off - first_col, read.col_off - first_col + read.width)
+        # The slope is computed on the pixels of the DEM only, as in
+        # `terrain_stats`
+        elevation[rows, cols] = src.read(1, window=read, masked=True).astype(
+            np.float64).filled(np.nan)
+        slope[rows, cols] = _slope(elevation[rows, cols], src.window_transform(read), src.crs)
+    slope[np.isnan(elevation)] = np.nan
+
+    def shifted(array, d_row, d_col):
+        start_row = d_row - offset_rows.min() + 1
+        start_col = d_col - offset_cols.min() + 1
+        return array[start_row:start_row + (window.height - 1) * step + 1:step,
+                     start_col:start_col + (window.width - 1) * step + 1:step]
+
+    count = np.zeros((window.height, window.width))
+    total = np.zeros_like(count)
+    minimum = np.full_like(count, np.inf)
+    maximum = np.full_like(count, -np.inf)
+    slope_count = np.zeros_like(count)
+    slope_total = np.zeros_like(count)
+    for d_row, d_col in zip(offset_rows, offset_cols):
+        heights = shifted(elevation, d_row, d_col)
+        valid = np.isfinite(heights)
+        count += valid
+        total += np.where(valid, heights, 0)
+        np.fmin(minimum, heights, out=minimum)
+        np.fmax(maximum, heights, out=maximum)
+        slopes = shifted(slope, d_row, d_col)
+        valid = np.isfinite(slopes)
+        slope_count += valid
+        slope_total += np.where(valid, slopes, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        squares = np.zeros_like(count)
+        for d_row, d_col in zip(offset_rows, offset_cols):
+            deviations = shifted(elevation, d_row, d_col) - mean
+            squares += np.where(np.isfinite(deviations), deviations**2, 0)
+        values[..., 0] = mean
+        values[..., 1] = minimum
+        values[..., 2] = maximum
+        values[..., 3] = np.sqrt(squares / count)
+        values[..., 4] = slope_total / slope_count
+    values[count == 0] = np.nan
+    return values[inside]
+
+
+def _lattice_building_stats(longitudes, latitudes, window, inside):
+    """
+    Building statistics of the hexagons of the pixels of a block of a grid
+    over a geographic DEM. Each building is assigned to the pixels whose
+    hexagon contains its centroid by arithmetic on the lattice of pixel
+    centers, without building the hexagons.
+    """
+
+    transform = _WORKER['transform']
+    radius = _hexagon_radius(_WORKER['radius_meters'])
+    buildings = _WORKER['arrays'].select(
+        (longitudes.min() - radius, latitudes.min() - radius,
+         longitudes.max() + radius, latitudes.max() + radius),
+        columns=['centroid_x', 'centroid_y', 'height', 'footprint_area'])
+    x, y = get_transformer(_WORKER['arrays'].crs or 4326, _WORKER['crs']).transform(
+        buildings['centroid_x'], buildings['centroid_y'])
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+
+    # Position of the inside pixels of the block, in the order of the rows
+    # of the statistics
+    position = np.full((window.height, window.width), -1, dtype=np.int64)
+    position[inside] = np.arange(inside.sum())
+
+    # First candidate pixel of each building, and the range of pixels to
+    # test from it
+    cols = (x - transform.c) / transform.a - 0.5 - window.col_off
+    rows = (y - transform.f) / transform.e - 0.5 - window.row_off
+    radius_cols = radius / abs(transform.a)
+    radius_rows = radius * math.sqrt(3) / 2 / abs(transform.e)
+    first_col = np.ceil(cols - radius_cols).astype(np.int64)
+    first_row = np.ceil(rows - radius_rows).astype(np.int64)
+    groups, pairs = [], []
+    for d_row in range(math.floor(2 * radius_rows) + 2):
+        for d_col in range(math.floor(2 * radius_cols) + 2):
+            row, col = first_row + d_row, first_col + d_col
+            in_block = (row >= 0) & (row < window.height) & (col >= 0) & (col < window.width)
+            # Distance from the center of the pixel
+            dx = x - (transform.c + (window.col_off + col + 0.5) * transform.a)
+            dy = y - (transform.f + (window.row_off + row + 0.5) * transform.e)
+            match = np.flatnonzero(in_block & _inside_hexagon(dx, dy, radius))
+            group = position[row[match], col[match]]
+            groups.append(group[group >= 0])
+            pairs.append(match[group >= 0])
+    groups, pairs = np.concatenate(groups), np.concatenate(pairs)
+    hexagon_areas = np.full(len(longitudes), 3 * math.sqrt(3) / 2 * radius**2)
+    return hexagon_stats_from_groups(groups, buildings['height'][pairs],
+                                     buildings['footprint_area'][pairs], hexagon_areas)
+
+
+def _lattice_layers(rows, cols, period):
+    """
+    Split pixels of a lattice into layers of pixels at least `period`
+    pixels apart along both axes, whose hexagons do not overlap.
+    """
+
+    keys = (rows % period) * period + cols % period
+    order = np.argsort(keys, kind='stable')
+    return np.split(order, np.flatnonzero(np.diff(keys[order])) + 1)
+
+
+def _init_worker(boundary_wkb, crs, transform, building_arrays, model_path,
+                 dem_path, radius_meters, step):
+    """
+    Set up a worker process: prepare the boundary, map the building arrays
+    and load the model once.
+    """
+
+    boundary = shapely.from_wkb(boundary_wkb)
+    shapely.prepare(boundary)
+    _, scale = get_registry().get(model_path)
+    features = feature_names(scale)
+    offsets = None
+    if crs.is_geographic:
+        with rasterio.open(dem_path) as src:
+            offsets = hexagon_offsets(radius_meters, src.transform, step)
+    _WORKER.update(boundary=boundary, crs=crs, transform=transform,
+                   arrays=BuildingArrays(building_arrays), model_path=model_path,
+                   features=features, dem_path=dem_path, radius_meters=radius_meters,
+                   step=step, offsets=offsets,
+                   terrain=any(column in features for column in TERRAIN_COLUMNS))
+
+
+def _block_features(longitudes, latitudes, rows, cols, window, inside):
+    """
+    Features of the hexagons of the inside pixels of a block
+    """
+
+    if _WORKER['offsets'] is not None:
+        features = _lattice_building_stats(longitudes, latitudes, window, inside)
+        if _WORKER['terrain']:
+            features[TERRAIN_COLUMNS] = _focal_terrain(window, inside)
+        return features
+
+    hexagons = create_hexagons(longitudes, latitudes, _WORKER['radius_meters'])
+    features = hexagon_stats_arrays(_WORKER['arrays'], hexagons)
+    if _WORKER['terrain']:
+        # Pixels k apart on the lattice have disjoint hexagons
+        transform = _WORKER['transform']
+        period = math.ceil(2 * _WORKER['radius_meters']
+                           / min(abs(transform.a), abs(transform.e))) + 1
+        features = features.join(terrain_stats(hexagons, _WORKER['dem_path'],
+                                               layers=_lattice_layers(rows, cols, period)))
+    return features
+
+
+def _predict_block(window):
+    """
+    Predict the temperature of every pixel of a block whose center is
+    inside the boundary. The other pixels are NaN.
+    """
+
+    transform = _WORKER['transform']
+    rows, cols = np.meshgrid(np.arange(window.row_off, window.row_off + window.height),
+                             np.arange(window.col_off, window.col_off + window.width),
+                             indexing='ij')
+    x = transform.c + (cols + 0.5) * transform.a
+    y = transform.f + (rows + 0.5) * transform.e
+    longitudes, latitudes = get_transformer(_WORKER['crs'], 4326).transform(x.ravel(),
+                                                                            y.ravel())
+    longitudes = np.asarray(longitudes, dtype=float)
+    latitudes = np.asarray(latitudes, dtype=float)
+    inside = shapely.contains_xy(_WORKER['boundary'], longitudes, latitudes)
+
+    block = np.full(x.size, np.nan, dtype=np.float32)
+    if inside.any():
+        features = _block_features(longitudes[inside], latitudes[inside],
+                                   rows.ravel()[inside], cols.ravel()[inside], window,
+                                   inside.reshape(x.shape))
+        features['Lat'] = latitudes[inside]
+        features['Lon'] = longitudes[inside]
+
+        # Pixels with missing features, such as pixels without buildings
+        # around them, stay NaN
+        complete = features[_WORKER['features']].notna().all(axis=1).to_numpy()
+        predicted = np.full(len(features), np.nan)
+        if complete.any():
+            predicted[complete] = get_registry().predict_many(
+                _WORKER['model_path'], features[complete])
+        block[inside] = predicted
+    return window, block.reshape(x.shape)
+
+
+def predict_raster(boundary, building_arrays, model_path, dem_path, output_path,
+                   radius_meters=DEFAULT_RADIUS, step=1, block_size=DEFAULT_BLOCK_SIZE,
+                   max_workers=None):
+    """
+    Write a GeoTIFF of the predicted temperature of every pixel of a city.
+
+    The raster is aligned to the DEM (see `raster_grid`). Each pixel whose
+    center is inside the boundary gets the temperature predicted from the
+    features of the hexagon centered on it, including the terrain
+    statistics if the model was trained on them. The blocks of the raster
+    are predicted on a pool of worker processes, at most two blocks per
+    worker are pending at any time, and each block is written with a
+    windowed write as soon as it completes. The GeoTIFF is tiled with
+    `block_size` tiles, compressed with DEFLATE, and has average overviews.
+
+    Parameters:
+    boundary (str, shapely.geometry or gpd.GeoDataFrame): Boundary of the
+        city (see `read_boundary`).
+    building_arrays (str): Directory of building arrays written by
+        `write_building_arrays`, which every worker maps.
+    model_path (str): Path of a model saved by `train`.
+    dem_path (str): Path of the DEM, such as the trimmed terrain of
+        `terrain_acquire`.
+    output_path (str): Path of the output `.tif` file.
+    radius_meters (float, optional): Radius of the hexagon of each pixel.
+        Defaults to the radius of the training data.
+    step (int, optional): Number of DEM pixels per output pixel along each
+        axis, such as 3 for about 30 m with a 1/3 arc-second DEM.
+    block_size (int, optional): Size of the blocks and of the tiles of the
+        GeoTIFF, in pixels. Must be a multiple of 16.
+    max_workers (int, optional): Number of worker processes. Defaults to
+        the number of CPUs. With 1, the blocks are predicted in the calling
+        process.
+
+    Returns:
+    str: Path of the written file.
+
+    Raises:
+    ValueError: If `block_size` is not a positive multiple of 16, if
+        `max_workers` is not positive, or if `building_arrays` is not a
+        directory.
+    """
+
+    if block_size < 16 or block_size % 16:
+        raise ValueError("block_size must be a positive multiple of 16.")
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_workers < 1:
+        raise ValueError("max_workers must be positive.")
+    if not os.path.isdir(building_arrays):
+        raise ValueError("building_arrays must be a directory of building arrays.")
+
+    boundary = read_boundary(boundary)
+    crs, transform, width, height = raster_grid(dem_path, boundary, step)
+    windows = block_windows(width, height, block_size)
+    initargs = (shapely.to_wkb(boundary), crs, transform, building_arrays,
+                model_path, dem_path, radius_meters, step)
+    profile = {'driver': 'GTiff', 'width': width, 'height': height, 'count': 1,
+               'dtype': 'float32', 'nodata': np.nan, 'crs': crs, 'transform': transform,
+               'tiled': True, 'blockxsize': block_size, 'blockysize': block_size,
+               'compress': 'deflate', 'predictor': 3, 'BIGTIFF': 'IF_SAFER'}
+
+    with rasterio.open(output_path, 'w', **profile) as dst:
+        if max_workers == 1:
+            _init_worker(*initargs)
+            try:
+                for window in windows:
+                    dst.write(_predict_block(window)[1], 1, window=window)
+            finally:
+                _WORKER.clear()
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                     initargs=initargs) as executor:
+                pending = set()
+                for window in windows:
+                    # Bound the number of predicted blocks held in memory
+                    if len(pending) >= 2 * max_workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            done_window, block = future.result()
+                            dst.write(block, 1, window=done_window)
+                    pending.add(executor.submit(_predict_block, window))
+                for future in wait(pending).done:
+                    done_window, block = future.result()
+                    dst.write(block, 1, window=done_window)
+
+    # Overviews are computed from the written tiles
+    factors = [factor for factor in OVERVIEW_FACTORS if max(width, height) // factor >= 1]
+    if factors:
+        with rasterio.open(output_path, 'r+') as dst:
+            dst.build_overviews(factors, Resampling.average)
+            dst.update_tags(ns='rio_overview', resampling='average')
+    print(f"Predicted temperatures saved as: {output_path}")
+    return output_path
@@ -2,24 +2,145 @@
 this module acquire terrain data based on study boundary (geojson),
 and get trimmed tif file from USGS 3D Elevation Program (3DEP), with the resolution of 1/3 Arc Second
 for Seattle, the link is https://prd-tnm.s3.amazonaws.com/StagedProducts/Elevation/13/TIFF/historical/n48w123/USGS_13_n48w123_20230608.tif
+
+the tile is streamed to disk in chunks, and only the window of the area of interest is read
+when it is trimmed, so the memory used is bounded by the area of interest and not by the tile.
+the window can also be read directly from the url with HTTP range requests, without
+downloading the tile.
 """
 
+import os
+import math
+import tempfile
 import geopandas as gpd
 import rasterio
+import rasterio.windows
 import requests
-from rasterio.mask import mask
-from shapely.geometry import Polygon
+from rasterio.warp import transform_bounds
 
 from heat_island import data_process
 
 
+# Default url of the terrain tile of the Seattle area
+DEFAULT_TERRAIN_URL = ("https://prd-tnm.s3.amazonaws.com/StagedProducts/Elevation/13/TIFF/"
+                       "historical/n48w123/USGS_13_n48w123_20230608.tif")
+# Size of the chunks used to stream a download to disk, in bytes
+CHUNK_SIZE = 1024 * 1024
+# Buffer around the study boundary, in degrees
+AOI_BUFFER = 0.008
+
+
+def aoi_bounds(input_boundary, buffer=AOI_BUFFER):
+    """
+    Args:
+        input_boundary: study area boundary, as a GeoDataFrame in EPSG:4326
+        buffer: buffer around the boundary, in degrees
+
+    Returns:
+        the extended bounding box (minx, miny, maxx, maxy) of the boundary, in EPSG:4326
+    """
+    return tuple(input_boundary["geometry"].buffer(buffer).total_bounds)
+
+
+def bounds_window(bounds, transform, width, height):
+    """
+    Args:
+        bounds: bounding box (minx, miny, maxx, maxy), in the crs of the raster
+        transform: affine transform of the raster
+        width, height: size of the raster, in pixels
+
+    Returns:
+        the window of the whole pixels of the raster covering the bounding box
+
+    Raises:
+        rasterio.errors.WindowError: if the bounding box is outside the raster
+    """
+    window = rasterio.windows.from_bounds(*bounds, transform=transform)
+    col_off = math.floor(window.col_off)
+    row_off = math.floor(window.row_off)
+    window = rasterio.windows.Window(col_off, row_off,
+                                     math.ceil(window.col_off + window.width) - col_off,
+                                     math.ceil(window.row_off + window.height) - row_off)
+    return window.intersection(rasterio.windows.Window(0, 0, width, height))
+
+
+def download_terrain(url, path, chunk_size=CHUNK_SIZE, timeout=300):
+    """
+    Args:
+        url: url of the terrain tile
+        path: local path of the downloaded tile
+        chunk_size: size of the chunks written to disk, in bytes
+        timeout: timeout of the network operations, in seconds
+
+    Output:
+        the tile, streamed to a temporary file in chunks and renamed to path,
+        so an interrupted download never leaves a truncated tile behind
+
+    Returns:
+        path
+    """
+    with requests.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(path)),
+                                         prefix=".tmp-", delete=False) as tmp:
+            try:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    tmp.write(chunk)
+            except BaseException:
+                tmp.close()
+                os.remove(tmp.name)
+                raise
+    os.replace(tmp.name, path)
+    return path
+
+
+def clip_terrain(source, bounds, output_path):
+    """
+    Args:
+        source: local path or url of the terrain tile. a url is read with HTTP range
+            requests, which only fetch the blocks of the window of a Cloud-Optimized GeoTIFF
+        bounds: area of interest (minx, miny, maxx, maxy), in EPSG:4326
+        output_path: path of the trimmed terrain
+
+    Output:
+        the pixels of the tile intersecting the area of interest, as tif file.
+        only this window of the tile is read
+
+    Returns:
+        output_path
+    """
+    if str(source).startswith(("http://", "https://")):
+        source = "/vsicurl/" + str(source)
+    # do not list the directory of a url, only its blocks are read
+    with rasterio.Env(GDAL_DISABLE_READDIR_ON_OPEN="EMPTY_DIR"), rasterio.open(source) as src:
+        # window of the area of interest, snapped to whole pixels inside the tile
+        src_bounds = transform_bounds("EPSG:4326", src.crs, *bounds)
+        window = bounds_window(src_bounds, src.transform, src.width, src.height)
+
+        out_image = src.read(window=window)
+        out_meta = src.meta.copy()
+        out_meta.update(
+            {
+                "driver": "GTiff",
+                "height": out_image.shape[1],
+                "width": out_image.shape[2],
+                "transform": src.window_transform(window),
+            }
+        )
+
+    with rasterio.open(output_path, "w", **out_meta) as o:
+        o.write(out_image)
+    return output_path
+
+
 def terrain_acquire(input_boundary_name, output_complete_terrain_name,
-                    output_trimmed_terrain_name,
-                    url="https://prd-tnm.s3.amazonaws.com/StagedProducts/Elevation/13/TIFF/historical/n48w123/USGS_13_n48w123_20230608.tif"):
+                    output_trimmed_terrain_name, url=DEFAULT_TERRAIN_URL):
     """
     Args:
         input_boundary_name: file name of study area boundary (i.e., 'seattle-city-limits.geojson')
-        output_complete_terrain_name (i.e., 'complete_terrain.tif')
+        output_complete_terrain_name (i.e., 'complete_terrain.tif'). if None, the complete
+            terrain is not downloaded, and the trimmed terrain is read from the url with
+            HTTP range requests
         output_trimmed_terrain_name (i.e., 'trimmed_terrain.tif')
         url: default is set to Seattle area
 
@@ -32,44 +153,18 @@ def terrain_acquire(input_boundary_name, output_complete_terrain_name,
     input_boundary = gpd.read_file(input_boundary_path)
 
     # set output saved path
-    complete_geotiff_path = data_process.input_file_from_data_dir(output_complete_terrain_name)
     trimmed_geotiff_path = data_process.input_file_from_data_dir(output_trimmed_terrain_name)
 
     # create extended bounding box of input boundary, as area of interest
-    buffered_boundary = input_boundary["geometry"].buffer(0.008)
-    bound_box = buffered_boundary.total_bounds
-    coordinates_bound_box = [
-        (bound_box[0], bound_box[3]),
-        (bound_box[0], bound_box[1]),
-        (bound_box[2], bound_box[1]),
-        (bound_box[2], bound_box[3]),
-    ]
-    aoi_polygon = Polygon(coordinates_bound_box)
-    aoi_gdf = gpd.GeoDataFrame(index=[0], crs="EPSG:4326", geometry=[aoi_polygon])
-
-    # Download the GeoTIFF file from the url to a local path
-    response = requests.get(url)
-    with open(complete_geotiff_path, "wb") as f:
-        f.write(response.content)
+    bounds = aoi_bounds(input_boundary)
 
-    # trim the original terrain with the area of interest
-    with rasterio.open(complete_geotiff_path) as src:
-        gdf = aoi_gdf.to_crs(src.crs.data)
+    # Stream the GeoTIFF file from the url to a local path
+    source = url
+    if output_complete_terrain_name is not None:
+        source = data_process.input_file_from_data_dir(output_complete_terrain_name)
+        download_terrain(url, source)
 
-        # Perform the crop
-        out_image, out_transform = mask(dataset=src, shapes=gdf.geometry, crop=True)
-        out_meta = src.meta.copy()
-        out_meta.update(
-            {
-                "driver": "GTiff",
-                "height": out_image.shape[1],
-                "width": out_image.shape[3],
-                "transform": out_transform,
-            }
-        )
-
-    # Save the cropped terrain
-    with rasterio.open(trimmed_geotiff_path, "w", **out_meta) as o:
-        o.write(out_image)
+    # trim the original terrain with the area of interest
+    clip_terrain(source, bounds, trimmed_geotiff_path)
 
     print("Your terrain is now trimmed and saved as your appointed name")
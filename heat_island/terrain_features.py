@@ -0,0 +1,181 @@
+"""
+terrain_features.py: zonal elevation statistics of hexagons from a DEM
+
+The trimmed terrain written by `terrain_acquire` covers the whole study
+area. This module computes the elevation statistics of many hexagons from
+it in one vectorized pass, instead of one zonal statistics call per
+polygon: the window of the DEM covering all hexagons is read once, the
+hexagons are burned into a label grid with a single rasterization, and the
+statistics of all labels are reduced at once with `np.bincount`. Hexagons
+that overlap, such as the hexagons of nearby stations, are burned into a
+few separate label grids, so every hexagon keeps all of its pixels.
+
+Functions:
+- `terrain_stats`: Calculates the mean, minimum, maximum and standard
+    deviation of the elevation, and the mean slope, of many hexagons.
+
+Example Usage:
+>>> hexagons = create_hexagons(weather['Lon'], weather['Lat'], 160)
+>>> stats = terrain_stats(hexagons, "data/trimmed_terrain.tif")
+"""
+
+import math
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import rasterio
+import rasterio.features
+from rasterio.errors import WindowError
+import shapely
+
+from heat_island.terrain_acquire import bounds_window
+
+
+# Columns of the terrain statistics, as used by `model.get_keys(terrain=True)`
+TERRAIN_COLUMNS = ['terrain_mean', 'terrain_min', 'terrain_max', 'terrain_std',
+                   'terrain_slope']
+# Length of a degree of latitude, in meters, on the sphere of `create_hexagon`
+METERS_PER_DEGREE = math.radians(6371000)
+
+
+def _overlap_layers(geometries):
+    """
+    Split geometries into layers of geometries whose interiors do not
+    overlap, so that each layer can be burned into one label grid. Edges
+    shared by adjacent hexagons are not an overlap.
+    """
+
+    tree = shapely.STRtree(geometries)
+    left, right = tree.query(geometries, predicate='intersects')
+    pairs = left < right
+    left, right = left[pairs], right[pairs]
+    overlap = shapely.relate_pattern(geometries[left], geometries[right], 'T********')
+    neighbors = {}
+    for i, j in zip(left[overlap], right[overlap]):
+        neighbors.setdefault(j, []).append(i)
+
+    # Greedy coloring: each geometry goes to the first layer without an
+    # earlier overlapping geometry
+    layer_of = np.zeros(len(geometries), dtype=np.int64)
+    for j in sorted(neighbors):
+        taken = {layer_of[i] for i in neighbors[j]}
+        layer = 0
+        while layer in taken:
+            layer += 1
+        layer_of[j] = layer
+    return [np.flatnonzero(layer_of == layer) for layer in range(layer_of.max(initial=0) + 1)]
+
+
+def _slope(elevation, transform, crs):
+    """
+    Slope of every pixel, in degrees, from the central differences of the
+    elevation. Pixel sizes in degrees are converted to meters.
+    """
+
+    if min(elevation.shape) < 2:
+        return np.full(elevation.shape, np.nan)
+    dx = np.full((elevation.shape[0], 1), abs(transform.a))
+    dy = abs(transform.e)
+    if crs is not None and crs.is_geographic:
+        latitudes = transform.f + (np.arange(elevation.shape[0]) + 0.5) * transform.e
+        dx = dx * METERS_PER_DEGREE * np.cos(np.radians(latitudes))[:, None]
+        dy = dy * METERS_PER_DEGREE
+    dz_row, dz_col = np.gradient(elevation)
+    return np.degrees(np.arctan(np.hypot(dz_col / dx, dz_row / dy)))
+
+
+def terrain_stats(hexagons, dem_path, index=None, layers=None):
+    """
+    Calculate the elevation statistics of many hexagons from a DEM.
+
+    Only the window of the DEM covering the hexagons is read. A pixel
+    belongs to a hexagon if its center is inside it, as in
+    `rasterio.features.rasterize`, and nodata pixels are ignored.
+
+    Parameters:
+    hexagons (gpd.GeoSeries, gpd.GeoDataFrame or list): Hexagon polygons.
+        Hexagons without a CRS are assumed to be in EPSG:4326, and are
+        reprojected to the CRS of the DEM.
+    dem_path (str): Path of a single-band DEM, such as the trimmed terrain
+        written by `terrain_acquire`, with elevations in meters.
+    index (list, optional): Index of the result. Defaults to the index of
+        `hexagons` if it is a pandas object, or to positions.
+    layers (list, optional): Arrays of positions of hexagons whose
+        interiors do not overlap, covering every hexagon once, such as the
+        hexagons of pixels far enough apart on a lattice. Defaults to
+        finding them from the geometries, which is slow for hexagons that
+        overlap many others.
+
+    Returns:
+    pd.DataFrame: One row per hexagon with the `TERRAIN_COLUMNS`: the
+    mean, minimum, maximum and standard deviation of the elevation, and
+    the mean slope in degrees. Hexagons without any pixel of the DEM have
+    NaN statistics.
+
+    Example:
+    >>> terrain_stats(hexagons, "data/trimmed_terrain.tif")['terrain_mean']
+    """
+
+    if isinstance(hexagons, gpd.GeoDataFrame):
+        hexagons = hexagons.geometry
+    if index is None and isinstance(hexagons, pd.Series):
+        index = hexagons.index
+    crs = hexagons.crs if isinstance(hexagons, gpd.GeoSeries) else None
+    hexagons = gpd.GeoSeries(np.asarray(hexagons, dtype=object), crs=crs or 4326)
+    n_hexagons = len(hexagons)
+    values = np.full((n_hexagons, len(TERRAIN_COLUMNS)), np.nan)
+
+    with rasterio.open(dem_path) as src:
+        if src.crs is not None and hexagons.crs != src.crs:
+            hexagons = hexagons.to_crs(src.crs)
+        geometries = hexagons.values.to_numpy() if n_hexagons else np.empty(0, dtype=object)
+
+        # Window covering all hexagons, with a margin of one pixel for the
+        # slope at their edges
+        window = None
+        if n_hexagons:
+            minx, miny, maxx, maxy = shapely.total_bounds(geometries)
+            pad_x, pad_y = abs(src.transform.a), abs(src.transform.e)
+            try:
+                window = bounds_window((minx - pad_x, miny - pad_y, maxx + pad_x, maxy + pad_y),
+                                       src.transform, src.width, src.height)
+            except WindowError:
+                window = None
+        if window is None:
+            return pd.DataFrame(values, columns=TERRAIN_COLUMNS, index=index)
+
+        elevation = src.read(1, window=window, masked=True).astype(np.float64).filled(np.nan)
+        transform = src.window_transform(window)
+        slope = _slope(elevation, transform, src.crs)
+
+    if layers is None:
+        layers = _overlap_layers(geometries)
+    for layer in layers:
+        layer = np.asarray(layer, dtype=np.int64)
+        # Burn the hexagons of the layer, labeled from 1, into one grid
+        labels = rasterio.features.rasterize(
+            zip(geometries[layer], layer + 1), out_shape=elevation.shape,
+            transform=transform, fill=0, dtype='int32')
+        inside = (labels > 0) & np.isfinite(elevation)
+        groups = labels[inside] - 1
+        heights = elevation[inside]
+
+        count = np.bincount(groups, minlength=n_hexagons)
+        has_pixels = count > 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.bincount(groups, heights, minlength=n_hexagons) / count
+            std = np.sqrt(np.bincount(groups, (heights - mean[groups])**2,
+                                      minlength=n_hexagons) / count)
+            with_slope = np.isfinite(slope[inside])
+            mean_slope = (np.bincount(groups[with_slope], slope[inside][with_slope],
+                                      minlength=n_hexagons)
+                          / np.bincount(groups[with_slope], minlength=n_hexagons))
+        minimum = np.full(n_hexagons, np.inf)
+        maximum = np.full(n_hexagons, -np.inf)
+        np.minimum.at(minimum, groups, heights)
+        np.maximum.at(maximum, groups, heights)
+
+        rows = layer[has_pixels[layer]]
+        values[rows] = np.column_stack([mean, minimum, maximum, std, mean_slope])[rows]
+
+    return pd.DataFrame(values, columns=TERRAIN_COLUMNS, index=index)
@@ -0,0 +1,272 @@
+"""
+tile_cache.py: persistent on-disk cache for building footprint tiles
+
+The building footprints from https://github.com/microsoft/GlobalMLBuildingFootprints
+are published as one (gzip-compressed) GeoJSONL file per zoom-9 quad key,
+and a single tile is often hundreds of megabytes. This module keeps the
+downloaded tiles on local disk so that repeated queries in the same tile
+are served from the cache instead of the network.
+
+Cache entries are content-addressed by the quad key and the tile url listed
+in `dataset-links.csv`. The url embeds the release of the dataset, so a new
+release of a tile is stored as a new entry and the old one ages out.
+
+Classes:
+- `TileCache`: Size-bounded, least-recently-used cache of tile files with
+    atomic writes.
+
+Functions:
+- `default_cache_dir`: Returns the root directory of the local caches, which
+    can be configured with the `HEAT_ISLAND_CACHE_DIR` environment variable.
+- `get_default_cache`: Returns the process-wide default `TileCache`.
+
+Example Usage:
+>>> cache = TileCache("/tmp/heat_island_tiles", max_bytes=2 * 1024**3)
+>>> local_path = cache.fetch(21230030, url)
+>>> df = pd.read_json(local_path, lines=True)
+"""
+
+
+import os
+import hashlib
+import shutil
+import tempfile
+import urllib.request
+
+
+# Environment variable used to configure the cache directory
+CACHE_DIR_ENV = "HEAT_ISLAND_CACHE_DIR"
+# Default upper bound of the cache size, in bytes
+DEFAULT_MAX_BYTES = 5 * 1024**3
+# Size of the chunks used to stream a download to disk, in bytes
+CHUNK_SIZE = 1024 * 1024
+# Prefix of the partially written files, which are ignored by the cache
+TMP_PREFIX = ".tmp-"
+
+_DEFAULT_CACHE = None
+
+
+def default_cache_dir():
+    """
+    Return the root directory of the local caches of heat_island.
+
+    The directory is read from the `HEAT_ISLAND_CACHE_DIR` environment
+    variable and falls back to `~/.cache/heat_island`. Tiles are kept in
+    its 'tiles' subdirectory.
+
+    Returns:
+    str: Path of the cache root directory.
+    """
+
+    return os.environ.get(CACHE_DIR_ENV) or os.path.join(
+        os.path.expanduser("~"), ".cache", "heat_island")
+
+
+def get_default_cache():
+    """
+    Return the process-wide default tile cache.
+
+    The cache is created on first use in the 'tiles' subdirectory of
+    `default_cache_dir()` with `DEFAULT_MAX_BYTES` as its size bound.
+
+    Returns:
+    TileCache: The default tile cache.
+    """
+
+    global _DEFAULT_CACHE  # pylint: disable=global-statement
+    if _DEFAULT_CACHE is None:
+        _DEFAULT_CACHE = TileCache()
+    return _DEFAULT_CACHE
+
+
+class TileCache:
+    """
+    Size-bounded on-disk cache of building footprint tiles.
+
+    Each tile is stored as a single file named after its quad key and a
+    hash of its url. Reading an entry refreshes its modification time,
+    which is used as the recency for least-recently-used eviction once the
+    total size of the cache exceeds `max_bytes`. Downloads are streamed to
+    a temporary file in the cache directory and renamed into place, so a
+    crashed or concurrent download never leaves a truncated entry behind.
+
+    Parameters:
+    cache_dir (str, optional): Directory of the cache. Defaults to the
+        'tiles' subdirectory of `default_cache_dir()`.
+    max_bytes (int, optional): Upper bound of the total size of the
+        cache, in bytes. Defaults to `DEFAULT_MAX_BYTES`.
+
+    Raises:
+    ValueError: If `max_bytes` is not positive.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        if max_bytes <= 0:
+            raise ValueError("max_bytes must be positive.")
+        self.cache_dir = cache_dir or os.path.join(default_cache_dir(), "tiles")
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path(self, quad_key, url):
+        """
+        Return the path of the cache entry for a tile.
+
+        The file name combines the quad key with a hash of the url, and
+        keeps the '.gz' suffix of compressed tiles so that readers such as
+        `pd.read_json` can infer the compression.
+
+        Parameters:
+        quad_key (int): Quad key of the tile.
+        url (str): Url of the tile listed in `dataset-links.csv`.
+
+        Returns:
+        str: Path of the cache entry, which may not exist yet.
+        """
+
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+        suffix = ".geojsonl.gz" if url.endswith(".gz") else ".geojsonl"
+        return os.path.join(self.cache_dir, f"{quad_key}-{digest}{suffix}")
+
+    def get(self, quad_key, url):
+        """
+        Look up a tile in the cache.
+
+        Parameters:
+        quad_key (int): Quad key of the tile.
+        url (str): Url of the tile listed in `dataset-links.csv`.
+
+        Returns:
+        str or None: Path of the cached tile, or None on a cache miss.
+        """
+
+        path = self.path(quad_key, url)
+        try:
+            # Mark the entry as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, quad_key, url, fileobj):
+        """
+        Store a tile in the cache from a readable binary file object.
+
+        The content is streamed to a temporary file in the cache directory
+        and atomically renamed into place, after which the cache is trimmed
+        back to `max_bytes`.
+
+        Parameters:
+        quad_key (int): Quad key of the tile.
+        url (str): Url of the tile listed in `dataset-links.csv`.
+        fileobj (file-like): Binary stream with the content of the tile.
+
+        Returns:
+        str: Path of the cached tile.
+        """
+
+        path = self.path(quad_key, url)
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, prefix=TMP_PREFIX,
+                                         delete=False) as tmp:
+            try:
+                shutil.copyfileobj(fileobj, tmp, CHUNK_SIZE)
+            except BaseException:
+                tmp.close()
+                os.remove(tmp.name)
+                raise
+        os.replace(tmp.name, path)
+        self.evict(keep=path)
+        return path
+
+    def discard(self, quad_key, url):
+        """
+        Remove the entry of a tile from the cache, if it exists, such as a
+        tile whose content changed upstream under the same url.
+
+        Parameters:
+        quad_key (int): Quad key of the tile.
+        url (str): Url of the tile listed in `dataset-links.csv`.
+        """
+
+        try:
+            os.remove(self.path(quad_key, url))
+        except FileNotFoundError:
+            pass
+
+    def fetch(self, quad_key, url, timeout=None):
+        """
+        Return the local path of a tile, downloading it on a cache miss.
+
+        Parameters:
+        quad_key (int): Quad key of the tile.
+        url (str): Url of the tile listed in `dataset-links.csv`.
+        timeout (float, optional): Timeout of the download, in seconds.
+
+        Returns:
+        str: Path of the cached tile.
+
+        Example:
+        >>> cache = get_default_cache()
+        >>> df = pd.read_json(cache.fetch(quad_key, url), lines=True)
+        """
+
+        path = self.get(quad_key, url)
+        if path is not None:
+            return path
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return self.put(quad_key, url, response)
+
+    def entries(self):
+        """
+        List the complete entries of the cache.
+
+        Returns:
+        list: Tuples of (modification time, size in bytes, path), ordered
+        from the least to the most recently used entry.
+        """
+
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.startswith(TMP_PREFIX) or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def size(self):
+        """
+        Return the total size of the cache entries, in bytes.
+        """
+
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used entries until the cache fits in
+        `max_bytes`.
+
+        Parameters:
+        keep (str, optional): Path of an entry that must not be removed,
+            such as a tile that was just written.
+        """
+
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """
+        Remove every entry of the cache.
+        """
+
+        for _, _, path in self.entries():
+            os.remove(path)
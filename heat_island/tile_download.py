@@ -0,0 +1,229 @@
+"""
+tile_download.py: concurrent download and parsing of building footprint tiles
+
+A metropolitan area usually spans several zoom-9 tiles of the building
+footprints from https://github.com/microsoft/GlobalMLBuildingFootprints.
+This module fetches and parses the tiles of a set of quad keys on a bounded
+pool of worker threads, retries failed downloads with exponential backoff,
+and concatenates the parsed tiles once at the end.
+
+Functions:
+- `read_tile`: Streams a local GeoJSONL tile into a GeoDataFrame of building
+    footprints and heights, skipping buildings outside a bounding box.
+- `fetch_tile`: Downloads a tile into the tile cache, with retries.
+- `download_tiles`: Fetches and parses the tiles of several quad keys
+    concurrently and returns one GeoDataFrame.
+
+Example Usage:
+>>> buildings = download_tiles([21230021, 21230030], max_workers=4)
+"""
+
+import gzip
+import json
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+import geopandas as gpd
+import shapely.geometry
+from tqdm import tqdm
+
+from heat_island.tile_cache import get_default_cache
+from heat_island.dataset_links import load_dataset_links, tile_url
+
+
+# Default number of tiles fetched at the same time
+DEFAULT_MAX_WORKERS = 8
+# Default number of retries of a failed download
+DEFAULT_RETRIES = 3
+# Delay before the first retry, in seconds, doubled on every retry
+DEFAULT_BACKOFF = 1.0
+# Default timeout of the network operations of one tile, in seconds
+DEFAULT_TIMEOUT = 300
+
+
+def _open_tile(path):
+    """
+    Open a tile as text, decompressing it if it starts with the gzip magic
+    number.
+    """
+
+    with open(path, "rb") as f:
+        magic = f.read(2)
+    if magic == b"\x1f\x8b":
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def _outside_bbox(geometry, bbox):
+    """
+    Return whether the coordinates of a GeoJSON polygon geometry fall
+    entirely outside a bounding box, without building a shapely geometry.
+    Only the exterior rings are needed to bound a polygon.
+    """
+
+    minx, miny, maxx, maxy = bbox
+    if geometry["type"] == "Polygon":
+        rings = [geometry["coordinates"][0]]
+    elif geometry["type"] == "MultiPolygon":
+        rings = [polygon[0] for polygon in geometry["coordinates"]]
+    else:
+        gminx, gminy, gmaxx, gmaxy = shapely.geometry.shape(geometry).bounds
+        return gmaxx < minx or gminx > maxx or gmaxy < miny or gminy > maxy
+    for ring in rings:
+        xs = [point[0] for point in ring]
+        ys = [point[1] for point in ring]
+        if not (max(xs) < minx or min(xs) > maxx or max(ys) < miny or min(ys) > maxy):
+            return False
+    return True
+
+
+def read_tile(path, bbox=None):
+    """
+    Parse a GeoJSONL tile of building footprints, one line at a time.
+
+    Each line is decoded on its own, and features whose coordinates fall
+    entirely outside `bbox` are rejected before any shapely geometry is
+    built. Only the 'height' property is kept, so the memory used grows
+    with the buildings in the bounding box rather than with the tile.
+
+    Parameters:
+    path (str): Path of the (optionally gzip-compressed) tile.
+    bbox (tuple, optional): Bounding box (minx, miny, maxx, maxy) in
+        EPSG:4326 of the area of interest. Defaults to the whole tile.
+
+    Returns:
+    gpd.GeoDataFrame: Building footprints in EPSG:4326 with a 'height'
+    column taken from the properties of each feature.
+    """
+
+    heights = []
+    geometries = []
+    with _open_tile(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            feature = json.loads(line)
+            geometry = feature["geometry"]
+            # Reject the buildings outside the area of interest early
+            if bbox is not None and _outside_bbox(geometry, bbox):
+                continue
+            heights.append((feature.get("properties") or {}).get("height"))
+            geometries.append(shapely.geometry.shape(geometry))
+
+    return gpd.GeoDataFrame({'height': pd.Series(heights, dtype=float)},
+                            geometry=geometries, crs=4326)
+
+
+def _is_retryable(exc):
+    """
+    Return whether a failed download may succeed when retried: network
+    errors, timeouts and server errors are, client errors such as 404 are
+    not.
+    """
+
+    if isinstance(exc, urllib.error.HTTPError):
+        return exc.code >= 500 or exc.code == 429
+    return isinstance(exc, OSError)
+
+
+def fetch_tile(quad_key, url, cache=None, retries=DEFAULT_RETRIES,
+               backoff=DEFAULT_BACKOFF, timeout=DEFAULT_TIMEOUT):
+    """
+    Download a tile into the tile cache, retrying transient failures.
+
+    Parameters:
+    quad_key (int): Quad key of the tile.
+    url (str): Url of the tile.
+    cache (heat_island.tile_cache.TileCache, optional): Tile cache.
+        Defaults to `get_default_cache()`.
+    retries (int, optional): Number of retries after the first attempt.
+    backoff (float, optional): Delay before the first retry, in seconds.
+        The delay doubles after every retry.
+    timeout (float, optional): Timeout of the network operations, in
+        seconds.
+
+    Returns:
+    str: Local path of the tile.
+
+    Raises:
+    OSError: If the download still fails after all retries.
+    """
+
+    if cache is None:
+        cache = get_default_cache()
+    attempt = 0
+    while True:
+        try:
+            return cache.fetch(quad_key, url, timeout=timeout)
+        except OSError as exc:
+            if attempt >= retries or not _is_retryable(exc):
+                raise
+            # Wait before retrying, twice as long after every failure
+            time.sleep(backoff * 2**attempt)
+            attempt += 1
+
+
+def download_tiles(quad_keys, links=None, cache=None, max_workers=DEFAULT_MAX_WORKERS,
+                   retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                   timeout=DEFAULT_TIMEOUT, bbox=None, quad_key_column=None):
+    """
+    Fetch and parse the tiles of several quad keys concurrently.
+
+    The urls of all tiles are resolved before any download starts, so an
+    unknown quad key fails fast. Tiles are then fetched and parsed on a
+    pool of at most `max_workers` threads, and the parsed tiles are
+    concatenated once, in the order of `quad_keys`.
+
+    Parameters:
+    quad_keys (list): Quad keys of the tiles at zoom level 9.
+    links (dict, optional): Index returned by `load_dataset_links`.
+    cache (heat_island.tile_cache.TileCache, optional): Tile cache.
+    max_workers (int, optional): Maximum number of tiles processed at the
+        same time. Defaults to `DEFAULT_MAX_WORKERS`.
+    retries (int, optional): Number of retries of a failed download.
+    backoff (float, optional): Delay before the first retry, in seconds.
+    timeout (float, optional): Timeout of the network operations of one
+        tile, in seconds.
+    bbox (tuple, optional): Bounding box (minx, miny, maxx, maxy) of the
+        area of interest. Buildings outside of it are skipped while
+        parsing. Defaults to the whole tiles.
+    quad_key_column (str, optional): Name of a column to add with the
+        quad key of the tile of each building. Defaults to no column.
+
+    Returns:
+    gpd.GeoDataFrame: Building footprints and heights of all tiles.
+
+    Raises:
+    ValueError: If multiple or no rows are found for a quad key.
+    ValueError: If `max_workers` is not positive.
+    """
+
+    if max_workers < 1:
+        raise ValueError("max_workers must be positive.")
+    if links is None:
+        links = load_dataset_links()
+    if cache is None:
+        cache = get_default_cache()
+    urls = [tile_url(quad_key, links) for quad_key in quad_keys]
+
+    def load(quad_key, url):
+        gdf = read_tile(fetch_tile(quad_key, url, cache, retries, backoff, timeout),
+                        bbox=bbox)
+        if quad_key_column is not None:
+            gdf[quad_key_column] = int(quad_key)
+        return gdf
+
+    frames = [None] * len(urls)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(load, quad_key, url): i
+                   for i, (quad_key, url) in enumerate(zip(quad_keys, urls))}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            frames[futures[future]] = future.result()
+
+    if not frames:
+        empty = {'height': []}
+        if quad_key_column is not None:
+            empty[quad_key_column] = pd.Series([], dtype='int64')
+        return gpd.GeoDataFrame(empty, geometry=[], crs=4326)
+    return pd.concat(frames, ignore_index=True)
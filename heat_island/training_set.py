@@ -0,0 +1,116 @@
+"""
+training_set.py: training dataset of weather stations and building features
+
+The models are trained on one hexagon per weather station, with the
+annual average temperature of the station as the target and the
+`centroid_stat_*` building statistics of the hexagon as features. This
+module builds that dataset for a city from its weather CSV and its
+building store: the weather data is cleaned like `preprocess_csv`, the
+hexagons of all stations are created at once, and the statistics of all
+hexagons are computed with one spatial join. Statistics of hexagons of
+other radii can be added as wide columns, to test the sensitivity of the
+models to the scale of the features.
+
+Functions:
+- `build_training_set`: Builds the training dataset of a city, and
+    optionally writes it to the GeoJSON or GeoParquet file read by
+    `model.train`.
+
+Example Usage:
+>>> build_training_set("data/seattle_weather.csv",
+...                    "data/seattle_building_footprints.parquet",
+...                    output_path="data/seattle_training.geojson")
+>>> train("data/seattle_training.geojson", fname="seattle_model.bin")
+"""
+
+import os
+import pandas as pd
+import geopandas as gpd
+
+from heat_island.data_process import clean_weather_data
+from heat_island.geo_process import create_hexagons
+from heat_island.building_store import read_building_store
+from heat_island.building_memmap import BuildingArrays, hexagon_stats_arrays
+from heat_island.height_acquire import hexagon_stats_batch, hexagon_stats_multi_radius
+from heat_island.terrain_features import terrain_stats
+
+
+# Radius of the station hexagons of the existing training data, in meters
+DEFAULT_RADIUS = 160
+
+
+def build_training_set(weather_csv, building_store, radius=DEFAULT_RADIUS,
+                       output_path=None, radii=None, terrain_path=None):
+    """
+    Build the training dataset of a city.
+
+    Parameters:
+    weather_csv (str): Path of the weather CSV of the city, with 'Station
+        ID', 'Lat', 'Lon' and 'Ave temp annual_F' columns.
+    building_store (str): Path of the building store of the city (see
+        `heat_island.building_store`), or of a directory of building
+        arrays (see `heat_island.building_memmap`).
+    radius (float, optional): Radius of the hexagon of each station, in
+        meters. Defaults to the radius of the existing training data.
+    output_path (str, optional): `.geojson` or `.parquet` file to write
+        the dataset to.
+    radii (list, optional): Radii, in meters, of additional hexagons
+        around each station. Their statistics are added as wide columns
+        named by `multi_radius_column`, such as
+        'centroid_stat_mean_320m', computed from a single spatial query.
+    terrain_path (str, optional): Path of a DEM, such as the trimmed
+        terrain of `terrain_acquire`. The elevation statistics of each
+        hexagon (see `terrain_stats`) are added as the `terrain_*`
+        features of `model.get_keys(terrain=True)`.
+
+    Returns:
+    gpd.GeoDataFrame: One row per station, with the weather columns, the
+    `centroid_stat_*` columns and the hexagon of the station as geometry.
+    Stations without buildings have NaN statistics, and are dropped by
+    `model.clean_data`.
+
+    Raises:
+    ValueError: If `output_path` is neither a `.geojson` nor a `.parquet`
+        file.
+    """
+
+    if output_path is not None and not str(output_path).endswith(('.geojson', '.parquet')):
+        raise ValueError("Incorrect file format: Expect '.geojson' or '.parquet'")
+
+    # Clean the weather data and create the hexagons of all stations at once
+    weather = clean_weather_data(pd.read_csv(weather_csv)).reset_index(drop=True)
+    hexagons = create_hexagons(weather['Lon'], weather['Lat'], radius)
+
+    # Building statistics of every hexagon
+    if os.path.isdir(building_store):
+        stats = hexagon_stats_arrays(BuildingArrays(building_store), hexagons)
+    else:
+        buildings = read_building_store(building_store, bbox=tuple(hexagons.total_bounds))
+        stats = hexagon_stats_batch(buildings, hexagons)
+    if radii:
+        stats = stats.join(_multi_radius_stats(weather, building_store, radii))
+    if terrain_path is not None:
+        stats = stats.join(terrain_stats(hexagons, terrain_path))
+
+    training = gpd.GeoDataFrame(weather.join(stats), geometry=hexagons, crs=4326)
+    if output_path is not None:
+        if str(output_path).endswith('.parquet'):
+            training.to_parquet(output_path)
+        else:
+            training.to_file(output_path, driver='GeoJSON')
+        print(f"Training set saved as: {output_path}")
+    return training
+
+
+def _multi_radius_stats(weather, building_store, radii):
+    """
+    Statistics of the hexagons of every radius around the stations, with
+    the buildings around the largest hexagons.
+    """
+
+    bbox = tuple(create_hexagons(weather['Lon'], weather['Lat'], max(radii)).total_bounds)
+    if os.path.isdir(building_store):
+        buildings = pd.DataFrame(BuildingArrays(building_store).select(bbox))
+    else:
+        buildings = read_building_store(building_store, bbox=bbox)
+    return hexagon_stats_multi_radius(buildings, weather['Lon'], weather['Lat'], radii)
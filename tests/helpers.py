@@ -0,0 +1,33 @@
+"""
+helpers.py: Shared fixtures of the tests
+
+Functions included in this module:
+- make_buildings(): Square buildings with random heights over a part of Seattle.
+
+Set up:
+python -m unittest discover
+"""
+
+import numpy as np
+import geopandas as gpd
+import shapely
+
+
+# Default area of the buildings, as (minx, miny, maxx, maxy)
+SEATTLE_BOUNDS = (-122.35, 47.60, -122.33, 47.61)
+
+
+def make_buildings(n=3000, seed=0, bounds=SEATTLE_BOUNDS, ids=False):
+    """
+    Create square buildings with random heights within bounds in Seattle,
+    optionally with an 'id' column
+    """
+    minx, miny, maxx, maxy = bounds
+    rng = np.random.default_rng(seed)
+    x = minx + rng.uniform(0, maxx - minx, n)
+    y = miny + rng.uniform(0, maxy - miny, n)
+    size = rng.uniform(0.00002, 0.0001, n)
+    columns = {'id': np.arange(n)} if ids else {}
+    columns['height'] = rng.uniform(3, 60, n)
+    return gpd.GeoDataFrame(columns, geometry=shapely.box(x, y, x + size, y + size),
+                            crs=4326)
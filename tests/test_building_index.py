@@ -0,0 +1,81 @@
+"""
+test_building_index.py: Tests for building_index.py
+
+Tests included in this module:
+- test_query_matches_within(): The index selects the same buildings as a full scan.
+- test_candidates_superset(): The bounding box prefilter keeps every match.
+- test_stats_with_index(): Hexagon statistics are unchanged when using the index.
+- test_without_centroid_column(): The index falls back to geometry centroids.
+
+Set up:
+python -m unittest discover
+"""
+
+import unittest
+import numpy as np
+
+from heat_island import geo_process
+from heat_island import height_acquire
+from heat_island.building_index import BuildingIndex
+from tests import helpers
+
+
+def make_buildings(n=500, seed=0):
+    """
+    Create square buildings with random heights around a point in Seattle
+    """
+    return height_acquire.get_centroid(helpers.make_buildings(
+        n, seed, bounds=(-122.34843, 47.65492, -122.34243, 47.66092)))
+
+
+class TestBuildingIndex(unittest.TestCase):
+    """
+    This class verifies that the spatial index selects exactly the buildings
+    whose centroid is within a hexagon.
+    """
+
+    def setUp(self):
+        self.buildings = make_buildings()
+        self.hexagon = geo_process.create_hexagon(-122.34543, 47.65792)
+        self.index = BuildingIndex(self.buildings)
+
+
+    def test_query_matches_within(self):
+        """
+        The selected rows are the same as with a full `within` scan
+        """
+        expected = self.buildings[self.buildings['centroid'].within(self.hexagon)]
+        selected = self.index.select(self.hexagon)
+        self.assertGreater(len(selected), 0)
+        self.assertEqual(list(selected.index), list(expected.index))
+
+
+    def test_candidates_superset(self):
+        """
+        The bounding box candidates include every exact match
+        """
+        candidates = set(self.index.candidates(self.hexagon))
+        self.assertTrue(set(self.index.query(self.hexagon)) <= candidates)
+        self.assertLess(len(candidates), len(self.index))
+
+
+    def test_stats_with_index(self):
+        """
+        average_building_height_with_centroid gives the same result with the index
+        """
+        expected = height_acquire.average_building_height_with_centroid(
+            self.buildings, self.hexagon)
+        result = height_acquire.average_building_height_with_centroid(
+            self.buildings, self.hexagon, index=self.index)
+        self.assertEqual(result.keys(), expected.keys())
+        for key, value in expected.items():
+            self.assertAlmostEqual(result[key], value)
+
+
+    def test_without_centroid_column(self):
+        """
+        An index over buildings without a 'centroid' column uses their centroids
+        """
+        index = BuildingIndex(self.buildings.drop(columns=['centroid']))
+        np.testing.assert_array_equal(index.query(self.hexagon),
+                                      self.index.query(self.hexagon))
@@ -0,0 +1,116 @@
+"""
+test_building_memmap.py: Tests for building_memmap.py
+
+Tests included in this module:
+- test_cell_index(): Buildings are sorted by cell and the offsets bound every cell.
+- test_select(): A bounding box query returns the buildings whose centroid is inside.
+- test_matches_batch(): Statistics from the arrays equal the batch statistics.
+- test_geodataframe_source(): Arrays can be written directly from buildings.
+- test_invalid_input(): Bad sources and directories raise a ValueError.
+
+Set up:
+python -m unittest discover
+"""
+
+import os
+import tempfile
+import unittest
+import numpy as np
+import shapely
+
+from heat_island import building_memmap
+from heat_island.geo_process import hexagon_grid
+from heat_island.height_acquire import hexagon_stats_batch
+from heat_island.building_store import write_building_store, read_building_store
+from tests.helpers import make_buildings
+
+
+class TestBuildingMemmap(unittest.TestCase):
+    """
+    This class verifies the memory-mapped building arrays.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        store = os.path.join(self.tmpdir.name, "buildings.parquet")
+        write_building_store(make_buildings(), store, row_group_size=700)
+        self.buildings = read_building_store(store)
+        self.path = os.path.join(self.tmpdir.name, "arrays")
+        # Small batches exercise the counting sort across batches
+        building_memmap.write_building_arrays(store, self.path, cell_size=0.002,
+                                              batch_size=999)
+        self.arrays = building_memmap.BuildingArrays(self.path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+
+    def test_cell_index(self):
+        """
+        Every building lies in the cell whose offsets contain it
+        """
+        self.assertEqual(len(self.arrays), len(self.buildings))
+        self.assertEqual(self.arrays.crs, "EPSG:4326")
+        self.assertIsInstance(self.arrays.height, np.memmap)
+        keys = building_memmap._cell_keys(self.arrays.centroid_x, self.arrays.centroid_y,
+                                          self.arrays.meta)
+        self.assertTrue(np.all(np.diff(keys) >= 0))
+        offsets = np.asarray(self.arrays.cell_offsets)
+        np.testing.assert_array_equal(offsets[1:] - offsets[:-1],
+                                      np.bincount(keys, minlength=len(offsets) - 1))
+        np.testing.assert_allclose(np.sort(self.arrays.height),
+                                   np.sort(self.buildings['height']))
+
+
+    def test_select(self):
+        """
+        Only the cells around the box are read, and the box is exact
+        """
+        bbox = (-122.345, 47.602, -122.340, 47.605)
+        read = sum(stop - start for start, stop in self.arrays.ranges(bbox))
+        self.assertLess(read, len(self.arrays) / 4)
+        selected = self.arrays.select(bbox, columns=['height'])
+        self.assertEqual(list(selected), ['height'])
+        inside = (self.buildings['centroid_x'].between(bbox[0], bbox[2])
+                  & self.buildings['centroid_y'].between(bbox[1], bbox[3]))
+        np.testing.assert_allclose(np.sort(selected['height']),
+                                   np.sort(self.buildings.loc[inside, 'height']))
+        self.assertEqual(len(self.arrays.select((0, 0, 1, 1))['height']), 0)
+
+
+    def test_matches_batch(self):
+        """
+        Small chunks of hexagons give the batch table, planar or projected
+        """
+        grid = hexagon_grid(shapely.box(-122.352, 47.598, -122.328, 47.612), 80)
+        for projected in (False, True):
+            expected = hexagon_stats_batch(self.buildings, grid.geometry, projected=projected)
+            result = building_memmap.hexagon_stats_arrays(self.path, grid.geometry,
+                                                          chunk_size=25, projected=projected)
+            self.assertEqual(list(result.index), list(grid.index))
+            np.testing.assert_allclose(result.to_numpy(), expected.to_numpy(), rtol=1e-9)
+        self.assertTrue(result.isna().all(axis=1).any())
+
+
+    def test_geodataframe_source(self):
+        """
+        Buildings without precomputed columns fill the same cells
+        """
+        path = os.path.join(self.tmpdir.name, "from_gdf")
+        building_memmap.write_building_arrays(make_buildings(), path, cell_size=0.002)
+        arrays = building_memmap.BuildingArrays(path)
+        np.testing.assert_array_equal(arrays.cell_offsets, self.arrays.cell_offsets)
+        np.testing.assert_allclose(np.sort(arrays.footprint_area_m2),
+                                   np.sort(self.arrays.footprint_area_m2))
+
+
+    def test_invalid_input(self):
+        """
+        Sources must be building stores, and directories must hold arrays
+        """
+        with self.assertRaises(ValueError):
+            building_memmap.write_building_arrays("buildings.geojson", self.path)
+        with self.assertRaises(ValueError):
+            building_memmap.write_building_arrays(self.buildings, self.path, cell_size=0)
+        with self.assertRaises(ValueError):
+            building_memmap.BuildingArrays(self.tmpdir.name)
@@ -0,0 +1,108 @@
+"""
+test_building_store.py: Tests for building_store.py
+
+Tests included in this module:
+- test_roundtrip(): Buildings written to the store are read back with their columns.
+- test_bbox_read(): A bounding box read returns the buildings whose centroid is inside.
+- test_row_group_pruning(): A bounding box read only touches some row groups.
+- test_invalid_path(): Writing to a non-parquet path raises a ValueError.
+- test_area_m2(): The equal-area footprint area is in square meters.
+
+Set up:
+python -m unittest discover
+"""
+
+import os
+import tempfile
+import unittest
+import numpy as np
+import geopandas as gpd
+import shapely
+import pyarrow.dataset as ds
+
+from heat_island import building_store
+from tests import helpers
+
+
+def make_buildings(n=2000, seed=0):
+    """
+    Create square buildings with ids and random heights over a part of Seattle
+    """
+    return helpers.make_buildings(n, seed, bounds=(-122.40, 47.60, -122.30, 47.70), ids=True)
+
+
+class TestBuildingStore(unittest.TestCase):
+    """
+    This class verifies the GeoParquet building store.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "buildings.parquet")
+        self.buildings = make_buildings()
+        building_store.write_building_store(self.buildings, self.path,
+                                            row_group_size=100)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+
+    def test_roundtrip(self):
+        """
+        Every building is stored with float32 height, centroid and area
+        """
+        result = building_store.read_building_store(self.path)
+        self.assertEqual(len(result), len(self.buildings))
+        self.assertEqual(result.crs, self.buildings.crs)
+        self.assertEqual(result['height'].dtype, np.float32)
+        result = result.sort_values('id')
+        np.testing.assert_allclose(result['centroid_x'],
+                                   self.buildings.geometry.centroid.x)
+        np.testing.assert_allclose(result['footprint_area'], self.buildings.area)
+
+
+    def test_bbox_read(self):
+        """
+        Only the buildings whose centroid is inside the box are returned
+        """
+        bbox = (-122.37, 47.62, -122.35, 47.64)
+        result = building_store.read_building_store(self.path, bbox=bbox)
+        centroids = self.buildings.geometry.centroid
+        expected = self.buildings[centroids.x.between(bbox[0], bbox[2])
+                                  & centroids.y.between(bbox[1], bbox[3])]
+        self.assertGreater(len(result), 0)
+        self.assertEqual(sorted(result['id']), sorted(expected['id']))
+
+
+    def test_row_group_pruning(self):
+        """
+        Spatial sorting lets a small box skip most row groups
+        """
+        dataset = ds.dataset(self.path, format="parquet")
+        expression = ((ds.field('centroid_x') >= -122.37) & (ds.field('centroid_x') <= -122.36)
+                      & (ds.field('centroid_y') >= 47.62) & (ds.field('centroid_y') <= 47.63))
+        fragment = next(dataset.get_fragments())
+        total = len(fragment.split_by_row_group())
+        selected = len(fragment.split_by_row_group(expression))
+        self.assertEqual(total, 20)
+        self.assertLess(selected, total / 2)
+
+
+    def test_invalid_path(self):
+        """
+        The store must be a .parquet file
+        """
+        with self.assertRaises(ValueError):
+            building_store.write_building_store(self.buildings, "buildings.geojson")
+
+
+    def test_area_m2(self):
+        """
+        A 0.0001 degree square at 47.6N is about 11.1 m by 7.5 m
+        """
+        square = gpd.GeoDataFrame({'height': [10.0]},
+                                  geometry=[shapely.box(-122.3, 47.6, -122.2999, 47.6001)],
+                                  crs=4326)
+        square = building_store.add_building_columns(square)
+        self.assertAlmostEqual(square['footprint_area_m2'].iloc[0], 83.4, delta=0.5)
+        self.assertTrue(building_store.has_building_columns(square))
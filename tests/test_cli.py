@@ -0,0 +1,189 @@
+"""
+test_cli.py: Tests for cli.py
+
+Tests included in this module:
+- test_parser(): Repeated points and the options of each subcommand are parsed.
+- test_predict(): Points from the command line and from a CSV file are predicted at once.
+- test_build_training(): The training dataset is written without any prompt.
+- test_heatmap(): The cells of a city are written to the output file.
+- test_invalid_input(): Missing points or columns, and options ignored by --step, are usage errors.
+- test_import_main(): Importing heat_island_main does not prompt the user.
+
+Set up:
+python -m unittest discover
+"""
+
+import os
+import io
+import sys
+import importlib
+import tempfile
+import unittest
+from unittest import mock
+from contextlib import redirect_stderr
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from sklearn.neighbors import KNeighborsRegressor
+from sklearn.preprocessing import StandardScaler
+
+from heat_island import cli
+from heat_island import model
+from heat_island import pipeline
+from heat_island.building_store import write_building_store, read_building_store
+from heat_island.geo_process import create_hexagons
+from heat_island.height_acquire import hexagon_stats_batch
+from tests.helpers import make_buildings
+
+
+class TestCli(unittest.TestCase):
+    """
+    This class verifies the subcommands of the command line interface.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = os.path.join(self.tmpdir.name, "buildings.parquet")
+        write_building_store(make_buildings(), self.store)
+
+        # A model trained on random features
+        rng = np.random.default_rng(0)
+        x_train = rng.uniform(0, 1, (50, len(model.get_keys())))
+        scale = StandardScaler().fit(x_train)
+        knn = KNeighborsRegressor(n_neighbors=3).fit(scale.transform(x_train),
+                                                    rng.uniform(50, 60, 50))
+        self.model_path = model.save_model(knn, scale, self.tmpdir.name + "/", "test.bin")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def path(self, name):
+        """
+        Path of a file in the temporary directory
+        """
+        return os.path.join(self.tmpdir.name, name)
+
+
+    def test_parser(self):
+        """
+        Every subcommand parses its arguments into the function running it
+        """
+        parser = cli.build_parser()
+        args = parser.parse_args(["predict", "model.bin", "store.parquet",
+                                  "--point", "47.6", "-122.3", "--point", "47.7", "-122.4"])
+        self.assertEqual(args.point, [[47.6, -122.3], [47.7, -122.4]])
+        self.assertEqual(args.radius, 160)
+        self.assertIs(args.func, cli._predict)  # pylint: disable=protected-access
+        args = parser.parse_args(["build-training", "weather.csv", "store.parquet",
+                                  "-o", "training.geojson", "--radii", "80", "320"])
+        self.assertEqual(args.radii, [80, 320])
+        args = parser.parse_args(["train", "training.geojson", "--search", "random"])
+        self.assertEqual((args.output, args.search, args.terrain), ("model.bin", "random", False))
+        for command in ["ingest", "heatmap"]:
+            self.assertIn(command, parser.format_help())
+        with redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            parser.parse_args([])
+
+
+    def test_predict(self):
+        """
+        The predictions of all points match a direct prediction of their hexagons
+        """
+        points = self.path("points.csv")
+        pd.DataFrame({'Lat': [47.605, 47.603], 'Lon': [-122.335, -122.345],
+                      'name': ['a', 'b']}).to_csv(points, index=False)
+        output = self.path("predictions.csv")
+        with mock.patch.object(pipeline, 'predict', wraps=pipeline.predict) as spy:
+            self.assertEqual(cli.main(["predict", self.model_path, self.store,
+                                       "--point", "47.607", "-122.34", "--points", points,
+                                       "-o", output]), 0)
+        self.assertEqual(spy.call_count, 1)
+        predictions = pd.read_csv(output)
+        self.assertEqual(list(predictions.columns),
+                         ['Lat', 'Lon', 'name', pipeline.PREDICTION_COLUMN])
+        np.testing.assert_allclose(predictions['Lat'], [47.607, 47.605, 47.603])
+
+        hexagons = create_hexagons(predictions['Lon'], predictions['Lat'], 160)
+        features = hexagon_stats_batch(read_building_store(self.store), hexagons)
+        features['Lat'] = predictions['Lat']
+        features['Lon'] = predictions['Lon']
+        knn, scale = model.load_model(self.model_path)
+        expected = model.predict(knn, scale, features[model.get_keys()])
+        np.testing.assert_allclose(predictions[pipeline.PREDICTION_COLUMN], expected)
+
+        # A file of points alone is streamed to the output
+        geojson = self.path("predictions.geojson")
+        cli.main(["predict", self.model_path, self.store, "--points", points, "-o", geojson])
+        streamed = gpd.read_file(geojson)
+        self.assertEqual(list(streamed['name']), ['a', 'b'])
+        np.testing.assert_allclose(streamed[pipeline.PREDICTION_COLUMN], expected[1:])
+
+
+    def test_build_training(self):
+        """
+        The training dataset of the weather CSV is written to the output
+        """
+        weather_csv = self.path("weather.csv")
+        pd.DataFrame({'Station ID': ['S1', 'S2'], 'Lat': [47.605, 47.603],
+                      'Lon': [-122.335, -122.345],
+                      'Ave temp annual_F': [52.0, 53.0]}).to_csv(weather_csv, index=False)
+        output = self.path("training.geojson")
+        with mock.patch('builtins.input', side_effect=AssertionError("prompted")):
+            cli.main(["build-training", weather_csv, self.store, "-o", output])
+        training = gpd.read_file(output)
+        self.assertEqual(list(training['Station ID']), ['S1', 'S2'])
+        self.assertFalse(training[model.get_keys()].isna().any().any())
+
+
+    def test_heatmap(self):
+        """
+        The predicted cells of the boundary are written to the output file
+        """
+        boundary = self.path("boundary.geojson")
+        gpd.GeoDataFrame(geometry=[shapely.box(-122.345, 47.602, -122.335, 47.608)],
+                         crs=4326).to_file(boundary)
+        output = self.path("cells.parquet")
+        cli.main(["heatmap", boundary, self.store, self.model_path, "-o", output])
+        cells = gpd.read_parquet(output)
+        self.assertIn('cell_id', cells.columns)
+        self.assertTrue(cells[pipeline.PREDICTION_COLUMN].notna().any())
+
+
+    def test_invalid_input(self):
+        """
+        Predicting without points, or from a file without coordinates, is a usage error
+        """
+        no_coordinates = self.path("no_coordinates.csv")
+        pd.DataFrame({'x': [1.0]}).to_csv(no_coordinates, index=False)
+        for argv in [["predict", self.model_path, self.store],
+                     ["predict", self.model_path, self.store, "--points", no_coordinates]]:
+            with redirect_stderr(io.StringIO()) as stderr, \
+                    self.assertRaises(SystemExit) as context:
+                cli.main(argv)
+            self.assertEqual(context.exception.code, 2)
+            self.assertIn("predict:", stderr.getvalue())
+
+        # The raster of pixels cannot also write cells or use their resolution
+        for options in [["-o", self.path("cells.parquet")], ["--resolution", "0.001"]]:
+            argv = ["heatmap", "boundary.geojson", self.store, self.model_path,
+                    "--step", "3", "--terrain", "dem.tif", "--raster", self.path("t.tif")]
+            with mock.patch.object(cli, 'predict_raster') as predict_raster, \
+                    redirect_stderr(io.StringIO()) as stderr, \
+                    self.assertRaises(SystemExit) as context:
+                cli.main(argv + options)
+            self.assertEqual(context.exception.code, 2)
+            self.assertIn("heatmap:", stderr.getvalue())
+            predict_raster.assert_not_called()
+
+
+    def test_import_main(self):
+        """
+        The interactive session of heat_island_main only starts as a script
+        """
+        sys.modules.pop('heat_island_main', None)
+        with mock.patch('builtins.input', side_effect=AssertionError("prompted")), \
+                mock.patch('builtins.print') as printed:
+            main_module = importlib.import_module('heat_island_main')
+        printed.assert_not_called()
+        self.assertTrue(callable(main_module.main))
@@ -0,0 +1,138 @@
+"""
+test_dataset_links.py: Tests for dataset_links.py
+
+Tests included in this module:
+- test_index(): The table is indexed by quad key.
+- test_memoized(): The table is fetched once per process.
+- test_revalidate_not_modified(): An unchanged table is not downloaded again.
+- test_offline(): The local copy is used when the server is unreachable.
+- test_tile_url_errors(): Missing and duplicated quad keys raise a ValueError.
+
+The table is served by a local stand-in HTTP server.
+
+Set up:
+python -m unittest discover
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+from functools import partial
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+
+from heat_island import dataset_links
+
+LINKS_CSV = """Location,QuadKey,Url,Size,UploadDate
+UnitedStates,21230030,https://example.com/a.csv.gz,1.2MB,2023-04-25
+UnitedStates,21230021,https://example.com/b.csv.gz,2.4MB,2023-04-25
+UnitedStates,21230099,https://example.com/c.csv.gz,2.4MB,2023-04-25
+Canada,21230099,https://example.com/d.csv.gz,2.4MB,2023-04-25
+"""
+
+
+class RecordingHandler(SimpleHTTPRequestHandler):
+    """
+    Static file handler that records the status of every response.
+    """
+
+    statuses = []
+
+    def send_response(self, code, message=None):
+        RecordingHandler.statuses.append(code)
+        super().send_response(code, message)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class TestDatasetLinks(unittest.TestCase):
+    """
+    This class verifies the loading, caching and indexing of the dataset
+    links table.
+    """
+
+    def setUp(self):
+        self.serve_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.serve_dir.name, "dataset-links.csv"), "w",
+                  encoding="utf-8") as f:
+            f.write(LINKS_CSV)
+        RecordingHandler.statuses = []
+        handler = partial(RecordingHandler, directory=self.serve_dir.name)
+        self.server = HTTPServer(("127.0.0.1", 0), handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/dataset-links.csv"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop_server(self):
+        """
+        Stop the stand-in server, if it is still running
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def tearDown(self):
+        self.stop_server()
+        self.serve_dir.cleanup()
+        self.cache_dir.cleanup()
+
+    def load(self, **kwargs):
+        """
+        Load the table served by the stand-in server
+        """
+        return dataset_links.load_dataset_links(self.url, self.cache_dir.name,
+                                                **kwargs)
+
+
+    def test_index(self):
+        """
+        Each quad key maps to the list of its urls
+        """
+        links = self.load(refresh=True)
+        self.assertEqual(links[21230030], ["https://example.com/a.csv.gz"])
+        self.assertEqual(len(links[21230099]), 2)
+
+
+    def test_memoized(self):
+        """
+        A second load in the same process does not send a request
+        """
+        first = self.load(refresh=True)
+        second = self.load()
+        self.assertIs(first, second)
+        self.assertEqual(RecordingHandler.statuses, [200])
+
+
+    def test_revalidate_not_modified(self):
+        """
+        Revalidating an unchanged table gets a 304 and keeps the local copy
+        """
+        self.load(refresh=True)
+        links = self.load(refresh=True)
+        self.assertEqual(RecordingHandler.statuses, [200, 304])
+        self.assertIn(21230021, links)
+
+
+    def test_offline(self):
+        """
+        The local copy is used when the server cannot be reached
+        """
+        self.load(refresh=True)
+        self.stop_server()
+        links = self.load(refresh=True)
+        self.assertIn(21230030, links)
+
+
+    def test_tile_url_errors(self):
+        """
+        tile_url returns the single url or raises a ValueError
+        """
+        links = self.load(refresh=True)
+        self.assertEqual(dataset_links.tile_url(21230021, links),
+                         "https://example.com/b.csv.gz")
+        with self.assertRaises(ValueError):
+            dataset_links.tile_url(21230099, links)
+        with self.assertRaises(ValueError):
+            dataset_links.tile_url(12345678, links)
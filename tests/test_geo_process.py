@@ -6,13 +6,20 @@ Tests included in this module:
 - test_valid_polygon_output_type(): Verify the output type from the height acquisition process.
 - test_get_centroid(): Check the addition of 'centroid' column in GeoDataFrame.
 - test_with_multiple_geometries(): Validate the functioning with multiple geometries in a GeoDataFrame.
+- test_create_hexagons(): Vectorized hexagons equal the ones of create_hexagon.
+- test_hexagon_grid(): The grid covers the boundary without gaps or overlaps.
+- test_hexagon_grid_ids(): Cell IDs are stable and give back the cell centers.
+- test_equal_area_areas(): Areas are in square meters whatever the CRS of the input.
 
 Set up: 
 python -m unittest discover
 """
 
 import unittest
+import numpy as np
 import shapely
+import pandas as pd
+import geopandas as gpd
 import folium
 
 from heat_island import geo_process
@@ -90,3 +97,105 @@ class TestGeo(unittest.TestCase):
         # Check if the geometry in the GeoJSON is correct
         expected_geometry = shapely.geometry.mapping(hexagon)
         self.assertEqual(geojson_obj.data['geometry'], expected_geometry)
+
+
+    def test_create_hexagons(self):
+        """
+        This test verifies that `create_hexagons` builds, for every pair 
+        of coordinates, exactly the hexagon built by `create_hexagon`, 
+        keeps the index of the input, and rejects mismatched inputs.
+        """
+
+        longitudes = pd.Series([-74.0060, -122.34543, 0.0], index=[5, 7, 9])
+        latitudes = np.array([40.7128, 47.65792, 0.0])
+        hexagons = geo_process.create_hexagons(longitudes, latitudes, 160)
+
+        self.assertIsInstance(hexagons, gpd.GeoSeries)
+        self.assertEqual(list(hexagons.index), [5, 7, 9])
+        self.assertEqual(hexagons.crs, "EPSG:4326")
+        for (key, hexagon), lon, lat in zip(hexagons.items(), longitudes, latitudes):
+            expected = geo_process.create_hexagon(lon, lat, 160)
+            self.assertTrue(shapely.equals_exact(hexagon, expected, 1e-12), key)
+
+        with self.assertRaises(ValueError):
+            geo_process.create_hexagons([0.0, 1.0], [0.0], 160)
+
+
+    def test_hexagon_grid(self):
+        """
+        This test verifies that `hexagon_grid` covers a boundary file with 
+        hexagons of `create_hexagon` that neither overlap nor leave gaps, 
+        keeps only the cells touching the boundary, and can clip them.
+        """
+
+        boundary = shapely.union_all(
+            gpd.read_file("data/seattle_boundary.geojson").geometry.values)
+        shapely.prepare(boundary)
+        grid = geo_process.hexagon_grid("data/seattle_boundary.geojson", 300)
+
+        self.assertEqual(grid.crs, "EPSG:4326")
+        self.assertEqual(grid.index.name, 'cell_id')
+        self.assertTrue(grid.index.is_unique)
+        self.assertTrue(shapely.intersects(boundary, grid.geometry.values).all())
+        union = shapely.union_all(grid.geometry.values)
+        # No gaps inside the boundary, and no overlaps between the cells
+        self.assertAlmostEqual(boundary.difference(union).area, 0)
+        self.assertAlmostEqual(union.area / grid.geometry.area.sum(), 1)
+        first = grid.iloc[0]
+        self.assertTrue(shapely.equals_exact(
+            first.geometry, geo_process.create_hexagon(first['Lon'], first['Lat'], 300),
+            1e-12))
+
+        clipped = geo_process.hexagon_grid(boundary, 300, clip=True)
+        self.assertEqual(list(clipped.index), list(grid.index))
+        self.assertAlmostEqual(clipped.geometry.area.sum(), boundary.area)
+
+        with self.assertRaises(ValueError):
+            geo_process.hexagon_grid(boundary, 0)
+
+
+    def test_hexagon_grid_ids(self):
+        """
+        This test verifies that the same cell gets the same ID in the grid 
+        of any boundary, in every hemisphere, and that `cell_centers` gives 
+        back the centers of the cells from their IDs.
+        """
+
+        for minx, miny in [(-122.4, 47.5), (2.3, -48.9)]:
+            large = geo_process.hexagon_grid(shapely.geometry.box(minx, miny, minx + 0.1,
+                                                                  miny + 0.1), 160)
+            small = geo_process.hexagon_grid(shapely.geometry.box(minx + 0.05, miny + 0.05,
+                                                                  minx + 0.06, miny + 0.06),
+                                             160)
+            self.assertTrue(small.index.isin(large.index).all())
+            np.testing.assert_array_equal(small['Lon'], large.loc[small.index, 'Lon'])
+            longitudes, latitudes = geo_process.cell_centers(small.index, 160)
+            np.testing.assert_allclose(longitudes, small['Lon'])
+            np.testing.assert_allclose(latitudes, small['Lat'])
+            centers = gpd.GeoSeries(gpd.points_from_xy(longitudes, latitudes),
+                                    index=small.index, crs=4326)
+            self.assertTrue(small.contains(centers).all())
+
+
+    def test_equal_area_areas(self):
+        """
+        This test verifies that `equal_area_areas` returns the area of 
+        geometries in square meters, from EPSG:4326 or a projected CRS, 
+        and that the transformers are reused between calls.
+        """
+
+        squares = gpd.GeoSeries([shapely.geometry.box(-122.3, 47.6, -122.2999, 47.6001)] * 3,
+                                crs=4326)
+        areas = geo_process.equal_area_areas(squares.values)
+        # A 0.0001 degree square at 47.6N is about 11.1 m by 7.5 m
+        np.testing.assert_allclose(areas, 83.6, atol=0.1)
+
+        # The same squares in UTM zone 10N have the same areas
+        utm = squares.to_crs(32610)
+        np.testing.assert_allclose(geo_process.equal_area_areas(utm.values, crs=32610),
+                                   areas, rtol=1e-6)
+
+        hits = geo_process.get_transformer.cache_info().hits
+        geo_process.equal_area_areas(squares.values)
+        self.assertGreater(geo_process.get_transformer.cache_info().hits, hits)
+        self.assertEqual(len(geo_process.equal_area_areas([])), 0)
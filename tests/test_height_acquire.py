@@ -6,18 +6,30 @@ Tests included in this module:
 - test_valid_polygon_output_type(): Verify the output type from the height acquisition process.
 - test_get_centroid(): Check the addition of 'centroid' column in GeoDataFrame.
 - test_with_multiple_geometries(): Validate the functioning with multiple geometries in a GeoDataFrame.
+- test_matches_single_hexagon(): Batch statistics match the per-hexagon statistics.
+- test_list_input(): Batch statistics accept a list of hexagons.
+- test_precomputed_columns(): Statistics use the ingest columns when present.
+- test_grouped_percentiles(): The grouped kernel matches the weighted helpers.
+- test_projected(): Projected statistics are in square meters and agree with planar ones.
+- test_multi_radius(): Multi-radius statistics match the batch statistics of each radius.
+- test_invalid_radii(): Empty or non-positive radii raise a ValueError.
+- test_parity(): weighted_summary matches the separate weighted helpers.
 
 Set up: 
 python -m unittest discover
 """
 
 import unittest
+import numpy as np
 import geopandas as gpd
 import shapely
 
 from heat_island import height_acquire
 from heat_island import geo_process
 from heat_island import data_process
+from heat_island.building_store import add_building_columns
+from tests import helpers
+
 
 class TestHeight(unittest.TestCase):
     """
@@ -73,3 +85,199 @@ class TestHeight(unittest.TestCase):
         self.assertIn('centroid', result_gdf.columns)
         for centroid, geometry in zip(result_gdf['centroid'], geometries):
             self.assertEqual(centroid, geometry)
+
+
+def make_buildings(n=400, seed=0):
+    """
+    Create square buildings with random heights around a point in Seattle
+    """
+    return height_acquire.get_centroid(helpers.make_buildings(
+        n, seed, bounds=(-122.34943, 47.65392, -122.34143, 47.66192)))
+
+
+class TestHexagonStatsBatch(unittest.TestCase):
+    """
+    This class verifies that the batch hexagon statistics match the
+    statistics computed one hexagon at a time.
+    """
+
+    def setUp(self):
+        self.buildings = make_buildings()
+        # Overlapping hexagons, and one hexagon without buildings
+        centers = [(-122.34543, 47.65792), (-122.3447, 47.6583),
+                   (-122.3480, 47.6560), (-122.2000, 47.7000)]
+        self.hexagons = gpd.GeoSeries(
+            [geo_process.create_hexagon(x, y, 160) for x, y in centers],
+            index=['a', 'b', 'c', 'empty'], crs=4326)
+
+
+    def test_matches_single_hexagon(self):
+        """
+        Every row equals the output of average_building_height_with_centroid
+        """
+        result = height_acquire.hexagon_stats_batch(self.buildings, self.hexagons)
+        self.assertEqual(list(result.index), list(self.hexagons.index))
+        for key, hexagon in self.hexagons.items():
+            expected = height_acquire.average_building_height_with_centroid(
+                self.buildings, hexagon)
+            self.assertEqual(list(result.columns), list(expected.keys()))
+            for column, value in expected.items():
+                if np.isnan(value):
+                    self.assertTrue(np.isnan(result.loc[key, column]))
+                else:
+                    self.assertAlmostEqual(result.loc[key, column], value,
+                                           delta=1e-9 * max(1, abs(value)))
+
+
+    def test_precomputed_columns(self):
+        """
+        Statistics from the ingest columns equal the ones from geometries
+        """
+        with_columns = add_building_columns(self.buildings.drop(columns=['centroid']))
+        for hexagon in self.hexagons:
+            expected = height_acquire.average_building_height_with_centroid(
+                self.buildings, hexagon)
+            result = height_acquire.average_building_height_with_centroid(
+                with_columns, hexagon)
+            np.testing.assert_allclose(list(result.values()), list(expected.values()))
+        np.testing.assert_allclose(
+            height_acquire.hexagon_stats_batch(with_columns, self.hexagons),
+            height_acquire.hexagon_stats_batch(self.buildings, self.hexagons))
+
+
+    def test_list_input(self):
+        """
+        A plain list of hexagons gives a positional index
+        """
+        result = height_acquire.hexagon_stats_batch(self.buildings,
+                                                    list(self.hexagons))
+        self.assertEqual(list(result.index), [0, 1, 2, 3])
+
+
+    def test_grouped_percentiles(self):
+        """
+        The grouped kernel agrees with weighted_percentile on each group
+        """
+        rng = np.random.default_rng(1)
+        groups = rng.integers(0, 5, 200)
+        data = rng.integers(0, 10, 200).astype(float)
+        weights = rng.uniform(0, 2, 200)
+        summary = height_acquire.grouped_weighted_summary(groups, data, weights, 6)
+        for group in range(5):
+            mask = groups == group
+            for k, percentile in enumerate((0, 25, 50, 75, 100)):
+                self.assertAlmostEqual(
+                    summary['percentiles'][group, k],
+                    height_acquire.weighted_percentile(data[mask], weights[mask],
+                                                       percentile))
+            self.assertAlmostEqual(summary['std'][group],
+                                   height_acquire.weighted_std(data[mask], weights[mask]))
+        self.assertTrue(np.all(np.isnan(summary['percentiles'][5])))
+
+
+    def test_projected(self):
+        """
+        Projected areas change the units but not the coverage ratio
+        """
+        planar = height_acquire.hexagon_stats_batch(self.buildings, self.hexagons)
+        projected = height_acquire.hexagon_stats_batch(self.buildings, self.hexagons,
+                                                       projected=True)
+        # The weights of all buildings scale alike, so the height
+        # statistics barely change
+        for column in ['centroid_stat_mean', 'centroid_stat_50%', 'centroid_stat_max']:
+            np.testing.assert_allclose(projected[column], planar[column], rtol=1e-3)
+        np.testing.assert_allclose(projected['centroid_stat_avg_height_area'],
+                                   planar['centroid_stat_avg_height_area'], rtol=1e-3)
+        # A square degree is about 8.3e9 square meters at 47.6N
+        ratio = (projected['centroid_stat_total_height_area']
+                 / planar['centroid_stat_total_height_area'])
+        np.testing.assert_allclose(ratio.iloc[:3], 8.34e9, rtol=0.01)
+        single = height_acquire.average_building_height_with_centroid(
+            self.buildings, self.hexagons['a'], projected=True)
+        np.testing.assert_allclose(list(single.values()), projected.loc['a'])
+
+
+class TestMultiRadius(unittest.TestCase):
+    """
+    This class verifies that the statistics of several radii from one
+    query match the batch statistics of each radius.
+    """
+
+    def setUp(self):
+        self.buildings = make_buildings(2000)
+        rng = np.random.default_rng(3)
+        self.lons = -122.34543 + rng.uniform(-0.003, 0.003, 20)
+        self.lats = 47.65792 + rng.uniform(-0.003, 0.003, 20)
+
+
+    def test_multi_radius(self):
+        """
+        Each radius has the columns of hexagon_stats_batch, in the order of radii
+        """
+        radii = [160, 40, 320]
+        for projected in (False, True):
+            result = height_acquire.hexagon_stats_multi_radius(
+                self.buildings, self.lons, self.lats, radii, projected=projected)
+            self.assertEqual(list(result.columns), height_acquire.multi_radius_keys(radii))
+            for radius in radii:
+                expected = height_acquire.hexagon_stats_batch(
+                    self.buildings, geo_process.create_hexagons(self.lons, self.lats, radius),
+                    projected=projected)
+                columns = [height_acquire.multi_radius_column(column, radius)
+                           for column in expected.columns]
+                np.testing.assert_allclose(result[columns].to_numpy(), expected.to_numpy(),
+                                           rtol=1e-9)
+        self.assertIn('centroid_stat_mean_40m', result.columns)
+
+
+    def test_invalid_radii(self):
+        """
+        Empty or non-positive radii raise a ValueError
+        """
+        for radii in ([], [160, 0]):
+            with self.assertRaises(ValueError):
+                height_acquire.hexagon_stats_multi_radius(self.buildings, self.lons,
+                                                          self.lats, radii)
+
+
+class TestWeightedSummary(unittest.TestCase):
+    """
+    This class verifies that weighted_summary keeps numerical parity with
+    the separate weighted helper functions.
+    """
+
+    def test_parity(self):
+        """
+        Mean, std and percentiles match np.average, weighted_std and weighted_percentile
+        """
+        rng = np.random.default_rng(2)
+        # Integer data so that ties are common
+        data = rng.integers(0, 20, 300).astype(float)
+        weights = rng.uniform(0, 3, 300)
+        percentiles = (0, 10, 25, 50, 75, 90, 100)
+        summary = height_acquire.weighted_summary(data, weights, percentiles)
+        self.assertAlmostEqual(summary['mean'], np.average(data, weights=weights))
+        self.assertAlmostEqual(summary['std'], height_acquire.weighted_std(data, weights))
+        self.assertAlmostEqual(summary['weighted_sum'], np.sum(data * weights))
+        for value, percentile in zip(summary['percentiles'], percentiles):
+            self.assertEqual(value,
+                             height_acquire.weighted_percentile(data, weights, percentile))
+
+    def test_docstring_example(self):
+        """
+        The weighted median of the docstring example is interpolated
+        """
+        summary = height_acquire.weighted_summary([1, 2, 3, 4, 5], [1, 2, 3, 4, 5],
+                                                  percentiles=(50,))
+        self.assertEqual(summary['percentiles'][0], 3.375)
+
+    def test_invalid_input(self):
+        """
+        Mismatched lengths, negative weights and invalid percentiles raise a ValueError
+        """
+        with self.assertRaises(ValueError):
+            height_acquire.weighted_summary([1, 2], [1])
+        with self.assertRaises(ValueError):
+            height_acquire.weighted_summary([1, 2], [1, -1])
+        with self.assertRaises(ValueError):
+            height_acquire.weighted_summary([1, 2], [1, 1], percentiles=(101,))
@@ -0,0 +1,201 @@
+"""
+test_incremental_ingest.py: Tests for incremental_ingest.py
+
+Tests included in this module:
+- test_first_ingest(): Every tile is fetched, with its quad key and manifest entry.
+- test_unchanged_rerun(): A rerun without upstream changes downloads nothing.
+- test_changed_tile(): Only a changed tile is fetched, and only its rows are replaced.
+- test_new_release(): A tile with a new url is fetched again.
+- test_removed_tile(): Rows of a tile no longer requested are removed.
+- test_aoi(): Buildings outside the area of interest are dropped, and a new area refreshes every tile.
+- test_invalid_path(): A store that is not a `.parquet` file raises a ValueError.
+
+The tiles are served by a local stand-in HTTP server.
+
+Set up:
+python -m unittest discover
+"""
+
+import os
+import gzip
+import json
+import tempfile
+import threading
+import unittest
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import numpy as np
+import shapely
+
+from heat_island.tile_cache import TileCache
+from heat_island.building_store import read_building_store
+from heat_island import incremental_ingest
+
+
+def write_tile(path, n, height, x0=-122.3):
+    """
+    Write a gzip-compressed GeoJSONL tile with `n` square buildings
+    """
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for i in range(n):
+            x, y = x0 + i * 0.001, 47.6
+            feature = {
+                "type": "Feature",
+                "properties": {"height": height, "confidence": -1},
+                "geometry": {"type": "Polygon", "coordinates": [[
+                    [x, y], [x + 0.0001, y], [x + 0.0001, y + 0.0001],
+                    [x, y + 0.0001], [x, y]]]}
+            }
+            f.write(json.dumps(feature) + "\n")
+
+
+class CountingHandler(SimpleHTTPRequestHandler):
+    """
+    Static file handler that counts the GET requests of each file.
+    """
+
+    downloads = {}
+
+    def do_GET(self):
+        name = self.path.lstrip("/")
+        CountingHandler.downloads[name] = CountingHandler.downloads.get(name, 0) + 1
+        super().do_GET()
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class TestIncrementalIngest(unittest.TestCase):
+    """
+    This class verifies that a refresh only fetches the changed tiles.
+    """
+
+    def setUp(self):
+        self.serve_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.store_dir = tempfile.TemporaryDirectory()
+        self.store = os.path.join(self.store_dir.name, "buildings.parquet")
+        CountingHandler.downloads = {}
+        handler = partial(CountingHandler, directory=self.serve_dir.name)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/"
+        self.links = {}
+        for quad_key in range(3):
+            name = f"tile{quad_key}.csv.gz"
+            write_tile(os.path.join(self.serve_dir.name, name), quad_key + 2,
+                       float(quad_key + 1), x0=-122.3 + quad_key)
+            self.links[quad_key] = [self.base_url + name]
+        self.cache = TileCache(self.cache_dir.name)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.serve_dir.cleanup()
+        self.cache_dir.cleanup()
+        self.store_dir.cleanup()
+
+    def update(self, quad_keys=(0, 1, 2), aoi=None):
+        """
+        Refresh the store from the stand-in server
+        """
+        return incremental_ingest.update_building_store(
+            self.store, list(quad_keys), aoi=aoi, links=self.links, cache=self.cache,
+            max_workers=2)
+
+
+    def test_first_ingest(self):
+        """
+        The first run fetches every tile and records it in the manifest
+        """
+        self.assertEqual(sorted(self.update()), [0, 1, 2])
+        buildings = read_building_store(self.store)
+        self.assertEqual(len(buildings), 2 + 3 + 4)
+        counts = buildings.groupby(incremental_ingest.QUADKEY_COLUMN).size()
+        self.assertEqual(counts.to_dict(), {0: 2, 1: 3, 2: 4})
+        self.assertEqual(sorted(buildings['id']), list(range(9)))
+        self.assertFalse(buildings['centroid_x'].isna().any())
+        manifest = incremental_ingest.load_manifest(self.store)
+        self.assertEqual(sorted(manifest['tiles']), [0, 1, 2])
+        self.assertEqual(manifest['tiles'][1]['url'], self.links[1][0])
+        self.assertEqual(manifest['tiles'][1]['size'],
+                         os.path.getsize(os.path.join(self.serve_dir.name, "tile1.csv.gz")))
+
+
+    def test_unchanged_rerun(self):
+        """
+        Without upstream changes, nothing is downloaded or rewritten
+        """
+        self.update()
+        mtime = os.path.getmtime(self.store)
+        downloads = dict(CountingHandler.downloads)
+        self.assertEqual(self.update(), [])
+        self.assertEqual(CountingHandler.downloads, downloads)
+        self.assertEqual(os.path.getmtime(self.store), mtime)
+
+
+    def test_changed_tile(self):
+        """
+        Only the changed tile is fetched again, bypassing its cache entry
+        """
+        self.update()
+        write_tile(os.path.join(self.serve_dir.name, "tile1.csv.gz"), 6, 42.0, x0=-121.3)
+        self.assertEqual(self.update(), [1])
+        self.assertEqual(CountingHandler.downloads,
+                         {"tile0.csv.gz": 1, "tile1.csv.gz": 2, "tile2.csv.gz": 1})
+        buildings = read_building_store(self.store)
+        tile1 = buildings[buildings[incremental_ingest.QUADKEY_COLUMN] == 1]
+        self.assertEqual(len(tile1), 6)
+        self.assertTrue((tile1['height'] == 42.0).all())
+        np.testing.assert_allclose(sorted(tile1['centroid_x']),
+                                   -121.3 + np.arange(6) * 0.001 + 0.00005)
+        others = buildings[buildings[incremental_ingest.QUADKEY_COLUMN] != 1]
+        self.assertEqual(sorted(others['height']), [1.0] * 2 + [3.0] * 4)
+        self.assertEqual(sorted(buildings['id']), list(range(12)))
+
+
+    def test_new_release(self):
+        """
+        A new url of a tile is a change, even with the same content
+        """
+        self.update()
+        os.link(os.path.join(self.serve_dir.name, "tile2.csv.gz"),
+                os.path.join(self.serve_dir.name, "tile2-v2.csv.gz"))
+        self.links[2] = [self.base_url + "tile2-v2.csv.gz"]
+        self.assertEqual(self.update(), [2])
+        self.assertEqual(len(read_building_store(self.store)), 9)
+        manifest = incremental_ingest.load_manifest(self.store)
+        self.assertEqual(manifest['tiles'][2]['url'], self.links[2][0])
+
+
+    def test_removed_tile(self):
+        """
+        The rows of a tile that is no longer requested are removed
+        """
+        self.update()
+        self.assertEqual(self.update([0, 2]), [])
+        buildings = read_building_store(self.store)
+        self.assertEqual(sorted(set(buildings[incremental_ingest.QUADKEY_COLUMN])), [0, 2])
+        self.assertEqual(sorted(incremental_ingest.load_manifest(self.store)['tiles']), [0, 2])
+
+
+    def test_aoi(self):
+        """
+        Only the buildings within the area of interest are stored
+        """
+        aoi = shapely.box(-122.301, 47.59, -122.2985, 47.61)
+        self.update(aoi=aoi)
+        self.assertEqual(len(read_building_store(self.store)), 2)
+        # A different area of interest refreshes every tile
+        self.assertEqual(sorted(self.update(aoi=aoi.buffer(2.5))), [0, 1, 2])
+        self.assertEqual(len(read_building_store(self.store)), 9)
+
+
+    def test_invalid_path(self):
+        """
+        The building store must be a GeoParquet file
+        """
+        with self.assertRaises(ValueError):
+            incremental_ingest.update_building_store("buildings.geojson", [0],
+                                                     links=self.links, cache=self.cache)
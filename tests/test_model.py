@@ -8,9 +8,18 @@ specifically focusing on aspects like data cleaning, model saving, and
 feature extraction.
 """
 
+import io
+import os
+import tempfile
 import unittest
+import warnings
+from contextlib import redirect_stdout
+from unittest import mock
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
 from sklearn.neighbors import KNeighborsRegressor
-from sklearn.preprocessing import StandardScaler
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
 from heat_island import model
 
 std = StandardScaler()
@@ -92,6 +101,74 @@ class TestCleanData(unittest.TestCase):
         self.assertEqual(len(data_feature), 10)
 
 
+class TestFindBestEstimator(unittest.TestCase):
+    """
+    Verifies the search options of find_best_estimator.
+    """
+
+    def setUp(self):
+        self.x, self.y = model.clean_data(PATH_NORMAL, FEATURES, TARGET)
+        self.scaler = StandardScaler().fit(self.x)
+
+    def test_budgeted_random_search(self):
+        """
+        A tiny time budget still returns a fitted model of each type
+        and reports the fit time of each model
+        """
+        output = io.StringIO()
+        with redirect_stdout(output):
+            best = model.find_best_estimator(self.x, self.y, self.scaler,
+                                             search='random', n_jobs=1,
+                                             time_budget=0.001)
+        self.assertEqual(list(best), ['KNN', 'LinearRegression',
+                                      'RandomForestRegressor'])
+        for name, estimator in best.items():
+            self.assertEqual(len(estimator.predict(self.scaler.transform(self.x))),
+                             len(self.x))
+            self.assertIn(f"{name} fitted in", output.getvalue())
+
+    def test_halving_search(self):
+        """
+        The successive halving search returns a fitted model of each type
+        """
+        # Successive halving needs enough rows for its first, smallest round
+        rng = np.random.default_rng(0)
+        x = pd.DataFrame(rng.uniform(0, 1, (120, len(FEATURES))), columns=FEATURES)
+        y = rng.uniform(50, 60, 120)
+        scaler = StandardScaler().fit(x)
+        with redirect_stdout(io.StringIO()):
+            best = model.find_best_estimator(x, y, scaler, search='halving',
+                                             n_jobs=1, cv=2)
+        self.assertEqual(list(best), ['KNN', 'LinearRegression',
+                                      'RandomForestRegressor'])
+        for estimator in best.values():
+            self.assertEqual(len(estimator.predict(scaler.transform(x))), len(x))
+
+    def test_random_search_small_grid(self):
+        """
+        The randomized search samples at most every setting of a model,
+        without warning about grids smaller than `n_iter`
+        """
+        with mock.patch.object(model, 'RandomizedSearchCV',
+                               wraps=model.RandomizedSearchCV) as spy, \
+                warnings.catch_warnings(record=True) as caught, \
+                redirect_stdout(io.StringIO()):
+            warnings.simplefilter('always')
+            model.find_best_estimator(self.x, self.y, self.scaler,
+                                      search='random', n_jobs=1, cv=2)
+        self.assertFalse([warning for warning in caught
+                          if 'smaller than n_iter' in str(warning.message)])
+        n_iters = [call.kwargs['n_iter'] for call in spy.call_args_list]
+        self.assertEqual(n_iters, [8, 1, 10])
+
+    def test_invalid_search(self):
+        """
+        An unknown search method raises a ValueError
+        """
+        with self.assertRaises(ValueError):
+            model.find_best_estimator(self.x, self.y, self.scaler, search='bayes')
+
+
 class TestGetKeys(unittest.TestCase):
     """
     Verifies the get_keys function, ensuring it
@@ -111,3 +188,89 @@ class TestGetKeys(unittest.TestCase):
                          'centroid_stat_75%',
                          'centroid_stat_max', 'Lat', 'Lon']
         self.assertEqual(model.get_keys(), expected_keys)
+
+
+class TestModelRegistry(unittest.TestCase):
+    """
+    Verifies that the ModelRegistry loads each model once
+    and predicts like `predict`.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.data = pd.DataFrame(rng.uniform(0, 1, (40, len(model.get_keys()))),
+                                 columns=model.get_keys())
+        scaler = StandardScaler().fit(self.data)
+        regressor = RandomForestRegressor(n_estimators=5, random_state=0)
+        regressor.fit(scaler.transform(self.data), rng.uniform(50, 60, 40))
+        self.path = model.save_model(regressor, scaler, self.tmpdir.name + '/',
+                                     'registry.bin')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_loaded_once(self):
+        """
+        The model file is read on the first prediction only
+        """
+        registry = model.ModelRegistry()
+        with mock.patch.object(model.joblib, 'load',
+                               wraps=model.joblib.load) as spy:
+            for _ in range(3):
+                registry.predict_many(self.path, self.data)
+        self.assertEqual(spy.call_count, 1)
+        self.assertEqual(len(registry), 1)
+
+    def test_same_predictions(self):
+        """
+        Columns are reordered, and predictions match `predict`
+        """
+        registry = model.ModelRegistry(mmap_mode='r')
+        regressor, scaler = model.load_model(self.path)
+        expected = model.predict(regressor, scaler, self.data)
+        shuffled = self.data[self.data.columns[::-1]].assign(extra=1.0)
+        np.testing.assert_allclose(registry.predict_many(self.path, shuffled),
+                                   expected)
+
+    def test_other_scalers(self):
+        """
+        Every scaler is applied like its own `transform`
+        """
+        rng = np.random.default_rng(1)
+        target = rng.uniform(50, 60, 40)
+        scalers = [StandardScaler(with_mean=False), StandardScaler(with_std=False),
+                   MinMaxScaler()]
+        for i, scaler in enumerate(scalers):
+            for j, data in enumerate([self.data, self.data.to_numpy()]):
+                scaler.fit(data)
+                regressor = KNeighborsRegressor(n_neighbors=3)
+                regressor.fit(scaler.transform(data), target)
+                path = model.save_model(regressor, scaler, self.tmpdir.name + '/',
+                                        f'scaler_{i}_{j}.bin')
+                expected = regressor.predict(scaler.transform(data))
+                np.testing.assert_allclose(
+                    model.ModelRegistry().predict_many(path, self.data), expected)
+
+    def test_missing_feature(self):
+        """
+        A missing feature raises a KeyError
+        """
+        with self.assertRaises(KeyError):
+            model.ModelRegistry().predict_many(self.path,
+                                               self.data.drop(columns=['Lat']))
+
+    def test_reload_modified(self):
+        """
+        A model saved again under the same name is reloaded
+        """
+        registry = model.ModelRegistry()
+        first = registry.get(self.path)[0]
+        os.remove(self.path)
+        regressor = KNeighborsRegressor(n_neighbors=3)
+        regressor.fit(self.data, np.arange(40.0))
+        model.save_model(regressor, StandardScaler().fit(self.data),
+                         self.tmpdir.name + '/', 'registry.bin')
+        os.utime(self.path, (1, 1))
+        self.assertIsNot(registry.get(self.path)[0], first)
+        self.assertIsInstance(registry.get(self.path)[0], KNeighborsRegressor)
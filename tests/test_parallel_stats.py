@@ -0,0 +1,80 @@
+"""
+test_parallel_stats.py: Tests for parallel_stats.py
+
+Tests included in this module:
+- test_matches_batch(): Statistics from worker processes equal the batch statistics.
+- test_single_process(): One worker computes the chunks in the calling process.
+- test_no_buildings(): Hexagons without any building get NaN statistics.
+- test_invalid_arguments(): Non-positive workers or chunk sizes raise a ValueError.
+
+Set up:
+python -m unittest discover
+"""
+
+import unittest
+import numpy as np
+import shapely
+
+from heat_island import parallel_stats
+from heat_island.geo_process import hexagon_grid
+from heat_island.height_acquire import hexagon_stats_batch
+from tests.helpers import make_buildings
+
+
+class TestParallelStats(unittest.TestCase):
+    """
+    This class verifies that the process-pool statistics match the batch
+    statistics.
+    """
+
+    def setUp(self):
+        self.buildings = make_buildings()
+        # Cells beyond the buildings on every side are empty
+        self.grid = hexagon_grid(shapely.box(-122.352, 47.598, -122.328, 47.612), 100)
+        self.expected = hexagon_stats_batch(self.buildings, self.grid.geometry)
+
+
+    def test_matches_batch(self):
+        """
+        Small chunks on two workers give the batch table, in grid order
+        """
+        result = parallel_stats.hexagon_stats_parallel(self.buildings, self.grid.geometry,
+                                                       max_workers=2, chunk_size=16)
+        self.assertEqual(list(result.index), list(self.grid.index))
+        self.assertEqual(list(result.columns), list(self.expected.columns))
+        np.testing.assert_allclose(result.to_numpy(), self.expected.to_numpy(), rtol=1e-9)
+
+
+    def test_single_process(self):
+        """
+        One worker gives the same table, with projected areas too
+        """
+        result = parallel_stats.hexagon_stats_parallel(self.buildings, list(self.grid.geometry),
+                                                       max_workers=1, chunk_size=50,
+                                                       projected=True)
+        expected = hexagon_stats_batch(self.buildings, list(self.grid.geometry),
+                                       projected=True)
+        self.assertEqual(list(result.index), list(range(len(self.grid))))
+        np.testing.assert_allclose(result.to_numpy(), expected.to_numpy(), rtol=1e-9)
+
+
+    def test_no_buildings(self):
+        """
+        Every statistic is NaN when there is no building at all
+        """
+        result = parallel_stats.hexagon_stats_parallel(self.buildings.iloc[:0],
+                                                       self.grid.geometry, max_workers=2)
+        self.assertEqual(len(result), len(self.grid))
+        self.assertTrue(result.isna().all().all())
+
+
+    def test_invalid_arguments(self):
+        """
+        max_workers and chunk_size must be positive
+        """
+        with self.assertRaises(ValueError):
+            parallel_stats.hexagon_stats_parallel(self.buildings, self.grid.geometry,
+                                                  max_workers=0)
+        with self.assertRaises(ValueError):
+            parallel_stats.hexagon_stats_parallel(self.buildings, self.grid.geometry,
+                                                  chunk_size=0)
@@ -0,0 +1,220 @@
+"""
+test_pipeline.py: Tests for pipeline.py
+
+Tests included in this module:
+- test_city_heatmap(): Every cell with buildings is predicted with a single model call.
+- test_building_arrays(): Memory-mapped building arrays give the same heat map.
+- test_outputs(): The cells and the heat map raster are written to disk.
+- test_invalid_output(): Writing cells to an unknown format raises a ValueError.
+- test_predict_points(): Each chunk of a file of points is predicted with a single model call.
+- test_stream_points(): The predictions are streamed to CSV, GeoJSON and .json files.
+- test_invalid_points(): Unknown formats and missing coordinates raise errors.
+
+Set up:
+python -m unittest discover
+"""
+
+import os
+import json
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import rasterio
+import shapely
+from sklearn.neighbors import KNeighborsRegressor
+from sklearn.preprocessing import StandardScaler
+
+from heat_island import pipeline
+from heat_island import model
+from heat_island.building_store import write_building_store
+from heat_island.building_memmap import write_building_arrays
+from tests.helpers import make_buildings
+
+
+class TestPipeline(unittest.TestCase):
+    """
+    This class verifies the full-city batch prediction pipeline.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = os.path.join(self.tmpdir.name, "buildings.parquet")
+        write_building_store(make_buildings(), self.store)
+        # The boundary is larger than the buildings, so some cells are empty
+        self.boundary = shapely.box(-122.352, 47.598, -122.328, 47.612)
+
+        # A model trained on random features in the ranges of the cells
+        rng = np.random.default_rng(0)
+        x_train = rng.uniform(0, 1, (50, len(model.get_keys())))
+        scale = StandardScaler().fit(x_train)
+        knn = KNeighborsRegressor(n_neighbors=3).fit(scale.transform(x_train),
+                                                    rng.uniform(50, 60, 50))
+        self.model_path = model.save_model(knn, scale, self.tmpdir.name + "/", "test.bin")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+
+    def test_city_heatmap(self):
+        """
+        Cells with buildings are predicted at once, empty cells are NaN
+        """
+        with mock.patch.object(pipeline, 'predict', wraps=pipeline.predict) as spy:
+            cells = pipeline.city_heatmap(self.boundary, self.store, self.model_path)
+        self.assertEqual(spy.call_count, 1)
+        self.assertEqual(cells.index.name, 'cell_id')
+        has_buildings = cells['centroid_stat_mean'].notna()
+        self.assertTrue(has_buildings.any())
+        self.assertFalse(has_buildings.all())
+        predicted = cells[pipeline.PREDICTION_COLUMN]
+        self.assertTrue((predicted.notna() == has_buildings).all())
+        self.assertTrue(predicted.dropna().between(50, 60).all())
+        self.assertTrue(cells['Lat'].between(47.59, 47.62).all())
+
+
+    def test_building_arrays(self):
+        """
+        A directory of building arrays can replace the building store
+        """
+        arrays = write_building_arrays(self.store, os.path.join(self.tmpdir.name, "arrays"))
+        expected = pipeline.city_heatmap(self.boundary, self.store, self.model_path)
+        cells = pipeline.city_heatmap(self.boundary, arrays, self.model_path)
+        np.testing.assert_allclose(cells[pipeline.PREDICTION_COLUMN],
+                                   expected[pipeline.PREDICTION_COLUMN])
+
+
+    def test_outputs(self):
+        """
+        The cells are written with their ID, and the raster has the predictions
+        """
+        output_path = os.path.join(self.tmpdir.name, "cells.geojson")
+        raster_path = os.path.join(self.tmpdir.name, "heatmap.tif")
+        cells = pipeline.city_heatmap(self.boundary, self.store, self.model_path,
+                                      output_path=output_path, raster_path=raster_path)
+
+        written = gpd.read_file(output_path)
+        self.assertEqual(sorted(written['cell_id']), sorted(cells.index))
+        parquet_path = pipeline.write_cells(cells, os.path.join(self.tmpdir.name,
+                                                                "cells.parquet"))
+        self.assertEqual(len(gpd.read_parquet(parquet_path)), len(cells))
+
+        with rasterio.open(raster_path) as src:
+            band = src.read(1)
+            self.assertEqual(src.crs.to_epsg(), 4326)
+        predicted = cells[pipeline.PREDICTION_COLUMN]
+        self.assertGreater(np.isfinite(band).sum(), 0)
+        self.assertGreaterEqual(np.nanmin(band), predicted.min() - 1e-3)
+        self.assertLessEqual(np.nanmax(band), predicted.max() + 1e-3)
+
+
+    def test_invalid_output(self):
+        """
+        Cells can only be written to GeoJSON or GeoParquet
+        """
+        grid = pipeline.hexagon_grid(self.boundary, 160)
+        with self.assertRaises(ValueError):
+            pipeline.write_cells(grid, os.path.join(self.tmpdir.name, "cells.csv"))
+
+
+    def write_points(self):
+        """
+        Write a CSV file of named sites, one of them without coordinates
+        """
+        rng = np.random.default_rng(1)
+        path = os.path.join(self.tmpdir.name, "sites.csv")
+        latitudes = 47.60 + rng.uniform(0, 0.01, 7)
+        latitudes[3] = np.nan
+        pd.DataFrame({'site': [f"site {i}" for i in range(7)], 'latitude': latitudes,
+                      'Longitude': -122.35 + rng.uniform(0, 0.02, 7)}).to_csv(path,
+                                                                             index=False)
+        return path
+
+
+    def test_predict_points(self):
+        """
+        Chunks of points are predicted at once, with the predictions of their coordinates
+        """
+        path = self.write_points()
+        with mock.patch.object(pipeline, 'predict', wraps=pipeline.predict) as spy:
+            points = pipeline.predict_points(path, self.store, self.model_path, chunk_size=3)
+        self.assertEqual(spy.call_count, 3)
+        self.assertEqual(list(points.columns),
+                         ['site', 'Lat', 'Lon', pipeline.PREDICTION_COLUMN])
+        self.assertEqual(list(points['site']), [f"site {i}" for i in range(7)])
+
+        predicted = points[pipeline.PREDICTION_COLUMN]
+        self.assertTrue(np.isnan(predicted[3]))
+        valid = points['Lat'].notna()
+        expected = pipeline.predict_coordinates(points.loc[valid, 'Lat'],
+                                                points.loc[valid, 'Lon'],
+                                                self.store, self.model_path)
+        np.testing.assert_allclose(predicted[valid], expected[pipeline.PREDICTION_COLUMN])
+        self.assertTrue(predicted[valid].between(50, 60).all())
+
+
+    def test_stream_points(self):
+        """
+        The CSV and GeoJSON outputs have every point and its prediction
+        """
+        path = self.write_points()
+        expected = pipeline.predict_points(path, self.store, self.model_path)
+        csv_path = os.path.join(self.tmpdir.name, "predictions.csv")
+        geojson_path = os.path.join(self.tmpdir.name, "predictions.geojson")
+        for output_path in [csv_path, geojson_path]:
+            self.assertEqual(pipeline.predict_points(path, self.store, self.model_path,
+                                                     output_path=output_path, chunk_size=2),
+                             output_path)
+        pd.testing.assert_frame_equal(pd.read_csv(csv_path), expected)
+
+        written = gpd.read_file(geojson_path)
+        self.assertEqual(list(written['site']), list(expected['site']))
+        np.testing.assert_allclose(written[pipeline.PREDICTION_COLUMN],
+                                   expected[pipeline.PREDICTION_COLUMN])
+        valid = expected['Lat'].notna()
+        self.assertTrue(written.geometry[~valid].isna().all())
+        np.testing.assert_allclose(written.geometry.x[valid], expected['Lon'][valid])
+
+        # GeoJSON files of points are read back as input
+        again = pipeline.predict_points(geojson_path, self.store, self.model_path)
+        np.testing.assert_allclose(again[pipeline.PREDICTION_COLUMN],
+                                   expected[pipeline.PREDICTION_COLUMN])
+        # No temporary file is left behind
+        self.assertEqual(len(os.listdir(self.tmpdir.name)), 5)
+
+        # .json files are written and read back like .geojson files, and
+        # numpy integers stay numbers
+        json_path = os.path.join(self.tmpdir.name, "sites.json")
+        points = pd.DataFrame({'Lat': [47.605], 'Lon': [-122.335],
+                               'floors': pd.Series([np.int64(3)], dtype=object)})
+        pipeline.write_points(points, json_path)
+        with open(json_path, encoding='utf-8') as file:
+            properties = json.load(file)['features'][0]['properties']
+        self.assertEqual(properties['floors'], 3)
+        self.assertEqual(pipeline.read_points(json_path)['floors'].tolist(), [3])
+
+
+    def test_invalid_points(self):
+        """
+        Files of points need a known format, coordinates and Point geometries
+        """
+        no_coordinates = os.path.join(self.tmpdir.name, "sites.csv")
+        pd.DataFrame({'site': ['a'], 'x': [1.0]}).to_csv(no_coordinates, index=False)
+        output_path = os.path.join(self.tmpdir.name, "predictions.csv")
+        with self.assertRaises(KeyError):
+            pipeline.predict_points(no_coordinates, self.store, self.model_path,
+                                    output_path=output_path)
+        # The failed output is not left behind
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)),
+                         ["buildings.parquet", "sites.csv", "test.bin"])
+
+        polygons = os.path.join(self.tmpdir.name, "sites.geojson")
+        gpd.GeoDataFrame(geometry=[self.boundary], crs=4326).to_file(polygons)
+        with self.assertRaises(ValueError):
+            pipeline.read_points(polygons)
+        with self.assertRaises(ValueError):
+            pipeline.read_points("sites.xlsx")
+        with self.assertRaises(ValueError):
+            pipeline.write_points(pd.DataFrame({'Lat': [1.0], 'Lon': [1.0]}), "sites.txt")
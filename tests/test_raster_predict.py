@@ -0,0 +1,296 @@
+"""
+test_raster_predict.py: Tests for raster_predict.py
+
+Tests included in this module:
+- test_grid_alignment(): The raster grid is aligned to the pixels of the DEM.
+- test_block_windows(): The blocks cover the raster without overlap.
+- test_predict_raster(): Each pixel gets the prediction of the hexagon centered on it.
+- test_process_pool(): A pool of workers writes the same raster as one process.
+- test_terrain_model(): Models trained with terrain features get the terrain statistics.
+- test_invalid_input(): Invalid block sizes and building stores raise a ValueError.
+- test_lattice_features(): The focal terrain and lattice building statistics match the hexagons.
+- test_projected_dem(): A projected DEM gets the statistics of the hexagons in lattice layers.
+- test_full_block(): A full block at the resolution of the DEM is predicted in seconds.
+
+Set up:
+python -m unittest discover
+"""
+
+import os
+import time
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import rasterio
+import shapely
+from rasterio.transform import from_origin
+from rasterio.warp import transform_bounds
+from sklearn.neighbors import KNeighborsRegressor
+from sklearn.preprocessing import StandardScaler
+
+from heat_island import raster_predict
+from heat_island import model
+from heat_island.building_store import write_building_store, read_building_store
+from heat_island.building_memmap import write_building_arrays
+from heat_island.geo_process import create_hexagons
+from heat_island.height_acquire import hexagon_stats_batch
+from heat_island.terrain_features import terrain_stats
+from tests.helpers import make_buildings
+
+
+def save_model(directory, features, name):
+    """
+    Save a model trained on random features with column names
+    """
+    rng = np.random.default_rng(0)
+    x_train = pd.DataFrame(rng.uniform(0, 1, (50, len(features))), columns=features)
+    scale = StandardScaler().fit(x_train)
+    knn = KNeighborsRegressor(n_neighbors=3).fit(scale.transform(x_train),
+                                                rng.uniform(50, 60, 50))
+    return model.save_model(knn, scale, directory + "/", name)
+
+
+class TestRasterPredict(unittest.TestCase):
+    """
+    This class verifies the block-parallel raster of predicted temperatures.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        store = os.path.join(self.tmpdir.name, "buildings.parquet")
+        write_building_store(make_buildings(), store)
+        self.buildings = read_building_store(store)
+        self.arrays = write_building_arrays(store, os.path.join(self.tmpdir.name, "arrays"))
+        self.model_path = save_model(self.tmpdir.name, model.get_keys(), "test.bin")
+
+        # A 1/3 arc-second DEM around the buildings
+        self.dem_path = os.path.join(self.tmpdir.name, "dem.tif")
+        self.dem_transform = from_origin(-122.36, 47.62, 1 / 10800, 1 / 10800)
+        rng = np.random.default_rng(1)
+        with rasterio.open(self.dem_path, "w", driver="GTiff", height=400, width=500,
+                           count=1, dtype="float32", crs="EPSG:4269",
+                           transform=self.dem_transform) as dst:
+            dst.write(rng.uniform(0, 100, (400, 500)).astype(np.float32), 1)
+        self.boundary = shapely.Polygon([(-122.349, 47.601), (-122.332, 47.6015),
+                                         (-122.335, 47.609), (-122.347, 47.6085)])
+        self.output = os.path.join(self.tmpdir.name, "temperature.tif")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+
+    def test_grid_alignment(self):
+        """
+        The grid starts on a DEM pixel edge and covers the boundary
+        """
+        _, transform, width, height = raster_predict.raster_grid(self.dem_path,
+                                                                 self.boundary, step=3)
+        self.assertAlmostEqual(transform.a, 3 / 10800)
+        col = (transform.c - self.dem_transform.c) / self.dem_transform.a
+        row = (transform.f - self.dem_transform.f) / self.dem_transform.e
+        self.assertAlmostEqual(col, round(col))
+        self.assertAlmostEqual(row, round(row))
+        minx, miny, maxx, maxy = self.boundary.bounds
+        self.assertLessEqual(transform.c, minx)
+        self.assertGreaterEqual(transform.c + width * transform.a, maxx)
+        self.assertGreaterEqual(transform.f, maxy)
+        self.assertLessEqual(transform.f + height * transform.e, miny)
+        with self.assertRaises(ValueError):
+            raster_predict.raster_grid(self.dem_path, shapely.box(0, 0, 1, 1))
+
+
+    def test_block_windows(self):
+        """
+        The windows of the blocks tile the raster
+        """
+        windows = raster_predict.block_windows(100, 70, 32)
+        self.assertEqual(len(windows), 4 * 3)
+        covered = np.zeros((70, 100), dtype=int)
+        for window in windows:
+            covered[window.toslices()] += 1
+        self.assertTrue((covered == 1).all())
+
+
+    def test_predict_raster(self):
+        """
+        Pixels inside the boundary have the prediction of their own hexagon
+        """
+        raster_predict.predict_raster(self.boundary, self.arrays, self.model_path,
+                                      self.dem_path, self.output, step=2,
+                                      block_size=32, max_workers=1)
+        with rasterio.open(self.output) as src:
+            band = src.read(1)
+            self.assertEqual(src.block_shapes, [(32, 32)])
+            self.assertEqual(src.compression.name, 'deflate')
+            self.assertEqual(src.overviews(1)[:2], [2, 4])
+            self.assertEqual(src.crs.to_epsg(), 4269)
+            transform = src.transform
+
+        rows, cols = np.nonzero(np.isfinite(band))
+        self.assertGreater(len(rows), 100)
+        # Pixels whose center is outside the boundary are nodata
+        x = transform.c + (np.arange(band.shape[1]) + 0.5) * transform.a
+        y = transform.f + (np.arange(band.shape[0]) + 0.5) * transform.e
+        xx, yy = np.meshgrid(x, y)
+        outside = ~shapely.contains_xy(self.boundary, xx, yy)
+        self.assertTrue(outside.any())
+        self.assertTrue(np.isnan(band[outside]).all())
+
+        # Compare a sample of pixels with a direct prediction
+        sample = np.random.default_rng(2).choice(len(rows), 20, replace=False)
+        lons, lats = x[cols[sample]], y[rows[sample]]
+        features = hexagon_stats_batch(self.buildings, create_hexagons(lons, lats, 160))
+        features['Lat'] = lats
+        features['Lon'] = lons
+        knn, scale = model.load_model(self.model_path)
+        expected = model.predict(knn, scale, features[model.get_keys()])
+        np.testing.assert_allclose(band[rows[sample], cols[sample]], expected, rtol=1e-5)
+
+
+    def test_process_pool(self):
+        """
+        Blocks predicted by worker processes are written at their window
+        """
+        raster_predict.predict_raster(self.boundary, self.arrays, self.model_path,
+                                      self.dem_path, self.output, step=2,
+                                      block_size=32, max_workers=1)
+        pooled = os.path.join(self.tmpdir.name, "pooled.tif")
+        raster_predict.predict_raster(self.boundary, self.arrays, self.model_path,
+                                      self.dem_path, pooled, step=2,
+                                      block_size=32, max_workers=2)
+        with rasterio.open(self.output) as serial, rasterio.open(pooled) as parallel:
+            np.testing.assert_array_equal(serial.read(1), parallel.read(1))
+
+
+    def test_terrain_model(self):
+        """
+        A model trained with the terrain features is predicted with them
+        """
+        model_path = save_model(self.tmpdir.name, model.get_keys(terrain=True), "terrain.bin")
+        raster_predict.predict_raster(self.boundary, self.arrays, model_path,
+                                      self.dem_path, self.output, step=4,
+                                      block_size=16, max_workers=1)
+        with rasterio.open(self.output) as src:
+            band = src.read(1)
+            transform = src.transform
+        row, col = np.argwhere(np.isfinite(band))[0]
+        lon = transform.c + (col + 0.5) * transform.a
+        lat = transform.f + (row + 0.5) * transform.e
+        hexagons = create_hexagons([lon], [lat], 160)
+        features = hexagon_stats_batch(self.buildings, hexagons).join(
+            terrain_stats(hexagons, self.dem_path))
+        features['Lat'] = lat
+        features['Lon'] = lon
+        knn, scale = model.load_model(model_path)
+        expected = model.predict(knn, scale, features[model.get_keys(terrain=True)])
+        self.assertAlmostEqual(band[row, col], expected[0], places=3)
+
+
+    def test_invalid_input(self):
+        """
+        Block sizes must be multiples of 16, and buildings building arrays
+        """
+        with self.assertRaises(ValueError):
+            raster_predict.predict_raster(self.boundary, self.arrays, self.model_path,
+                                          self.dem_path, self.output, block_size=40)
+        with self.assertRaises(ValueError):
+            raster_predict.predict_raster(self.boundary, "buildings.parquet",
+                                          self.model_path, self.dem_path, self.output)
+
+
+    def brute_force_features(self, longitudes, latitudes, terrain=True):
+        """
+        Features of the hexagons of pixels built one by one
+        """
+        hexagons = create_hexagons(longitudes, latitudes, 160)
+        features = hexagon_stats_batch(self.buildings, hexagons)
+        if terrain:
+            features = features.join(terrain_stats(hexagons, self.dem_path))
+        return features
+
+
+    def test_lattice_features(self):
+        """
+        Every pixel of a block has the statistics of its own hexagon, for odd and even steps
+        """
+        model_path = save_model(self.tmpdir.name, model.get_keys(terrain=True), "terrain.bin")
+        for step in [1, 2, 3]:
+            crs, transform, width, height = raster_predict.raster_grid(self.dem_path,
+                                                                       self.boundary, step)
+            raster_predict._init_worker(  # pylint: disable=protected-access
+                shapely.to_wkb(self.boundary), crs, transform, self.arrays, model_path,
+                self.dem_path, 160, step)
+            window = raster_predict.block_windows(width, height, 64)[0]
+            rows, cols = np.meshgrid(np.arange(window.height), np.arange(window.width),
+                                     indexing='ij')
+            lons = transform.c + (cols.ravel() + 0.5) * transform.a
+            lats = transform.f + (rows.ravel() + 0.5) * transform.e
+            inside = np.ones(window.height * window.width, dtype=bool)
+            features = raster_predict._block_features(  # pylint: disable=protected-access
+                lons, lats, rows.ravel(), cols.ravel(), window,
+                inside.reshape(rows.shape))
+            raster_predict._WORKER.clear()  # pylint: disable=protected-access
+
+            sample = np.random.default_rng(step).choice(len(lons), 60, replace=False)
+            expected = self.brute_force_features(lons[sample], lats[sample])
+            self.assertTrue(expected['centroid_stat_mean'].notna().any())
+            pd.testing.assert_frame_equal(features.iloc[sample].reset_index(drop=True),
+                                          expected[features.columns], rtol=1e-6)
+
+
+    def test_projected_dem(self):
+        """
+        On a projected DEM, pixels get the statistics of their hexagon from layers
+        """
+        dem_path = os.path.join(self.tmpdir.name, "utm.tif")
+        left, _, _, top = transform_bounds("EPSG:4326", "EPSG:32610", -122.36, 47.59,
+                                           -122.32, 47.62)
+        with rasterio.open(dem_path, "w", driver="GTiff", height=300, width=300, count=1,
+                           dtype="float32", crs="EPSG:32610",
+                           transform=from_origin(left, top, 10, 10)) as dst:
+            dst.write(np.random.default_rng(3).uniform(0, 100, (300, 300)).astype(
+                np.float32), 1)
+        model_path = save_model(self.tmpdir.name, model.get_keys(terrain=True), "terrain.bin")
+        boundary = shapely.box(-122.345, 47.602, -122.341, 47.605)
+        raster_predict.predict_raster(boundary, self.arrays, model_path, dem_path,
+                                      self.output, step=3, block_size=16, max_workers=1)
+        with rasterio.open(self.output) as src:
+            band = src.read(1)
+            transform = src.transform
+        rows, cols = np.nonzero(np.isfinite(band))
+        x = transform.c + (cols[:10] + 0.5) * transform.a
+        y = transform.f + (rows[:10] + 0.5) * transform.e
+        lons, lats = raster_predict.get_transformer("EPSG:32610", 4326).transform(x, y)
+        hexagons = create_hexagons(lons, lats, 160)
+        features = hexagon_stats_batch(self.buildings, hexagons).join(
+            terrain_stats(hexagons, dem_path))
+        features['Lat'] = lats
+        features['Lon'] = lons
+        knn, scale = model.load_model(model_path)
+        expected = model.predict(knn, scale, features[model.get_keys(terrain=True)])
+        np.testing.assert_allclose(band[rows[:10], cols[:10]], expected, rtol=1e-5)
+
+        # Pixels of a layer are at least a hexagon apart
+        rows, cols = np.meshgrid(np.arange(256), np.arange(256), indexing='ij')
+        layers = raster_predict._lattice_layers(  # pylint: disable=protected-access
+            rows.ravel(), cols.ravel(), 34)
+        self.assertEqual(len(layers), 34 * 34)
+        self.assertEqual(sum(len(layer) for layer in layers), 256 * 256)
+
+
+    def test_full_block(self):
+        """
+        A 256 x 256 block of overlapping hexagons with terrain is not slowed by its overlaps
+        """
+        model_path = save_model(self.tmpdir.name, model.get_keys(terrain=True), "terrain.bin")
+        boundary = shapely.box(-122.3595, 47.595, -122.3355, 47.6195)
+        start = time.perf_counter()
+        raster_predict.predict_raster(boundary, self.arrays, model_path, self.dem_path,
+                                      self.output, block_size=256, max_workers=1)
+        self.assertLess(time.perf_counter() - start, 60)
+        with rasterio.open(self.output) as src:
+            self.assertGreaterEqual(min(src.width, src.height), 256)
+            self.assertTrue(np.isfinite(src.read(1, window=((0, 256), (0, 256)))).any())
+        offsets, _ = raster_predict.hexagon_offsets(160, self.dem_transform)
+        self.assertGreater(len(offsets), 500)
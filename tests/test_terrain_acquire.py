@@ -0,0 +1,178 @@
+"""
+test_terrain_acquire.py: Tests for terrain_acquire.py
+
+Tests included in this module:
+- test_download_terrain(): The tile is streamed to disk in chunks.
+- test_download_error(): A failed download leaves no file behind.
+- test_clip_local(): Only the window of the area of interest is written.
+- test_clip_range_requests(): The window is read from a url without downloading the tile.
+- test_terrain_acquire(): The complete and the trimmed terrain are written.
+
+The tiles are served by a local stand-in HTTP server with range requests.
+
+Set up:
+python -m unittest discover
+"""
+
+import os
+import re
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import numpy as np
+import geopandas as gpd
+import rasterio
+import requests
+import shapely
+from rasterio.transform import from_origin
+
+from heat_island import terrain_acquire
+
+
+class RangeHandler(SimpleHTTPRequestHandler):
+    """
+    Static file handler that answers range requests and counts the bytes
+    it sends.
+    """
+
+    bytes_sent = 0
+
+    def do_GET(self):
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        path = self.translate_path(self.path)
+        if match is None or not os.path.isfile(path):
+            size = os.path.getsize(path) if os.path.isfile(path) else 0
+            RangeHandler.bytes_sent += size
+            super().do_GET()
+            return
+        size = os.path.getsize(path)
+        start = int(match.group(1))
+        end = min(int(match.group(2) or size - 1), size - 1)
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start + 1)
+        self.send_response(206)
+        self.send_header("Content-Type", "image/tiff")
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        self.wfile.write(data)
+        RangeHandler.bytes_sent += len(data)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class TestTerrainAcquire(unittest.TestCase):
+    """
+    This class verifies the streaming download and the windowed clipping
+    of terrain tiles.
+    """
+
+    def setUp(self):
+        self.serve_dir = tempfile.TemporaryDirectory()
+        self.out_dir = tempfile.TemporaryDirectory()
+        # A tiled 1/3 arc-second tile of 2048 x 2048 pixels over Seattle
+        self.resolution = 1 / 10800
+        self.transform = from_origin(-122.5, 47.8, self.resolution, self.resolution)
+        self.dem = np.arange(2048 * 2048, dtype=np.float32).reshape(2048, 2048)
+        self.tile = os.path.join(self.serve_dir.name, "dem.tif")
+        with rasterio.open(self.tile, "w", driver="GTiff", height=2048, width=2048,
+                           count=1, dtype="float32", crs="EPSG:4269",
+                           transform=self.transform, tiled=True, blockxsize=256,
+                           blockysize=256) as dst:
+            dst.write(self.dem, 1)
+        RangeHandler.bytes_sent = 0
+        handler = partial(RangeHandler, directory=self.serve_dir.name)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/dem.tif"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        # A small area of interest inside the tile
+        self.bounds = (-122.45, 47.70, -122.43, 47.71)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.serve_dir.cleanup()
+        self.out_dir.cleanup()
+
+    def check_clip(self, path):
+        """
+        The clipped raster covers the area of interest with the values of the tile
+        """
+        with rasterio.open(path) as src:
+            band = src.read(1)
+            minx, miny, maxx, maxy = src.bounds
+            row, col = rasterio.transform.rowcol(self.transform, minx + 1e-9, maxy - 1e-9)
+            self.assertLessEqual(minx, self.bounds[0] + 1e-9)
+            self.assertGreaterEqual(maxx, self.bounds[2] - 1e-9)
+            self.assertLessEqual(miny, self.bounds[1] + 1e-9)
+            self.assertGreaterEqual(maxy, self.bounds[3] - 1e-9)
+            self.assertLess(src.width, 2048 / 5)
+        np.testing.assert_array_equal(
+            band, self.dem[row:row + band.shape[0], col:col + band.shape[1]])
+
+
+    def test_download_terrain(self):
+        """
+        The downloaded tile is identical to the served one
+        """
+        path = os.path.join(self.out_dir.name, "complete.tif")
+        self.assertEqual(terrain_acquire.download_terrain(self.url, path, chunk_size=65536),
+                         path)
+        with open(path, "rb") as f, open(self.tile, "rb") as g:
+            self.assertEqual(f.read(), g.read())
+
+
+    def test_download_error(self):
+        """
+        A missing tile raises an HTTPError and leaves no file behind
+        """
+        path = os.path.join(self.out_dir.name, "complete.tif")
+        with self.assertRaises(requests.HTTPError):
+            terrain_acquire.download_terrain(self.url + ".missing", path)
+        self.assertEqual(os.listdir(self.out_dir.name), [])
+
+
+    def test_clip_local(self):
+        """
+        The trimmed terrain only has the window of the area of interest
+        """
+        path = os.path.join(self.out_dir.name, "trimmed.tif")
+        terrain_acquire.clip_terrain(self.tile, self.bounds, path)
+        self.check_clip(path)
+
+
+    def test_clip_range_requests(self):
+        """
+        Reading the window from the url only transfers a part of the tile
+        """
+        path = os.path.join(self.out_dir.name, "trimmed.tif")
+        terrain_acquire.clip_terrain(self.url, self.bounds, path)
+        self.check_clip(path)
+        self.assertLess(RangeHandler.bytes_sent, os.path.getsize(self.tile) / 4)
+
+
+    def test_terrain_acquire(self):
+        """
+        The boundary is buffered, and both terrains are written to the data directory
+        """
+        boundary = gpd.GeoDataFrame(geometry=[shapely.box(-122.44, 47.70, -122.43, 47.705)],
+                                    crs=4326)
+        boundary.to_file(os.path.join(self.out_dir.name, "boundary.geojson"))
+        with mock.patch.object(terrain_acquire.data_process, 'input_file_from_data_dir',
+                               side_effect=lambda name: os.path.join(self.out_dir.name, name)):
+            terrain_acquire.terrain_acquire("boundary.geojson", "complete.tif",
+                                            "trimmed.tif", url=self.url)
+            terrain_acquire.terrain_acquire("boundary.geojson", None,
+                                            "trimmed_remote.tif", url=self.url)
+        self.assertTrue(os.path.exists(os.path.join(self.out_dir.name, "complete.tif")))
+        with rasterio.open(os.path.join(self.out_dir.name, "trimmed.tif")) as local, \
+                rasterio.open(os.path.join(self.out_dir.name, "trimmed_remote.tif")) as remote:
+            np.testing.assert_array_equal(local.read(), remote.read())
+            self.assertAlmostEqual(local.bounds.left, -122.448, places=3)
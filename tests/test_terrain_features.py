@@ -0,0 +1,162 @@
+"""
+test_terrain_features.py: Tests for terrain_features.py
+
+Tests included in this module:
+- test_matches_masks(): The statistics match the pixels of each hexagon masked one at a time.
+- test_overlapping_hexagons(): Overlapping hexagons keep all of their pixels.
+- test_slope(): The slope of an inclined plane is recovered in degrees.
+- test_outside(): Hexagons outside the DEM and nodata pixels give NaN statistics.
+- test_training_features(): The statistics plug into the training set and the model keys.
+
+Set up:
+python -m unittest discover
+"""
+
+import os
+import math
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import rasterio
+import rasterio.features
+import shapely
+from rasterio.transform import from_origin
+
+from heat_island import terrain_features
+from heat_island import training_set
+from heat_island import model
+from heat_island.geo_process import create_hexagons
+from heat_island.building_store import write_building_store
+
+
+def write_dem(path, elevation, nodata=-9999.0):
+    """
+    Write a 1/3 arc-second DEM in EPSG:4269 with its origin at (-122.5, 47.8)
+    """
+    transform = from_origin(-122.5, 47.8, 1 / 10800, 1 / 10800)
+    with rasterio.open(path, "w", driver="GTiff", height=elevation.shape[0],
+                       width=elevation.shape[1], count=1, dtype="float32",
+                       crs="EPSG:4269", transform=transform, nodata=nodata) as dst:
+        dst.write(elevation.astype(np.float32), 1)
+    return transform
+
+
+class TestTerrainFeatures(unittest.TestCase):
+    """
+    This class verifies the zonal elevation statistics of hexagons.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dem_path = os.path.join(self.tmpdir.name, "dem.tif")
+        rng = np.random.default_rng(0)
+        self.elevation = rng.uniform(0, 100, (1200, 1200))
+        self.transform = write_dem(self.dem_path, self.elevation)
+        self.lons = -122.49 + rng.uniform(0, 0.09, 30)
+        self.lats = 47.71 + rng.uniform(0, 0.08, 30)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def masked_pixels(self, hexagon):
+        """
+        Elevations of the pixels whose center is inside one hexagon
+        """
+        band = self.elevation.astype(np.float32).astype(float)
+        mask = rasterio.features.geometry_mask([hexagon], band.shape, self.transform,
+                                               invert=True)
+        return band[mask]
+
+
+    def test_matches_masks(self):
+        """
+        Every row equals the statistics of the pixels of its hexagon
+        """
+        hexagons = create_hexagons(pd.Series(self.lons, index=range(10, 40)), self.lats, 160)
+        stats = terrain_features.terrain_stats(hexagons, self.dem_path)
+        self.assertEqual(list(stats.index), list(range(10, 40)))
+        self.assertEqual(list(stats.columns), terrain_features.TERRAIN_COLUMNS)
+        for key, hexagon in hexagons.items():
+            pixels = self.masked_pixels(hexagon)
+            np.testing.assert_allclose(
+                stats.loc[key, ['terrain_mean', 'terrain_min', 'terrain_max', 'terrain_std']],
+                [pixels.mean(), pixels.min(), pixels.max(), pixels.std()], rtol=1e-9)
+
+
+    def test_overlapping_hexagons(self):
+        """
+        Overlapping and duplicated hexagons get the statistics they have alone
+        """
+        lons = [-122.45, -122.4495, -122.45, -122.46]
+        lats = [47.75, 47.7502, 47.75, 47.75]
+        stats = terrain_features.terrain_stats(create_hexagons(lons, lats, 160),
+                                               self.dem_path)
+        for i, (lon, lat) in enumerate(zip(lons, lats)):
+            alone = terrain_features.terrain_stats(create_hexagons([lon], [lat], 160),
+                                                   self.dem_path)
+            np.testing.assert_allclose(stats.iloc[i], alone.iloc[0])
+        self.assertEqual(len(terrain_features._overlap_layers(
+            create_hexagons(lons, lats, 160).values.to_numpy())), 3)
+
+
+    def test_slope(self):
+        """
+        A plane rising 1 m per 10 m eastward has a slope of atan(0.1)
+        """
+        rows = np.arange(1200)
+        latitudes = 47.8 - (rows + 0.5) / 10800
+        pixel_width = (terrain_features.METERS_PER_DEGREE / 10800
+                       * np.cos(np.radians(latitudes)))
+        plane = 0.1 * np.arange(1200)[None, :] * pixel_width[:, None]
+        write_dem(self.dem_path, plane)
+        stats = terrain_features.terrain_stats(create_hexagons(self.lons, self.lats, 160),
+                                               self.dem_path)
+        np.testing.assert_allclose(stats['terrain_slope'], math.degrees(math.atan(0.1)),
+                                   rtol=1e-4)
+
+
+    def test_outside(self):
+        """
+        Hexagons without valid pixels have NaN statistics
+        """
+        elevation = self.elevation.copy()
+        elevation[300:700, 300:700] = -9999.0
+        write_dem(self.dem_path, elevation)
+        # Inside the nodata block, outside the DEM, and a valid hexagon
+        lons = [-122.5 + 500 / 10800, -121.0, -122.49]
+        lats = [47.8 - 500 / 10800, 47.0, 47.79]
+        stats = terrain_features.terrain_stats(create_hexagons(lons, lats, 160),
+                                               self.dem_path)
+        self.assertTrue(stats.iloc[:2].isna().all().all())
+        self.assertFalse(stats.iloc[2].isna().any())
+        outside = terrain_features.terrain_stats(create_hexagons([-121.0], [47.0], 160),
+                                                 self.dem_path)
+        self.assertTrue(outside.isna().all().all())
+
+
+    def test_training_features(self):
+        """
+        The training set has every terrain feature of get_keys(terrain=True)
+        """
+        keys = model.get_keys(terrain=True)
+        self.assertEqual(keys[-2:], ['Lat', 'Lon'])
+        self.assertEqual(keys[:9], model.get_keys()[:9])
+        self.assertEqual(keys[9:-2], terrain_features.TERRAIN_COLUMNS)
+
+        store = os.path.join(self.tmpdir.name, "buildings.parquet")
+        x = self.lons.repeat(20) + np.tile(np.linspace(-0.001, 0.001, 20), 30)
+        y = self.lats.repeat(20)
+        write_building_store(gpd.GeoDataFrame(
+            {'height': np.full(600, 10.0)},
+            geometry=shapely.box(x, y, x + 0.00005, y + 0.00005), crs=4326), store)
+        weather_csv = os.path.join(self.tmpdir.name, "weather.csv")
+        pd.DataFrame({'Station ID': [f"S{i}" for i in range(30)], 'Lat': self.lats,
+                      'Lon': self.lons, 'Ave temp annual_F': 50.0}).to_csv(weather_csv,
+                                                                          index=False)
+        training = training_set.build_training_set(weather_csv, store,
+                                                   terrain_path=self.dem_path)
+        self.assertFalse(training[keys].isna().any().any())
+        expected = terrain_features.terrain_stats(training.geometry, self.dem_path)
+        np.testing.assert_allclose(training['terrain_mean'], expected['terrain_mean'])
@@ -0,0 +1,161 @@
+"""
+test_tile_cache.py: Tests for tile_cache.py
+
+Tests included in this module:
+- test_fetch_downloads_once(): A repeated fetch is served from disk.
+- test_fetch_offline(): Cached tiles are served after the server is gone.
+- test_new_release_new_entry(): A new tile url is stored as a new entry.
+- test_discard(): A discarded tile is downloaded again.
+- test_evict_least_recently_used(): The cache is trimmed to its size bound.
+- test_no_partial_entry(): A failed download leaves no entry behind.
+
+The tiles are served by a local stand-in HTTP server.
+
+Set up:
+python -m unittest discover
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+import urllib.error
+from functools import partial
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+
+from heat_island.tile_cache import TileCache
+
+
+class CountingHandler(SimpleHTTPRequestHandler):
+    """
+    Static file handler that counts the requests it serves.
+    """
+
+    requests = []
+
+    def do_GET(self):
+        CountingHandler.requests.append(self.path)
+        super().do_GET()
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class TestTileCache(unittest.TestCase):
+    """
+    This class verifies that the tile cache downloads each tile once,
+    serves it from disk afterwards and stays within its size bound.
+    """
+
+    def setUp(self):
+        self.serve_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        for name in ("a.csv.gz", "b.csv.gz", "c.csv.gz"):
+            with open(os.path.join(self.serve_dir.name, name), "wb") as f:
+                f.write(b"x" * 100)
+        CountingHandler.requests = []
+        handler = partial(CountingHandler, directory=self.serve_dir.name)
+        self.server = HTTPServer(("127.0.0.1", 0), handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop_server(self):
+        """
+        Stop the stand-in server, if it is still running
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def tearDown(self):
+        self.stop_server()
+        self.serve_dir.cleanup()
+        self.cache_dir.cleanup()
+
+
+    def test_fetch_downloads_once(self):
+        """
+        The first fetch downloads the tile, the second one is served from disk
+        """
+        cache = TileCache(self.cache_dir.name)
+        first = cache.fetch(123, self.base_url + "a.csv.gz")
+        second = cache.fetch(123, self.base_url + "a.csv.gz")
+        self.assertEqual(first, second)
+        self.assertTrue(first.endswith(".gz"))
+        self.assertEqual(len(CountingHandler.requests), 1)
+        with open(first, "rb") as f:
+            self.assertEqual(f.read(), b"x" * 100)
+
+
+    def test_fetch_offline(self):
+        """
+        A cached tile is returned even when the server is unreachable
+        """
+        cache = TileCache(self.cache_dir.name)
+        url = self.base_url + "a.csv.gz"
+        path = cache.fetch(123, url)
+        self.stop_server()
+        self.assertEqual(cache.fetch(123, url), path)
+
+
+    def test_new_release_new_entry(self):
+        """
+        The same quad key with a different url is a separate cache entry
+        """
+        cache = TileCache(self.cache_dir.name)
+        old = cache.fetch(123, self.base_url + "a.csv.gz")
+        new = cache.fetch(123, self.base_url + "b.csv.gz")
+        self.assertNotEqual(old, new)
+        self.assertEqual(len(cache.entries()), 2)
+
+
+    def test_discard(self):
+        """
+        A discarded tile is downloaded again on the next fetch
+        """
+        cache = TileCache(self.cache_dir.name)
+        url = self.base_url + "a.csv.gz"
+        cache.fetch(123, url)
+        cache.discard(123, url)
+        self.assertIsNone(cache.get(123, url))
+        cache.discard(123, url)
+        cache.fetch(123, url)
+        self.assertEqual(len(CountingHandler.requests), 2)
+
+
+    def test_evict_least_recently_used(self):
+        """
+        The least recently used tile is evicted once the cache is full
+        """
+        cache = TileCache(self.cache_dir.name, max_bytes=250)
+        path_a = cache.fetch(1, self.base_url + "a.csv.gz")
+        path_b = cache.fetch(2, self.base_url + "b.csv.gz")
+        os.utime(path_a, (1, 1))
+        os.utime(path_b, (2, 2))
+        # Reading 'a' makes 'b' the least recently used entry
+        cache.get(1, self.base_url + "a.csv.gz")
+        path_c = cache.fetch(3, self.base_url + "c.csv.gz")
+        self.assertTrue(os.path.exists(path_a))
+        self.assertFalse(os.path.exists(path_b))
+        self.assertTrue(os.path.exists(path_c))
+        self.assertLessEqual(cache.size(), 250)
+
+
+    def test_no_partial_entry(self):
+        """
+        A failed download does not leave an entry or a temporary file
+        """
+        cache = TileCache(self.cache_dir.name)
+        with self.assertRaises(urllib.error.HTTPError):
+            cache.fetch(9, self.base_url + "missing.csv.gz")
+        self.assertIsNone(cache.get(9, self.base_url + "missing.csv.gz"))
+        self.assertEqual(os.listdir(self.cache_dir.name), [])
+
+
+    def test_invalid_max_bytes(self):
+        """
+        A non-positive size bound raises a ValueError
+        """
+        with self.assertRaises(ValueError):
+            TileCache(self.cache_dir.name, max_bytes=0)
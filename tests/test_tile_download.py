@@ -0,0 +1,179 @@
+"""
+test_tile_download.py: Tests for tile_download.py
+
+Tests included in this module:
+- test_read_tile(): A gzip-compressed GeoJSONL tile is parsed with heights.
+- test_read_tile_bbox(): Buildings outside the bounding box are skipped.
+- test_read_plain_tile(): Uncompressed tiles and MultiPolygons are parsed.
+- test_download_concurrent(): Tiles are fetched concurrently and concatenated in order.
+- test_retry(): A transient server error is retried.
+- test_unknown_quad_key(): An unknown quad key fails before any download.
+
+The tiles are served by a local stand-in HTTP server.
+
+Set up:
+python -m unittest discover
+"""
+
+import os
+import gzip
+import json
+import time
+import tempfile
+import threading
+import unittest
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import geopandas as gpd
+
+from heat_island.tile_cache import TileCache
+from heat_island import tile_download
+
+
+def write_tile(path, n, height):
+    """
+    Write a gzip-compressed GeoJSONL tile with `n` square buildings
+    """
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for i in range(n):
+            x, y = -122.3 + i * 0.001, 47.6
+            feature = {
+                "type": "Feature",
+                "properties": {"height": height, "confidence": -1},
+                "geometry": {"type": "Polygon", "coordinates": [[
+                    [x, y], [x + 0.0001, y], [x + 0.0001, y + 0.0001],
+                    [x, y + 0.0001], [x, y]]]}
+            }
+            f.write(json.dumps(feature) + "\n")
+
+
+class SlowHandler(SimpleHTTPRequestHandler):
+    """
+    Static file handler that waits before answering, and can fail the
+    first request of a file with a server error.
+    """
+
+    delay = 0.0
+    fail_once = set()
+
+    def do_GET(self):
+        time.sleep(SlowHandler.delay)
+        name = self.path.lstrip("/")
+        if name in SlowHandler.fail_once:
+            SlowHandler.fail_once.discard(name)
+            self.send_error(503)
+            return
+        super().do_GET()
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class TestTileDownload(unittest.TestCase):
+    """
+    This class verifies the concurrent download and parsing of tiles.
+    """
+
+    def setUp(self):
+        self.serve_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.links = {}
+        SlowHandler.delay = 0.0
+        SlowHandler.fail_once = set()
+        handler = partial(SlowHandler, directory=self.serve_dir.name)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        base_url = f"http://127.0.0.1:{self.server.server_port}/"
+        for quad_key in range(4):
+            name = f"tile{quad_key}.csv.gz"
+            write_tile(os.path.join(self.serve_dir.name, name), quad_key + 1,
+                       float(quad_key))
+            self.links[quad_key] = [base_url + name]
+        self.cache = TileCache(self.cache_dir.name)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.serve_dir.cleanup()
+        self.cache_dir.cleanup()
+
+
+    def test_read_tile(self):
+        """
+        The tile is parsed into a GeoDataFrame with a 'height' column
+        """
+        gdf = tile_download.read_tile(os.path.join(self.serve_dir.name, "tile2.csv.gz"))
+        self.assertIsInstance(gdf, gpd.GeoDataFrame)
+        self.assertEqual(len(gdf), 3)
+        self.assertNotIn('properties', gdf.columns)
+        self.assertEqual(list(gdf['height']), [2.0, 2.0, 2.0])
+
+
+    def test_read_tile_bbox(self):
+        """
+        Buildings outside the bounding box are skipped while streaming
+        """
+        path = os.path.join(self.serve_dir.name, "tile3.csv.gz")
+        # Only the second and third buildings overlap the box
+        gdf = tile_download.read_tile(path, bbox=(-122.2995, 47.59, -122.2975, 47.61))
+        self.assertEqual(len(gdf), 2)
+        self.assertAlmostEqual(gdf.total_bounds[0], -122.299)
+        empty = tile_download.read_tile(path, bbox=(0, 0, 1, 1))
+        self.assertEqual(len(empty), 0)
+        self.assertIn('height', empty.columns)
+
+
+    def test_read_plain_tile(self):
+        """
+        Uncompressed tiles, MultiPolygons and missing heights are supported
+        """
+        lines = [
+            {"type": "Feature", "properties": {"height": None},
+             "geometry": {"type": "Polygon",
+                          "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 0]]]}},
+            {"type": "Feature", "properties": {"height": 7.5},
+             "geometry": {"type": "MultiPolygon",
+                          "coordinates": [[[[5, 5], [6, 5], [6, 6], [5, 5]]],
+                                          [[[0, 0], [1, 0], [1, 1], [0, 0]]]]}},
+        ]
+        path = os.path.join(self.serve_dir.name, "plain.geojsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(json.dumps(line) for line in lines) + "\n")
+        gdf = tile_download.read_tile(path, bbox=(4, 4, 7, 7))
+        self.assertEqual(list(gdf['height']), [7.5])
+        gdf = tile_download.read_tile(path)
+        self.assertTrue(gdf['height'].isna().iloc[0])
+
+
+    def test_download_concurrent(self):
+        """
+        Four slow tiles on four workers take about the time of one tile
+        """
+        SlowHandler.delay = 0.5
+        start = time.perf_counter()
+        gdf = tile_download.download_tiles([3, 0, 1, 2], self.links, self.cache,
+                                           max_workers=4)
+        elapsed = time.perf_counter() - start
+        self.assertLess(elapsed, 1.5)
+        self.assertEqual(len(gdf), 10)
+        # Tiles are concatenated in the order of the quad keys
+        self.assertEqual(list(gdf['height']), [3.0] * 4 + [0.0] + [1.0] * 2 + [2.0] * 3)
+
+
+    def test_retry(self):
+        """
+        A tile answered with a 503 is fetched again after a backoff
+        """
+        SlowHandler.fail_once = {"tile1.csv.gz"}
+        gdf = tile_download.download_tiles([1], self.links, self.cache, backoff=0.01)
+        self.assertEqual(len(gdf), 2)
+
+
+    def test_unknown_quad_key(self):
+        """
+        A quad key missing from the links raises a ValueError
+        """
+        with self.assertRaises(ValueError):
+            tile_download.download_tiles([0, 99], self.links, self.cache)
+        self.assertEqual(self.cache.entries(), [])
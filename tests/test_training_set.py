@@ -0,0 +1,128 @@
+"""
+test_training_set.py: Tests for training_set.py
+
+Tests included in this module:
+- test_build_training_set(): Stations are cleaned and get the statistics of their hexagon.
+- test_matches_example(): Station hexagons match the ones of the existing training data.
+- test_readable_by_model(): The written GeoJSON and GeoParquet are read by model.clean_data.
+- test_multi_radius(): Wide columns of other radii match single-radius statistics.
+- test_invalid_output(): Writing to an unknown format raises a ValueError.
+
+Set up:
+python -m unittest discover
+"""
+
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from heat_island import training_set
+from heat_island import model
+from heat_island.building_store import write_building_store, read_building_store
+from heat_island.building_memmap import write_building_arrays
+from heat_island.height_acquire import average_building_height_with_centroid
+from heat_island.geo_process import create_hexagon
+from tests.helpers import make_buildings
+
+
+class TestTrainingSet(unittest.TestCase):
+    """
+    This class verifies the training set builder.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = os.path.join(self.tmpdir.name, "buildings.parquet")
+        write_building_store(make_buildings(), self.store)
+        self.buildings = read_building_store(self.store)
+        rng = np.random.default_rng(1)
+        n = 12
+        weather = pd.DataFrame({
+            'Station ID': [f"S{i}" for i in range(n)],
+            'Station Name': [f"Station {i}" for i in range(n)],
+            'Lat': 47.601 + rng.uniform(0, 0.008, n),
+            'Lon': -122.349 + rng.uniform(0, 0.018, n),
+            'Ave temp annual_F': rng.uniform(48, 56, n),
+            'Note': None})
+        # A station without temperature and a duplicated station
+        weather.loc[3, 'Ave temp annual_F'] = np.nan
+        weather = pd.concat([weather, weather.iloc[[0]]], ignore_index=True)
+        self.weather_csv = os.path.join(self.tmpdir.name, "weather.csv")
+        weather.to_csv(self.weather_csv, index=False)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+
+    def test_build_training_set(self):
+        """
+        Every kept station has the statistics of its own hexagon
+        """
+        training = training_set.build_training_set(self.weather_csv, self.store)
+        self.assertEqual(len(training), 11)
+        self.assertNotIn('Note', training.columns)
+        self.assertNotIn('S3', list(training['Station ID']))
+        for _, station in training.iterrows():
+            hexagon = create_hexagon(station['Lon'], station['Lat'], 160)
+            self.assertTrue(shapely.equals_exact(station.geometry, hexagon, 1e-12))
+            expected = average_building_height_with_centroid(self.buildings, hexagon)
+            np.testing.assert_allclose([station[key] for key in expected],
+                                       list(expected.values()), rtol=1e-6)
+
+
+    def test_matches_example(self):
+        """
+        The hexagons have the radius of the existing training data
+        """
+        example = gpd.read_file("data/example_aggr_hexagon (2).geojson")
+        training = training_set.build_training_set("data/seattle_weather.csv", self.store)
+        merged = training.merge(example[['Station ID', 'geometry']], on='Station ID')
+        self.assertGreater(len(merged), 100)
+        self.assertTrue(all(shapely.equals_exact(a, b, 1e-9)
+                            for a, b in zip(merged['geometry_x'], merged['geometry_y'])))
+
+
+    def test_readable_by_model(self):
+        """
+        Both written formats have every feature and the target of the model
+        """
+        for name in ["training.geojson", "training.parquet"]:
+            path = os.path.join(self.tmpdir.name, name)
+            training_set.build_training_set(self.weather_csv, self.store, output_path=path)
+            features, target = model.clean_data(path, model.get_keys(), 'Ave temp annual_F')
+            self.assertEqual(len(features), 11)
+            self.assertEqual(len(target), 11)
+        with self.assertRaises(ValueError):
+            model.clean_data(os.path.join(self.tmpdir.name, "training.csv"),
+                             model.get_keys(), 'Ave temp annual_F')
+
+
+    def test_multi_radius(self):
+        """
+        Each radius adds the columns of a training set built with that radius
+        """
+        training = training_set.build_training_set(self.weather_csv, self.store,
+                                                   radii=[80, 320])
+        arrays = write_building_arrays(self.store, os.path.join(self.tmpdir.name, "arrays"))
+        from_arrays = training_set.build_training_set(self.weather_csv, arrays,
+                                                      radii=[80, 320])
+        for radius in [80, 320]:
+            expected = training_set.build_training_set(self.weather_csv, self.store,
+                                                       radius=radius)
+            for key in model.get_keys()[:-2]:
+                column = f"{key}_{radius}m"
+                np.testing.assert_allclose(training[column], expected[key], rtol=1e-9)
+                np.testing.assert_allclose(from_arrays[column], expected[key], rtol=1e-9)
+
+
+    def test_invalid_output(self):
+        """
+        The dataset can only be written to GeoJSON or GeoParquet
+        """
+        with self.assertRaises(ValueError):
+            training_set.build_training_set(self.weather_csv, self.store,
+                                            output_path="training.csv")